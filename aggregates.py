@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+# Group that the groups beyond a top-N are summed into
+OTHER_GROUP = 'Other'
+
+
+# Format app rates as percentage strings in bulk, '0%' wherever nothing was submitted
+def format_app_rate(apps_submitted, total):
+    apps_submitted = np.asarray(apps_submitted, dtype=float)
+    total = np.asarray(total, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.round((apps_submitted * 100) / total, 2)
+
+    labels = pd.Series(rates).astype(str) + '%'
+    labels[apps_submitted == 0] = '0%'
+
+    return labels.to_numpy()
+
+# Add an app_rate column to a (group, lead_status) count table: the share of each
+# group's count with lead_status 'Application Submitted', via one transform per sum
+def add_app_rate(counts, group_by, count_col):
+    submitted = counts[count_col].where(counts['lead_status'] == 'Application Submitted', 0)
+    total = counts.groupby(group_by, observed=True)[count_col].transform('sum')
+    apps_submitted = submitted.groupby(counts[group_by], observed=True).transform('sum')
+
+    return counts.assign(app_rate=format_app_rate(apps_submitted, total))
+
+# Dials per (group, lead_status) with the group's app rate and total dials, so the
+# cutoff sliders can re-threshold the table without going back to the raw rows
+def dial_counts(dff, group_by):
+    counts = dff.groupby(by=[group_by, 'lead_status'], observed=True).size().reset_index(name='Dials')
+
+    return add_group_dials(counts, group_by)
+
+# App rate and total dials per group for a (group, lead_status) 'Dials' table
+def add_group_dials(counts, group_by):
+    counts = add_app_rate(counts, group_by, 'Dials')
+
+    return counts.assign(group_dials=counts.groupby(group_by, observed=True)['Dials'].transform('sum'))
+
+# Drop groups with no more than `cutoff` dials in total
+def apply_cutoff(counts, cutoff):
+    return counts[counts['group_dials'].to_numpy() > cutoff]
+
+# Counts per (effective_month, lead_status) with a row for every month of the ordered
+# month categorical, crossed with the lead statuses present in dff
+def month_status_counts(dff, count_col):
+    counts = dff.groupby(by=['effective_month', 'lead_status'], observed=True).size()
+
+    return month_status_grid(counts.reset_index(name=count_col), count_col)
+
+# Expand observed (effective_month, lead_status) counts to every month x observed status
+def month_status_grid(counts, count_col):
+    statuses = counts['lead_status'].cat.remove_unused_categories().cat.categories
+    months = counts['effective_month'].cat.categories
+
+    index = pd.MultiIndex.from_product([pd.CategoricalIndex(months, categories=months, ordered=True),
+                                        statuses], names=['effective_month', 'lead_status'])
+    counts = counts.set_index(['effective_month', 'lead_status'])[count_col]
+
+    return counts.reindex(index, fill_value=0).reset_index(name=count_col)
+
+# Keep the top_n groups by total dials and sum the rest into one OTHER_GROUP group per
+# lead_status, with its own app rate and total. A falsy top_n keeps every group.
+def top_groups_with_other(counts, group_by, top_n):
+    groups = counts.drop_duplicates(group_by)
+    if not top_n or len(groups) <= top_n:
+        return counts
+
+    top = groups.nlargest(top_n, 'group_dials', keep='first')[group_by]
+    is_top = counts[group_by].isin(top).to_numpy()
+
+    other = counts[~is_top].groupby('lead_status', observed=True)['Dials'].sum().reset_index()
+    other.insert(0, group_by, OTHER_GROUP)
+    kept = counts.loc[is_top, [group_by, 'lead_status', 'Dials']].astype({group_by: object})
+
+    return add_group_dials(pd.concat([kept, other], ignore_index=True), group_by)
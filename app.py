@@ -3,678 +3,684 @@ import dash_core_components as dcc
 import dash_html_components as html
 import dash_table
 from dash.dependencies import Input, Output
-from datetime import datetime
-from datetime import timedelta
+from dash.dependencies import State
+from dash.dependencies import ClientsideFunction
+from dash.exceptions import PreventUpdate
 from datetime import date
-from dateutil.relativedelta import relativedelta
-from xlrd import open_workbook
-import plotly.express as px
+import flask
+import os
+import threading
+import uuid
 
-import numpy as np
 import pandas as pd
-import json
 
-# use data from date data was pulled - 1 year
-earliest_data_date = datetime(2021, 3, 17) - relativedelta(years=1)
-
-months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
-            "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-
-def customLegend(fig, nameSwap):
-    for i, dat in enumerate(fig.data):
-        for elem in dat:
-            if elem == 'name':
-                fig.data[i].name = nameSwap[fig.data[i].name]
-    return(fig)
-
-def app_rate_to_group(x, sum_type):
-    total_dials = x[sum_type].sum()
-    apps_submitted = x[x['lead_status'] == 'Application Submitted'][sum_type].sum()
-
-    if(apps_submitted != 0):
-        x.loc[:,'app_rate'] = str(round((apps_submitted * 100) / total_dials, 2)) + '%'
-    else:
-        x.loc[:,'app_rate'] = str(0) + '%'
-
-    return x
+from datastore import EngagementStore
+from executor import QueryCancelled
+from executor import aggregation_pool
+from executor import run_metric
+from export import EXPORT_FORMATS
+from export import aggregate_frame
+from export import encode
+from export import export_filename
+from export import metric_args
+from export import row_chunks
+from executor import set_request_session
+from memo import response_cache_from_env
+from query_engine import METRICS
+from query_engine import frame_cache
+from engagements import filter_key
+from views import BuildFailed
+from views import build_class_code_table
+from views import build_fig0
+from views import build_fig1
+from views import build_fig2
+from views import build_cutoff_store
+from views import build_rep_leaderboard
+from views import build_total_table
+from views import FIGURE_TOP_N
+from views import REP_LEADERBOARD_COLUMNS
+from instrumentation import configure_logging
+from instrumentation import request_finished
+from instrumentation import request_started
+from instrumentation import response_bytes
+from instrumentation import stage_seconds
+from instrumentation import startup_phase
+from instrumentation import startup_report
+from instrumentation import timed_callback
+
+configure_logging(os.environ.get('LOG_LEVEL', 'INFO'))
 
 # Pandas options
 pd.set_option('display.max_columns', None)
 pd.set_option('display.max_rows', 30)
 pd.set_option('display.min_rows', 25)
 
-df_engagements_leads = pd.read_pickle('./df_engagements_leads_processed') # Read data from file
-
-# Load SDR hash -> SDR name
-book = open_workbook('./SDR.xls', on_demand=True)
-sheet = book.sheet_by_name('Sheet1')
+# Read data from file: the original pickle, a Parquet/Arrow copy made by convert_engagements.py,
+# or a date-partitioned directory made by partitions.py (only parts in the retention window are read).
+# Rows added under ENGAGEMENTS_INCREMENTS_DIR are merged in every ENGAGEMENTS_REFRESH_SECONDS,
+# keeping a rolling ENGAGEMENTS_RETENTION_DAYS of history (from the newest activity_date).
+# The dropdown options and SDR names are kept in a sidecar file (ENGAGEMENTS_OPTIONS_CACHE,
+# next to the engagements by default) so a new worker can render the page before the data is loaded.
+engagements_path = os.environ.get('ENGAGEMENTS_PATH', './df_engagements_leads_processed')
+engagement_store = EngagementStore(engagements_path,
+                                    os.environ.get('SDR_PATH', './SDR.xls'),
+                                    increments_dir=os.environ.get('ENGAGEMENTS_INCREMENTS_DIR'),
+                                    retention_days=int(os.environ.get('ENGAGEMENTS_RETENTION_DAYS', 365)),
+                                    options_cache_path=os.environ.get('ENGAGEMENTS_OPTIONS_CACHE',
+                                                                        engagements_path.rstrip('/\\') + '.options.json'))
+refresh_seconds = int(os.environ.get('ENGAGEMENTS_REFRESH_SECONDS', 60))
+
+# Load the engagements on a background thread so the server answers at once; callbacks
+# wait up to STARTUP_WAIT_SECONDS for the first load
+background_load = os.environ.get('ENGAGEMENTS_BACKGROUND_LOAD', '1') == '1'
+startup_wait_seconds = float(os.environ.get('STARTUP_WAIT_SECONDS', 60))
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 
-# Generate dict of class codes to populate drop down menu
-def class_code_list(class_codes):
-    options_list = []
-    class_codes = np.sort(class_codes)
-
-    for code in class_codes:
-        code_dict = {}
-        code_dict['label'] = code
-        code_dict['value'] = code
-        options_list.append(code_dict)
-
-    options_list.append({'label':'ALL', 'value':'ALL'})
-
-    return options_list
-
-def sdr_list(sheet):
-    options_list = []
+# One server callback for every figure and table instead of one per output
+consolidated_callbacks = os.environ.get('CONSOLIDATED_CALLBACKS', '0') == '1'
 
-    for i in range(0, sheet.nrows):
-        sdr_dict = {}
-        row = sheet.row_values(i)
-        sdr_dict['label'] = row[1].title()
-        sdr_dict['value'] = row[0]
-        options_list.append(sdr_dict)
+# Serialised callback outputs shared by every request for the same view (see memo.py
+# for the RESPONSE_CACHE settings)
+response_cache = response_cache_from_env()
 
-    options_list.append({'label':'ALL', 'value':'ALL'})
-
-    return options_list
-
-gclasscode_options = class_code_list(df_engagements_leads['governing_class_code'].unique())
-sdr_options = sdr_list(sheet)
+# Output of a view builder for the snapshot, filter key and extra inputs, memoised
+# under the name of its callback. A superseded or timed-out aggregation leaves the
+# output unchanged; a failed build shows its empty output without caching it.
+def cached_output(name, data, key, build, *args):
+    try:
+        return response_cache.memoize(name, data.fingerprint, list(key) + list(args),
+                                        lambda: build(data, key, *args))
+    except QueryCancelled:
+        raise PreventUpdate
+    except BuildFailed as failed:
+        return failed.output
+
+# Build the outputs of the page's initial state (no filters, sliders at 0, first
+# table page) so the first page load is served from the response cache
+def warm_up_default_views():
+    data = engagement_store.snapshot
+    key = filter_key(None, None, None, None)
+
+    for name, build, args in [('fig0', build_fig0, []), ('fig1', build_fig1, []), ('fig2', build_fig2, []),
+                                ('fig3_store', build_cutoff_store, ['fig3']), ('fig4_store', build_cutoff_store, ['fig4']),
+                                ('fig5_store', build_cutoff_store, ['fig5']),
+                                ('class_code_table', build_class_code_table, [0, 10, '', []]),
+                                ('total_table', build_total_table, []),
+                                ('rep_leaderboard', build_rep_leaderboard, [])]:
+        try:
+            cached_output(name, data, key, build, *args)
+        except PreventUpdate:
+            pass
+
+# Carry the cached views and aggregates whose filters cannot see the refreshed rows
+# over to the new snapshot; the others are dropped. Every published snapshot has its
+# own fingerprint and both caches are keyed by it, so callbacks that run between the
+# swap and this call never pair the new snapshot with entries built from the old one.
+# Cached responses of the old snapshot are unreachable; an in-process response cache
+# drops them here, a shared one leaves them to expire.
+def on_data_change(change):
+    frame_cache.carry_forward(change.previous_fingerprint, change.fingerprint,
+                                lambda key: not change.affects(key))
+    response_cache.invalidate()
+    if aggregation_pool is not None:
+        aggregation_pool.fork(engagement_store.snapshot)
+    if warm_up_responses:
+        warm_up_default_views()
+
+# The loaded snapshot, once the first load is done. Until then callbacks leave their
+# outputs unchanged.
+def current_snapshot():
+    if not engagement_store.wait_loaded(startup_wait_seconds):
+        raise PreventUpdate
+    return engagement_store.snapshot
+
+warm_up_responses = os.environ.get('RESPONSE_CACHE_WARMUP', '1') == '1'
+
+# Everything that needs the data: warm the response cache, then watch the sources
+def finish_startup():
+    if warm_up_responses:
+        with startup_phase('warm_up'):
+            warm_up_default_views()
+
+    if refresh_seconds > 0:
+        engagement_store.start_watcher(refresh_seconds, on_data_change)
+
+    startup_report.finished()
+
+if background_load:
+    engagement_store.load_in_background(finish_startup, lambda error: startup_report.finished(error=repr(error)))
+else:
+    engagement_store.load()
+    finish_startup()
+
+# Readiness for load balancers during rolling deploys: 200 once the data is loaded and
+# the response cache warmed, 503 before that or if the load failed, with the startup
+# phase timings either way
+@app.server.route('/ready')
+def ready():
+    return flask.jsonify(startup_report.report()), 200 if startup_report.ready else 503
+
+# Frame cache and response cache stats; with the aggregation pool, the workers' frame
+# caches summed under 'workers'
+@app.server.route('/cache-stats')
+def cache_stats():
+    stats = dict(frame_cache.stats(), responses=response_cache.stats())
+    if aggregation_pool is not None:
+        stats['workers'] = aggregation_pool.cache_stats()
+    return flask.jsonify(stats)
+
+# Downloads stream while they are encoded; at most EXPORT_MAX_CONCURRENT run at once so
+# that exports cannot tie up every worker thread the callbacks need
+export_slots = threading.BoundedSemaphore(int(os.environ.get('EXPORT_MAX_CONCURRENT', 2)))
+
+# Streaming download of the rows behind the dashboard filters, or of one metric's
+# aggregate, as CSV or Parquet, e.g.
+#   /export?what=rows&format=parquet&start_date=2021-01-01&end_date=2022-01-01
+#   /export?what=dials_by_class_code&cutoff=50&class_code=1024&class_code=1048
+# class_code and sales_rep are repeated for a multi-select. The snapshot is taken when
+# the request starts, so a refresh during a download does not mix data versions.
+@app.server.route('/export')
+def export():
+    args = flask.request.args
+    what = args.get('what', 'rows')
+    export_format = args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS or (what != 'rows' and what not in METRICS):
+        flask.abort(400)
+    try:
+        cutoff = int(args.get('cutoff', 0))
+    except ValueError:
+        flask.abort(400)
+    if not engagement_store.loaded.is_set():
+        flask.abort(503)
+    if not export_slots.acquire(blocking=False):
+        flask.abort(429)
 
-app.layout = html.Div([
-    html.Div([
+    try:
+        data = engagement_store.snapshot
+        key = filter_key(args.get('start_date') or None, args.get('end_date') or None,
+                            args.getlist('class_code') or None, args.getlist('sales_rep') or None)
+        if what == 'rows':
+            chunks = row_chunks(data, key)
+        else:
+            extra = metric_args(what, cutoff, FIGURE_TOP_N)
+            chunks = [aggregate_frame(run_metric(what, data, key, *extra))]
+
+        response = flask.Response(encode(chunks, export_format), mimetype=EXPORT_FORMATS[export_format])
+    except BaseException:
+        export_slots.release()
+        raise
+
+    response.headers['Content-Disposition'] = 'attachment; filename="{}"'.format(
+        export_filename('engagements' if what == 'rows' else what, key, export_format))
+    response.call_on_close(export_slots.release)
+    return response
+
+# Browser session cookie, so a newer request from the same session can cancel an
+# older queued aggregation of the same output
+SESSION_COOKIE = 'dashboard_session'
+
+@app.server.before_request
+def start_request_timer():
+    request_started()
+    set_request_session(flask.request.cookies.get(SESSION_COOKIE))
+
+@app.server.after_request
+def stop_request_timer(response):
+    request_finished(response)
+    if SESSION_COOKIE not in flask.request.cookies:
+        response.set_cookie(SESSION_COOKIE, uuid.uuid4().hex, httponly=True, samesite='Lax')
+    return response
+
+# Prometheus scrape endpoint: per-callback stage latencies and response sizes, and the
+# frame cache counters
+@app.server.route('/metrics')
+def metrics():
+    stats = frame_cache.stats()
+    lines = [stage_seconds.render(), response_bytes.render()]
+    for name, kind in [('hits', 'counter'), ('misses', 'counter'), ('evictions', 'counter'),
+                        ('entries', 'gauge'), ('bytes', 'gauge')]:
+        metric = 'dashboard_frame_cache_{}{}'.format(name, '_total' if kind == 'counter' else '')
+        lines.append('# TYPE {} {}\n{} {}\n'.format(metric, kind, metric, stats[name]))
+    responses = response_cache.stats()
+    for name in ['hits', 'misses']:
+        if name in responses:
+            metric = 'dashboard_response_cache_{}_total'.format(name)
+            lines.append('# TYPE {} counter\n{} {}\n'.format(metric, metric, responses[name]))
+    snapshot = engagement_store.snapshot
+    lines.append('# TYPE dashboard_data_version gauge\ndashboard_data_version {}\n'.format(snapshot.version if snapshot else 0))
+    lines.append(startup_report.render())
+    return flask.Response(''.join(lines), mimetype='text/plain; version=0.0.4')
+
+# What the export button downloads: the filtered rows, or the aggregate behind a
+# chart or table
+EXPORT_CHOICES = [{'label': 'Filtered engagements', 'value': 'rows'},
+                    {'label': 'Leads by effective month', 'value': 'leads_by_month'},
+                    {'label': 'Dials by month and lead status', 'value': 'dials_by_month_status'},
+                    {'label': 'Leads by month and lead status', 'value': 'leads_by_month_status'},
+                    {'label': 'Dials by call number', 'value': 'dials_by_call_number'},
+                    {'label': 'Dials by class code', 'value': 'dials_by_class_code'},
+                    {'label': 'Dials by insurer group', 'value': 'dials_by_insurer_group'},
+                    {'label': 'Class code table', 'value': 'class_code_summary'},
+                    {'label': 'Totals', 'value': 'lead_totals'},
+                    {'label': 'Rep leaderboard', 'value': 'rep_leaderboard'}]
+
+# The page with the given dropdown options and data version, built anew for each
+# request so that concurrent page loads do not share components
+def page_layout(class_code_options, sdr_options, version):
+    return html.Div([
         html.Div([
             html.Div([
-                dcc.Dropdown(
-                    id='class_code_dropdown',
-                    options=gclasscode_options,
-                    placeholder='Class Code',
-                )
-            ]),
-
-            dcc.DatePickerRange(
-                id='my-date-picker-range',
-                style={'background-color': 'white'},
-                min_date_allowed=date(1995, 8, 5),
-                max_date_allowed=date(2022, 9, 19),
-                initial_visible_month=date(2021, 2, 1),
-                stay_open_on_select = False,
-                clearable = True,
-            ),
+                html.Div([
+                    dcc.Dropdown(
+                        id='class_code_dropdown',
+                        options=class_code_options,
+                        placeholder='Class Code',
+                        multi=True,
+                    )
+                ]),
+
+                dcc.DatePickerRange(
+                    id='my-date-picker-range',
+                    style={'background-color': 'white'},
+                    min_date_allowed=date(1995, 8, 5),
+                    max_date_allowed=date(2022, 9, 19),
+                    initial_visible_month=date(2021, 2, 1),
+                    stay_open_on_select = False,
+                    clearable = True,
+                ),
+
+                html.Div([
+                    dcc.Dropdown(
+                        id='sales_rep_dropdown',
+                        options=sdr_options,
+                        placeholder='Sales Rep',
+                        multi=True,
+                    )
+                ]),
+            ], id='filter-div'),
 
             html.Div([
                 dcc.Dropdown(
-                    id='sales_rep_dropdown',
-                    options=sdr_options,
-                    placeholder='Sales Rep',
-                )
-            ]),
-        ], id='filter-div'),
+                    id='export-what',
+                    options=EXPORT_CHOICES,
+                    value='rows',
+                    clearable=False,
+                ),
+                dcc.RadioItems(
+                    id='export-format',
+                    options=[{'label': 'CSV', 'value': 'csv'},
+                                {'label': 'Parquet', 'value': 'parquet'}],
+                    value='csv',
+                    labelStyle={'display': 'inline-block'},
+                ),
+                html.A(html.Button('Export'), id='export-link', href='', download=''),
+            ], id='export-div'),
 
-        html.Div([
-            dash_table.DataTable(
-                id='total-table',
-                style_cell={'textAlign': 'center',
-                            'background-color' :'white',
-                            'border': 'rgb(50, 50, 50) solid'},
-                style_as_list_view=True,
-                style_header={
-                    'backgroundColor': 'white',
-                    'fontWeight': 'bold'
-                },
-                columns=[{'name': 'Total Leads', 'id':'total_leads'},
-                            {'name': 'Active Leads Dialed', 'id':'active_leads_dialed'},
-                            {'name': 'App Submitted', 'id':'app_submitted'},
-                            {'name': 'Total Dials', 'id':'total_dials'},
-                            {'name': 'App Rate', 'id':'app_rate'}],
-            )
-        ]),
-    ], id='header-div'),
-
-    html.Div([
-        html.Div([
-            dcc.Loading(id = "loading-icon-fig0", className='loading-icon', children=[
-                dcc.Graph(id='leads_lead_active_by_effective_month_fig0'),
-            ], type='circle'),
-            dcc.Loading(id = "loading-icon-fig1", className='loading-icon', children=[
-                dcc.Graph(id='dials_lead_status_by_effective_month_fig1'),
-            ], type='circle'),
-            dcc.Loading(id = "loading-icon-fig2", className='loading-icon', children=[
-                dcc.Graph(id='leads_lead_status_by_effective_month_fig2'),
-            ], type='circle'),
-            dcc.Loading(id = "loading-icon-fig3", className='loading-icon', children=[
-                dcc.Graph(id='dials_lead_status_by_call_number_fig3'),
-            ], type='circle'),
-            dcc.Slider(
-                id='cutoff-slider-fig3',
-                min=0,
-                max=1000,
-                step=None,
-                marks={
-                    0: '0',
-                    15: '15',
-                    50: '50',
-                    250: '250',
-                    500: '500',
-                    750: '750',
-                    1000: '1000'
-                },
-                value=0
-            ),
-        ], id='left-container'),
-
-        html.Div([
-            dcc.Loading(id = "loading-icon-governing-class-code-table", className='loading-icon',
-                children=[
+            html.Div([
                 dash_table.DataTable(
-                    id='governing-class-code-table',
+                    id='total-table',
                     style_cell={'textAlign': 'center',
-                                'background-color' :'white'},
+                                'background-color' :'white',
+                                'border': 'rgb(50, 50, 50) solid'},
                     style_as_list_view=True,
                     style_header={
                         'backgroundColor': 'white',
                         'fontWeight': 'bold'
                     },
-                    style_data_conditional=[
-                        {
-                            'if': {'row_index': 'odd'},
-                            'backgroundColor': 'rgb(248, 248, 248)'
-                        },
-                        {
-                            'if': {'column_id': 'lost'},
-                            'border': 'rgb(50, 50, 50) solid'
-                        },
-                        {
-                            'if': {'column_id': 'is_active'},
-                            'border': 'rgb(50, 50, 50) solid'
+                    columns=[{'name': 'Total Leads', 'id':'total_leads'},
+                                {'name': 'Active Leads Dialed', 'id':'active_leads_dialed'},
+                                {'name': 'App Submitted', 'id':'app_submitted'},
+                                {'name': 'Total Dials', 'id':'total_dials'},
+                                {'name': 'App Rate', 'id':'app_rate'}],
+                ),
+                # Every rep under the date and class code filters (or the selected reps),
+                # so reps can be compared without picking them one by one
+                dcc.Loading(id = "loading-icon-rep-leaderboard", className='loading-icon', children=[
+                    dash_table.DataTable(
+                        id='rep-leaderboard',
+                        style_cell={'textAlign': 'center',
+                                    'background-color' :'white'},
+                        style_as_list_view=True,
+                        style_header={
+                            'backgroundColor': 'white',
+                            'fontWeight': 'bold'
                         },
-                        {
-                            'if': {'column_id': 'is_lead'},
-                            'border': 'rgb(50, 50, 50) solid'
-                        }
-                    ],
-                    columns = [{'name': 'Class Code', 'id': 'governing_class_code'},
-                                {'name': 'Total', 'id': 'is_lead'},
-                                {'name': 'Active', 'id': 'is_active'},
-                                {'name': 'Lost', 'id': 'lost'},
-                                {'name': 'Connected', 'id': 'call_connected'},
-                                {'name': 'DM Reached', 'id': 'dm_reached'},
-                                {'name': 'App Started', 'id': 'app_started'},
-                                {'name': 'App Submitted', 'id': 'app_submitted'}],
-                    filter_action="native",
-                    sort_action="native",
-                    sort_mode="multi",
-                    column_selectable="single",
-                    selected_columns=[],
-                    selected_rows=[],
-                    page_action="native",
-                    page_current= 0,
-                    page_size= 10,
-                )
-            ], type='circle'),
-            dcc.Loading(id = "loading-icon-fig4", className='loading-icon', children=[
-                dcc.Graph(id='dials_lead_status_by_governing_class_code_fig4'),
-            ], type='circle'),
-            dcc.Slider(
-                id='cutoff-slider-classcode',
-                min=0,
-                max=1000,
-                step=None,
-                marks={
-                    0: '0',
-                    15: '15',
-                    50: '50',
-                    250: '250',
-                    500: '500',
-                    750: '750',
-                    1000: '1000'
-                },
-                value=0
-            ),
-            dcc.Loading(id = "loading-icon-fig5", className='loading-icon', children=[
-                dcc.Graph(id='dials_lead_status_by_insurance_group_fig5'),
-            ], type='circle'),
-            dcc.Slider(
-                id='cutoff-slider-insurance',
-                min=0,
-                max=1000,
-                step=None,
-                marks={
-                    0: '0',
-                    15: '15',
-                    50: '50',
-                    250: '250',
-                    500: '500',
-                    750: '750',
-                    1000: '1000'
-                },
-                value=0
-            ),
-        ], id='right-container'),
-    ])
-
-], id='full-page')
-
-@app.callback(
-    Output('leads_lead_active_by_effective_month_fig0', 'figure'),
-    [Input('my-date-picker-range', 'start_date'),
-     Input('my-date-picker-range', 'end_date'),
-     Input('class_code_dropdown', 'value'),
-     Input('sales_rep_dropdown', 'value')])
-def update_data(start_date, end_date, class_code, sales_rep):
-    dff = df_engagements_leads.copy()
-
-    if (sales_rep != 'ALL') and (sales_rep is not None):
-        dff = dff[dff['updated_by'] == sales_rep]
-
-    if (class_code != 'ALL') and (class_code is not None):
-        dff = dff[dff['governing_class_code'] == class_code]
-
-    if start_date is not None:
-        st_date = date.fromisoformat(start_date)
-        dff = dff[dff['activity_date'] >=
-                            datetime(st_date.year, st_date.month, st_date.day)]
-    if end_date is not None:
-        end_date = date.fromisoformat(end_date)
-
-        dff = dff[dff['activity_date'] <
-                        datetime(end_date.year, end_date.month, end_date.day)]
-
-    try:
-        dff['effective_month'] = pd.Categorical(dff['effective_month'], categories=months, ordered=True)
-        dff.sort_values(by='effective_month', ascending=True, inplace=True)
-
-        dff = dff.sort_values(by="activity_date").drop_duplicates(subset=["lead"], keep="last")
-        dff = dff.groupby('effective_month')[['is_lead', 'is_active', 'lost', 'app_submitted']].sum().reset_index()
-
-        def get_app_rate(x):
-            if(x.app_submitted != 0):
-                return str(round((x.app_submitted * 100/x.is_lead) , 2)) + '%'
-            else:
-                return str(0) + '%'
-
-        dff.loc[:, 'app_rate'] = dff.apply(lambda x: get_app_rate(x), axis=1)
-
-        fig0 = px.bar(data_frame=dff, x="effective_month", y=["is_lead", "is_active", "app_submitted", "lost"],
-                    title='Fig 0 - Number Leads by Effective Month', hover_data=['app_rate'], hover_name='app_rate',
-                    barmode="stack", template="plotly")
-
-        fig0.update_layout(
-            yaxis_title="Leads",
-            xaxis_title="Effective Month",
-            xaxis = dict(
-                tickmode = 'linear'
-            ),
-            legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.02,
-            xanchor="right",
-            x=1
-            )
-        )
-
-        fig0 = customLegend(fig = fig0, nameSwap = {'is_lead':'Leads',
-                                       'is_active' : 'Active',
-                                       'app_submitted' : 'App Submitted',
-                                       'lost' : 'Lost'})
-    except Exception as ex:
-        fig0 = {}
-        print(ex)
-
-    return fig0
-
-@app.callback(
-    Output('dials_lead_status_by_effective_month_fig1', 'figure'),
-    [Input('my-date-picker-range', 'start_date'),
-     Input('my-date-picker-range', 'end_date'),
-     Input('class_code_dropdown', 'value'),
-     Input('sales_rep_dropdown', 'value')])
-def update_data(start_date, end_date, class_code, sales_rep):
-
-    dff = df_engagements_leads.copy()
-
-    if (sales_rep != 'ALL') and (sales_rep is not None):
-        dff = dff[dff['updated_by'] == sales_rep]
-
-    if (class_code != 'ALL') and (class_code is not None):
-        dff = dff[dff['governing_class_code'] == class_code]
-
-    if start_date is not None:
-        st_date = date.fromisoformat(start_date)
-        dff = dff[dff['activity_date'] >=
-                            datetime(st_date.year, st_date.month, st_date.day)]
-    if end_date is not None:
-        end_date = date.fromisoformat(end_date)
-
-        dff = dff[dff['activity_date'] <
-                        datetime(end_date.year, end_date.month, end_date.day)]
-
-    try:
-
-        dff['effective_month'] = pd.Categorical(dff['effective_month'], categories=months, ordered=True)
-        dff.sort_values(by='effective_month', ascending=True, inplace=True)  # same as you have now; can use inplace=True
-        dff_fig1 = dff.groupby(by=["effective_month", "lead_status"]).size().reset_index(name="Dials")
-
-        dff_fig1 = dff_fig1.groupby(by=["effective_month"]).apply(lambda x: app_rate_to_group(x, 'Dials'))
-
-        fig1 = px.bar(data_frame=dff_fig1, x="effective_month", y="Dials",
-                    title='Fig 1 - Number Dials by Effective Month', color="lead_status",
-                    hover_name='app_rate', hover_data=['app_rate'], barmode="stack", template="seaborn")
-
-        fig1.update_layout(
-            xaxis_title="Effective Month",
-            xaxis = dict(
-                tickmode = 'linear'
-            ),
-        )
-    except Exception as ex:
-        fig1 = {}
-        print(ex)
-
-    return fig1
-
-@app.callback(
-    Output('leads_lead_status_by_effective_month_fig2', 'figure'),
-    [Input('my-date-picker-range', 'start_date'),
-     Input('my-date-picker-range', 'end_date'),
-     Input('class_code_dropdown', 'value'),
-     Input('sales_rep_dropdown', 'value')])
-def update_data(start_date, end_date, class_code, sales_rep):
-    dff = df_engagements_leads.copy()
-
-    if (sales_rep != 'ALL') and (sales_rep is not None):
-        dff = dff[dff['updated_by'] == sales_rep]
-
-    if (class_code != 'ALL') and (class_code is not None):
-        dff = dff[dff['governing_class_code'] == class_code]
-
-    if start_date is not None:
-        st_date = date.fromisoformat(start_date)
-        dff = dff[dff['activity_date'] >=
-                            datetime(st_date.year, st_date.month, st_date.day)]
-    if end_date is not None:
-        end_date = date.fromisoformat(end_date)
-
-        dff = dff[dff['activity_date'] <
-                        datetime(end_date.year, end_date.month, end_date.day)]
-
-    try:
-        dff['effective_month'] = pd.Categorical(dff['effective_month'], categories=months, ordered=True)
-        dff.sort_values(by='effective_month', ascending=True, inplace=True)
-
-        dff_fig2 = dff.sort_values(by="activity_date").drop_duplicates(subset=["lead"], keep="last")
-        dff_fig2 = dff_fig2.groupby(by=["effective_month", "lead_status"]).size().reset_index(name="Leads")
-
-        dff_fig2 = dff_fig2.groupby(by=["effective_month"]).apply(lambda x: app_rate_to_group(x, 'Leads'))
-
-        fig2 = px.bar(data_frame=dff_fig2, x="effective_month", y="Leads",
-                    title='Fig 2 - Number Leads by Effective Month', color="lead_status",
-                    hover_name='app_rate', hover_data=['app_rate'], barmode="stack", template="plotly")
-
-        fig2.update_layout(
-            xaxis_title="Effective Month",
-            xaxis = dict(
-                tickmode = 'linear'
-            ),
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=-0.35,
-                xanchor="right",
-                x=1.0
-            )
-        )
-    except Exception as ex:
-        fig2 = {}
-        print(ex)
-
-    return fig2
-
-@app.callback(
-    Output('dials_lead_status_by_call_number_fig3', 'figure'),
-    [Input('my-date-picker-range', 'start_date'),
-     Input('my-date-picker-range', 'end_date'),
-     Input('class_code_dropdown', 'value'),
-     Input('sales_rep_dropdown', 'value'),
-     Input('cutoff-slider-fig3', 'value')])
-def update_data(start_date, end_date, class_code, sales_rep, cutoff):
-    dff = df_engagements_leads.copy()
-
-    if (sales_rep != 'ALL') and (sales_rep is not None):
-        dff = dff[dff['updated_by'] == sales_rep]
-
-    if (class_code != 'ALL') and (class_code is not None):
-        dff = dff[dff['governing_class_code'] == class_code]
-
-    if start_date is not None:
-        st_date = date.fromisoformat(start_date)
-        dff = dff[dff['activity_date'] >=
-                            datetime(st_date.year, st_date.month, st_date.day)]
-    if end_date is not None:
-        end_date = date.fromisoformat(end_date)
-
-        dff = dff[dff['activity_date'] <
-                        datetime(end_date.year, end_date.month, end_date.day)]
-
-    try:
-        dff_fig3 = dff.groupby(by=["call_number"]).filter(
-                                            lambda g: g.lead_status.count() > cutoff).groupby(
-                                            by=["call_number", "lead_status"]).size(
-                                            ).reset_index(name="Dials")
-
-        dff_fig3 = dff_fig3.groupby(by=["call_number"]).apply(lambda x: app_rate_to_group(x, 'Dials'))
-
-        fig3 = px.bar(data_frame=dff_fig3, x="call_number", y="Dials",
-                    title='Fig 3 - Number Dials by Call Number', color="lead_status",
-                    hover_name='app_rate', hover_data=['app_rate'], barmode="stack", template="simple_white")
-        fig3.update_layout(xaxis={"tickmode":"linear", 'categoryorder':'category ascending'},
-                            xaxis_title="Call Number")
-    except Exception as ex:
-        fig3 = {}
-        print(ex)
-
-    return fig3
-
-@app.callback(
-    Output('dials_lead_status_by_governing_class_code_fig4', 'figure'),
-    [Input('my-date-picker-range', 'start_date'),
-     Input('my-date-picker-range', 'end_date'),
-     Input('class_code_dropdown', 'value'),
-     Input('sales_rep_dropdown', 'value'),
-     Input('cutoff-slider-classcode', 'value')])
-def update_data(start_date, end_date, class_code, sales_rep, cutoff):
-    dff = df_engagements_leads.copy()
-
-    if (sales_rep != 'ALL') and (sales_rep is not None):
-        dff = dff[dff['updated_by'] == sales_rep]
-
-    if (class_code != 'ALL') and (class_code is not None):
-        dff = dff[dff['governing_class_code'] == class_code]
-
-    if start_date is not None:
-        st_date = date.fromisoformat(start_date)
-        dff = dff[dff['activity_date'] >=
-                            datetime(st_date.year, st_date.month, st_date.day)]
-    if end_date is not None:
-        end_date = date.fromisoformat(end_date)
-
-        dff = dff[dff['activity_date'] <
-                        datetime(end_date.year, end_date.month, end_date.day)]
-
-    try:
-        dff_fig4 = dff.groupby(by=["governing_class_code"]).filter(
-                                            lambda g: g.lead_status.count() > cutoff).groupby(
-                                            by=["governing_class_code", "lead_status"]).size(
-                                            ).reset_index(name="Dials")
-
-        dff_fig4 = dff_fig4.groupby(by=["governing_class_code"]).apply(
-                                                            lambda x: app_rate_to_group(x, 'Dials'))
-        fig4 = px.bar(data_frame=dff_fig4, x="Dials", y="governing_class_code", orientation='h',
-                    title='Fig 4 - Number Dials by Governing Class Code', color="lead_status",
-                    hover_data=['app_rate'], hover_name='app_rate', barmode="stack", template="ggplot2")
-        fig4.update_layout(yaxis={'categoryorder':'total ascending'},
-                            xaxis_title="Dials",
-                            yaxis_title="Class Code")
-    except Exception as ex:
-        fig4 = {}
-        print(ex)
-
-    return fig4
+                        style_data_conditional=[
+                            {
+                                'if': {'row_index': 'odd'},
+                                'backgroundColor': 'rgb(248, 248, 248)'
+                            }
+                        ],
+                        columns=REP_LEADERBOARD_COLUMNS,
+                        sort_action="native",
+                        page_action="native",
+                        page_size=10,
+                    )
+                ], type='circle'),
+            ]),
+        ], id='header-div'),
 
-@app.callback(
-    Output('dials_lead_status_by_insurance_group_fig5', 'figure'),
-    [Input('my-date-picker-range', 'start_date'),
-     Input('my-date-picker-range', 'end_date'),
-     Input('class_code_dropdown', 'value'),
-     Input('sales_rep_dropdown', 'value'),
-     Input('cutoff-slider-insurance', 'value')])
-def update_data(start_date, end_date, class_code, sales_rep, cutoff):
-    dff = df_engagements_leads.copy()
-
-    if (sales_rep != 'ALL') and (sales_rep is not None):
-        dff = dff[dff['updated_by'] == sales_rep]
-
-    if (class_code != 'ALL') and (class_code is not None):
-        dff = dff[dff['governing_class_code'] == class_code]
-
-    if start_date is not None:
-        st_date = date.fromisoformat(start_date)
-        dff = dff[dff['activity_date'] >=
-                            datetime(st_date.year, st_date.month, st_date.day)]
-    if end_date is not None:
-        end_date = date.fromisoformat(end_date)
-
-        dff = dff[dff['activity_date'] <
-                        datetime(end_date.year, end_date.month, end_date.day)]
+        html.Div([
+            html.Div([
+                dcc.Loading(id = "loading-icon-fig0", className='loading-icon', children=[
+                    dcc.Graph(id='leads_lead_active_by_effective_month_fig0'),
+                ], type='circle'),
+                dcc.Loading(id = "loading-icon-fig1", className='loading-icon', children=[
+                    dcc.Graph(id='dials_lead_status_by_effective_month_fig1'),
+                ], type='circle'),
+                dcc.Loading(id = "loading-icon-fig2", className='loading-icon', children=[
+                    dcc.Graph(id='leads_lead_status_by_effective_month_fig2'),
+                ], type='circle'),
+                dcc.Loading(id = "loading-icon-fig3", className='loading-icon', children=[
+                    dcc.Graph(id='dials_lead_status_by_call_number_fig3'),
+                ], type='circle'),
+                dcc.Slider(
+                    id='cutoff-slider-fig3',
+                    min=0,
+                    max=1000,
+                    step=None,
+                    marks={
+                        0: '0',
+                        15: '15',
+                        50: '50',
+                        250: '250',
+                        500: '500',
+                        750: '750',
+                        1000: '1000'
+                    },
+                    value=0
+                ),
+            ], id='left-container'),
 
-    try:
-        dff_fig5 = dff.groupby(by=["current_coverage_insurers_group_name"]).filter(
-                                            lambda g: g.lead_status.count() > cutoff).groupby(
-                                            by=["current_coverage_insurers_group_name", "lead_status"]).size(
-                                            ).reset_index(name="Dials")
-        dff_fig5 = dff_fig5[dff_fig5['current_coverage_insurers_group_name'].str.len() > 0]
-
-        dff_fig5 = dff_fig5.groupby(by=["current_coverage_insurers_group_name"]).apply(
-                                                                    lambda x: app_rate_to_group(x, 'Dials'))
-        #dff_fig5['test'] = dff_fig5.apply(lambda x: x.Dials + 1, axis=1)
-
-        fig5 = px.bar(data_frame=dff_fig5, x="Dials", y="current_coverage_insurers_group_name", orientation='h',
-                    title='Fig 5 - Number Dials by Insurer\'s Group Name', color="lead_status", hover_name="app_rate",
-                    hover_data=['app_rate'], barmode="stack", template="plotly_white")
-        #fig5.update_traces(texttemplate='%{text:.2s}', textposition='outside')
-        fig5.update_layout(yaxis={'categoryorder':'total ascending', "tickmode":"linear"},
-                                    uniformtext_minsize=8, uniformtext_mode='hide',
-                                    xaxis_title="Dials",
-                                    yaxis_title="Insurance Group Name")
-    except Exception as ex:
-        fig5 = {}
-        print(ex)
-
-    return fig5
+            html.Div([
+                dcc.Loading(id = "loading-icon-governing-class-code-table", className='loading-icon',
+                    children=[
+                    dash_table.DataTable(
+                        id='governing-class-code-table',
+                        style_cell={'textAlign': 'center',
+                                    'background-color' :'white'},
+                        style_as_list_view=True,
+                        style_header={
+                            'backgroundColor': 'white',
+                            'fontWeight': 'bold'
+                        },
+                        style_data_conditional=[
+                            {
+                                'if': {'row_index': 'odd'},
+                                'backgroundColor': 'rgb(248, 248, 248)'
+                            },
+                            {
+                                'if': {'column_id': 'lost'},
+                                'border': 'rgb(50, 50, 50) solid'
+                            },
+                            {
+                                'if': {'column_id': 'is_active'},
+                                'border': 'rgb(50, 50, 50) solid'
+                            },
+                            {
+                                'if': {'column_id': 'is_lead'},
+                                'border': 'rgb(50, 50, 50) solid'
+                            }
+                        ],
+                        columns = [{'name': 'Class Code', 'id': 'governing_class_code'},
+                                    {'name': 'Total', 'id': 'is_lead'},
+                                    {'name': 'Active', 'id': 'is_active'},
+                                    {'name': 'Lost', 'id': 'lost'},
+                                    {'name': 'Connected', 'id': 'call_connected'},
+                                    {'name': 'DM Reached', 'id': 'dm_reached'},
+                                    {'name': 'App Started', 'id': 'app_started'},
+                                    {'name': 'App Submitted', 'id': 'app_submitted'}],
+                        # Filtered, sorted and paged by the server so only the visible page is sent
+                        filter_action="custom",
+                        filter_query='',
+                        sort_action="custom",
+                        sort_mode="multi",
+                        sort_by=[],
+                        column_selectable="single",
+                        selected_columns=[],
+                        selected_rows=[],
+                        page_action="custom",
+                        page_current= 0,
+                        page_size= 10,
+                    )
+                ], type='circle'),
+                dcc.Loading(id = "loading-icon-fig4", className='loading-icon', children=[
+                    dcc.Graph(id='dials_lead_status_by_governing_class_code_fig4'),
+                ], type='circle'),
+                dcc.Slider(
+                    id='cutoff-slider-classcode',
+                    min=0,
+                    max=1000,
+                    step=None,
+                    marks={
+                        0: '0',
+                        15: '15',
+                        50: '50',
+                        250: '250',
+                        500: '500',
+                        750: '750',
+                        1000: '1000'
+                    },
+                    value=0
+                ),
+                dcc.Loading(id = "loading-icon-fig5", className='loading-icon', children=[
+                    dcc.Graph(id='dials_lead_status_by_insurance_group_fig5'),
+                ], type='circle'),
+                dcc.Slider(
+                    id='cutoff-slider-insurance',
+                    min=0,
+                    max=1000,
+                    step=None,
+                    marks={
+                        0: '0',
+                        15: '15',
+                        50: '50',
+                        250: '250',
+                        500: '500',
+                        750: '750',
+                        1000: '1000'
+                    },
+                    value=0
+                ),
+            ], id='right-container'),
+        ]),
 
+        dcc.Store(id='data-version', data=version),
+        # Fig 3-5 at cutoff 0 with their bars' group totals, cut in the browser by assets/cutoff.js
+        dcc.Store(id='fig3-store'),
+        dcc.Store(id='fig4-store'),
+        dcc.Store(id='fig5-store'),
+        dcc.Store(id='export-path', data=app.get_relative_path('/export')),
+        dcc.Interval(id='data-refresh-interval', interval=max(refresh_seconds, 1) * 1000,
+                        disabled=refresh_seconds <= 0),
+    ], id='full-page')
+
+# The page with the dropdown options and data version available when it is requested:
+# the snapshot's, or the options sidecar's while the data is still loading
+def serve_layout():
+    return page_layout(*engagement_store.current_options())
+
+app.layout = serve_layout
+
+# Push refreshed dropdown options, and a new data version that re-runs the figure
+# callbacks, to open dashboards and to pages loaded after a refresh
 @app.callback(
-    Output('governing-class-code-table', 'data'),
-    Output('governing-class-code-table', 'columns'),
-    [Input('my-date-picker-range', 'start_date'),
-     Input('my-date-picker-range', 'end_date'),
-     Input('class_code_dropdown', 'value'),
-     Input('sales_rep_dropdown', 'value')])
-def update_data(start_date, end_date, class_code, sales_rep):
-    dff = df_engagements_leads.copy()
-
-    if (sales_rep != 'ALL') and (sales_rep is not None):
-        dff = dff[dff['updated_by'] == sales_rep]
-
-    if (class_code != 'ALL') and (class_code is not None):
-        dff = dff[dff['governing_class_code'] == class_code]
-
-    if start_date is not None:
-        st_date = date.fromisoformat(start_date)
-        dff = dff[dff['activity_date'] >=
-                            datetime(st_date.year, st_date.month, st_date.day)]
-    if end_date is not None:
-        end_date = date.fromisoformat(end_date)
-
-        dff = dff[dff['activity_date'] <
-                        datetime(end_date.year, end_date.month, end_date.day)]
-
-    try:
-        dff_dials = dff.groupby('governing_class_code')[['call_connected', 'dm_reached', 'app_started', 'app_submitted']].sum().reset_index()
-        dff_leads = dff.sort_values(by="activity_date").drop_duplicates(subset=["lead"], keep="last")
-        dff_leads = dff_leads.groupby('governing_class_code')[['is_lead', 'is_active', 'lost']].sum().reset_index()
-        dff_merged = dff_leads.merge(dff_dials, how='left', on='governing_class_code')
-
-        #dff_merged.drop(columns=['app_submitted_x'], inplace=True)
-        #dff_merged.rename(columns={'app_submitted_y':'app_submitted'},inplace=True)
-        dff_merged.sort_values(by=['is_lead'], inplace=True, ascending=False)
-
-        #columns = [{'name': col, 'id': col} for col in dff_merged.columns]
-        columns = [{'name': 'Class Code', 'id': 'governing_class_code'},
-                    {'name': 'Total', 'id': 'is_lead'},
-                    {'name': 'Active', 'id': 'is_active'},
-                    {'name': 'Lost', 'id': 'lost'},
-                    {'name': 'Connected', 'id': 'call_connected'},
-                    {'name': 'DM Reached', 'id': 'dm_reached'},
-                    {'name': 'App Started', 'id': 'app_started'},
-                    {'name': 'App Submitted', 'id': 'app_submitted'}]
-        data = dff_merged.to_dict(orient='records')
-    except Exception as ex:
-        print(ex)
-
-    return data, columns
-
+    Output('class_code_dropdown', 'options'),
+    Output('sales_rep_dropdown', 'options'),
+    Output('data-version', 'data'),
+    [Input('data-refresh-interval', 'n_intervals')],
+    [State('data-version', 'data')])
+def update_options(n_intervals, data_version):
+    data = current_snapshot()
+
+    if data.version == data_version:
+        raise PreventUpdate
+
+    return data.class_code_options, data.sdr_options, data.version
+
+FILTER_INPUTS = [Input('my-date-picker-range', 'start_date'),
+                 Input('my-date-picker-range', 'end_date'),
+                 Input('class_code_dropdown', 'value'),
+                 Input('sales_rep_dropdown', 'value'),
+                 Input('data-version', 'data')]
+
+CUTOFF_SLIDERS = ['cutoff-slider-fig3', 'cutoff-slider-classcode', 'cutoff-slider-insurance']
+
+CLASS_CODE_TABLE_INPUTS = [Input('governing-class-code-table', 'page_current'),
+                           Input('governing-class-code-table', 'page_size'),
+                           Input('governing-class-code-table', 'filter_query'),
+                           Input('governing-class-code-table', 'sort_by')]
+
+# Point the export button at the current filters, choice, format and cutoff. The href is
+# built by assets/export.js, so dragging a cutoff slider sends no request.
+app.clientside_callback(
+    ClientsideFunction(namespace='export', function_name='export_href'),
+    Output('export-link', 'href'),
+    FILTER_INPUTS[:4] + [Input('export-what', 'value'), Input('export-format', 'value')]
+    + [Input(slider, 'value') for slider in CUTOFF_SLIDERS],
+    State('export-path', 'data'))
+
+# Back to the first page of the class code table when its rows change
 @app.callback(
-    Output('total-table', 'data'),
-    [Input('my-date-picker-range', 'start_date'),
-     Input('my-date-picker-range', 'end_date'),
-     Input('class_code_dropdown', 'value'),
-     Input('sales_rep_dropdown', 'value')])
-def update_data(start_date, end_date, class_code, sales_rep):
-    dff = df_engagements_leads.copy()
-
-    if (sales_rep != 'ALL') and (sales_rep is not None):
-        dff = dff[dff['updated_by'] == sales_rep]
-
-    if (class_code != 'ALL') and (class_code is not None):
-        dff = dff[dff['governing_class_code'] == class_code]
-
-    if start_date is not None:
-        st_date = date.fromisoformat(start_date)
-        dff = dff[dff['activity_date'] >=
-                            datetime(st_date.year, st_date.month, st_date.day)]
-    if end_date is not None:
-        end_date = date.fromisoformat(end_date)
-
-        dff = dff[dff['activity_date'] <
-                        datetime(end_date.year, end_date.month, end_date.day)]
-
-    try:
-        dff_active = dff[dff['is_active'] == 1].copy()
-        dff_app_submitted = dff[dff['app_submitted'] == 1].copy()
-
-        total_leads = len(dff['lead'].unique())
-        active_leads_dialed = len(dff_active['lead'].unique())
-        leads_app_submitted = len(dff_app_submitted['lead'].unique())
-        total_dials = len(dff)
-        app_rate = round(float(leads_app_submitted * 100)/float(total_leads), 2)
-
-        data_dict = [{'total_leads':str(total_leads),
-                    'active_leads_dialed':str(active_leads_dialed),
-                    'app_submitted':str(leads_app_submitted),
-                    'total_dials':str(total_dials),
-                    'app_rate':(str(app_rate) + '%')}]
-    except Exception as ex:
-        data_dict = [{'total_leads':str(0),
-                    'active_leads_dialed':str(0),
-                    'active_leads_not_dialed':str(0),
-                    'app_submitted':str(0)}]
-        print(ex)
-
-    return data_dict
+    Output('governing-class-code-table', 'page_current'),
+    FILTER_INPUTS + [Input('governing-class-code-table', 'filter_query')],
+    [State('governing-class-code-table', 'page_current')])
+def reset_class_code_page(start_date, end_date, class_code, sales_rep, data_version, filter_query, page_current):
+    if not page_current:
+        raise PreventUpdate
+    return 0
+
+if consolidated_callbacks:
+    # A filter change returns every output in one response; the builders share one
+    # filter and dedup through the frame cache, and outputs in the response cache
+    # skip them altogether. Paging, sorting or filtering the class code table only
+    # rebuilds its page; the other outputs are left untouched. Cutoff sliders never
+    # reach the server.
+    @app.callback(
+        [Output('leads_lead_active_by_effective_month_fig0', 'figure'),
+         Output('dials_lead_status_by_effective_month_fig1', 'figure'),
+         Output('leads_lead_status_by_effective_month_fig2', 'figure'),
+         Output('fig3-store', 'data'),
+         Output('fig4-store', 'data'),
+         Output('fig5-store', 'data'),
+         Output('governing-class-code-table', 'data'),
+         Output('governing-class-code-table', 'columns'),
+         Output('governing-class-code-table', 'page_count'),
+         Output('total-table', 'data'),
+         Output('rep-leaderboard', 'data')],
+        FILTER_INPUTS + CLASS_CODE_TABLE_INPUTS)
+    @timed_callback('dashboard')
+    def update_dashboard(start_date, end_date, class_code, sales_rep, data_version,
+                            page_current, page_size, filter_query, sort_by):
+        data = current_snapshot()
+        key = filter_key(start_date, end_date, class_code, sales_rep)
+        triggered = {trigger['prop_id'].split('.')[0] for trigger in dash.callback_context.triggered}
+
+        if triggered == {'governing-class-code-table'}:
+            table = list(cached_output('class_code_table', data, key, build_class_code_table,
+                                        page_current, page_size, filter_query, sort_by))
+
+            return [dash.no_update] * 6 + table + [dash.no_update] * 2
+
+        table_data, table_columns, table_page_count = cached_output('class_code_table', data, key, build_class_code_table,
+                                                                    page_current, page_size, filter_query, sort_by)
+
+        return [cached_output('fig0', data, key, build_fig0),
+                cached_output('fig1', data, key, build_fig1),
+                cached_output('fig2', data, key, build_fig2),
+                cached_output('fig3_store', data, key, build_cutoff_store, 'fig3'),
+                cached_output('fig4_store', data, key, build_cutoff_store, 'fig4'),
+                cached_output('fig5_store', data, key, build_cutoff_store, 'fig5'),
+                table_data,
+                table_columns,
+                table_page_count,
+                cached_output('total_table', data, key, build_total_table),
+                cached_output('rep_leaderboard', data, key, build_rep_leaderboard)]
+else:
+    @app.callback(
+        Output('leads_lead_active_by_effective_month_fig0', 'figure'),
+        FILTER_INPUTS)
+    @timed_callback('fig0')
+    def update_data(start_date, end_date, class_code, sales_rep, data_version):
+        return cached_output('fig0', current_snapshot(), filter_key(start_date, end_date, class_code, sales_rep),
+                                build_fig0)
+
+    @app.callback(
+        Output('dials_lead_status_by_effective_month_fig1', 'figure'),
+        FILTER_INPUTS)
+    @timed_callback('fig1')
+    def update_data(start_date, end_date, class_code, sales_rep, data_version):
+        return cached_output('fig1', current_snapshot(), filter_key(start_date, end_date, class_code, sales_rep),
+                                build_fig1)
+
+    @app.callback(
+        Output('leads_lead_status_by_effective_month_fig2', 'figure'),
+        FILTER_INPUTS)
+    @timed_callback('fig2')
+    def update_data(start_date, end_date, class_code, sales_rep, data_version):
+        return cached_output('fig2', current_snapshot(), filter_key(start_date, end_date, class_code, sales_rep),
+                                build_fig2)
+
+    @app.callback(
+        Output('fig3-store', 'data'),
+        FILTER_INPUTS)
+    @timed_callback('fig3')
+    def update_data(start_date, end_date, class_code, sales_rep, data_version):
+        return cached_output('fig3_store', current_snapshot(), filter_key(start_date, end_date, class_code, sales_rep),
+                                build_cutoff_store, 'fig3')
+
+    @app.callback(
+        Output('fig4-store', 'data'),
+        FILTER_INPUTS)
+    @timed_callback('fig4')
+    def update_data(start_date, end_date, class_code, sales_rep, data_version):
+        return cached_output('fig4_store', current_snapshot(), filter_key(start_date, end_date, class_code, sales_rep),
+                                build_cutoff_store, 'fig4')
+
+    @app.callback(
+        Output('fig5-store', 'data'),
+        FILTER_INPUTS)
+    @timed_callback('fig5')
+    def update_data(start_date, end_date, class_code, sales_rep, data_version):
+        return cached_output('fig5_store', current_snapshot(), filter_key(start_date, end_date, class_code, sales_rep),
+                                build_cutoff_store, 'fig5')
+
+    @app.callback(
+        Output('governing-class-code-table', 'data'),
+        Output('governing-class-code-table', 'columns'),
+        Output('governing-class-code-table', 'page_count'),
+        FILTER_INPUTS + CLASS_CODE_TABLE_INPUTS)
+    @timed_callback('class_code_table')
+    def update_data(start_date, end_date, class_code, sales_rep, data_version, page_current, page_size, filter_query, sort_by):
+        return cached_output('class_code_table', current_snapshot(), filter_key(start_date, end_date, class_code, sales_rep),
+                                build_class_code_table, page_current, page_size, filter_query, sort_by)
+
+    @app.callback(
+        Output('total-table', 'data'),
+        FILTER_INPUTS)
+    @timed_callback('total_table')
+    def update_data(start_date, end_date, class_code, sales_rep, data_version):
+        return cached_output('total_table', current_snapshot(), filter_key(start_date, end_date, class_code, sales_rep),
+                                build_total_table)
+
+    @app.callback(
+        Output('rep-leaderboard', 'data'),
+        FILTER_INPUTS)
+    @timed_callback('rep_leaderboard')
+    def update_data(start_date, end_date, class_code, sales_rep, data_version):
+        return cached_output('rep_leaderboard', current_snapshot(), filter_key(start_date, end_date, class_code, sales_rep),
+                                build_rep_leaderboard)
+
+# Cut Fig 3-5 in the browser from their stores, so moving a slider sends no request
+for figure, store, slider in [('dials_lead_status_by_call_number_fig3', 'fig3-store', 'cutoff-slider-fig3'),
+                                ('dials_lead_status_by_governing_class_code_fig4', 'fig4-store', 'cutoff-slider-classcode'),
+                                ('dials_lead_status_by_insurance_group_fig5', 'fig5-store', 'cutoff-slider-insurance')]:
+    app.clientside_callback(
+        ClientsideFunction(namespace='cutoff', function_name='apply_cutoff'),
+        Output(figure, 'figure'),
+        [Input(store, 'data'), Input(slider, 'value')])
 
 if __name__ == '__main__':
     app.run_server(debug=False)
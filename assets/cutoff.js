@@ -0,0 +1,99 @@
+// Cutoff sliders of Fig 3, 4 and 5, applied in the browser. The server sends each
+// chart once per filter change at cutoff 0 (views.build_cutoff_store) with the group
+// total of every bar; moving a slider only drops the bars of groups with no more
+// than `cutoff` dials, as aggregates.apply_cutoff does, without a request.
+
+// Round to the nearest integer, halves to even, as np.round does
+function roundHalfEven(value) {
+    var rounded = Math.round(value);
+    return (rounded - value === 0.5 && rounded % 2 !== 0) ? rounded - 1 : rounded;
+}
+
+// Python's str() of a float, as aggregates.format_app_rate prints app rates
+function formatRate(submitted, total) {
+    if (!submitted) {
+        return '0%';
+    }
+    var rate = roundHalfEven(submitted * 100 / total * 100) / 100;
+    return (Number.isInteger(rate) ? rate.toFixed(1) : String(rate)) + '%';
+}
+
+// Dials per lead_status, total dials and app rate of the 'Other' bar at a cutoff:
+// the groups summed into it that are still above the cutoff
+function otherBar(other, cutoff) {
+    var bar = {dials: {}, total: 0, submitted: 0};
+    if (!other) {
+        return bar;
+    }
+    for (var i = 0; i < other.dials.length; i++) {
+        if (other.group_dials[i] > cutoff) {
+            var status = other.lead_status[i];
+            bar.dials[status] = (bar.dials[status] || 0) + other.dials[i];
+            bar.total += other.dials[i];
+            if (status === 'Application Submitted') {
+                bar.submitted += other.dials[i];
+            }
+        }
+    }
+    bar.rate = formatRate(bar.submitted, bar.total);
+    return bar;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    cutoff: {
+        apply_cutoff: function(stored, cutoff) {
+            if (!stored) {
+                return window.dash_clientside.no_update;
+            }
+            var figure = stored.figure;
+            if (!figure || !figure.data) {
+                return figure || {};
+            }
+
+            cutoff = cutoff || 0;
+            var other = otherBar(stored.other, cutoff);
+            var label = stored.other ? stored.other.label : null;
+
+            var data = [];
+            figure.data.forEach(function(trace, t) {
+                var horizontal = trace.orientation === 'h';
+                var categories = horizontal ? trace.y : trace.x;
+                var values = horizontal ? trace.x : trace.y;
+                var totals = stored.group_dials[t] || [];
+                var kept = {categories: [], values: [], hovertext: []};
+
+                for (var i = 0; i < categories.length; i++) {
+                    if (categories[i] === label) {
+                        if (other.dials[trace.name]) {
+                            kept.categories.push(label);
+                            kept.values.push(other.dials[trace.name]);
+                            kept.hovertext.push(other.rate);
+                        }
+                    } else if (totals[i] > cutoff) {
+                        kept.categories.push(categories[i]);
+                        kept.values.push(values[i]);
+                        kept.hovertext.push(trace.hovertext[i]);
+                    }
+                }
+
+                if (kept.categories.length) {
+                    data.push(Object.assign({}, trace, {
+                        x: horizontal ? kept.values : kept.categories,
+                        y: horizontal ? kept.categories : kept.values,
+                        hovertext: kept.hovertext
+                    }));
+                }
+            });
+
+            // views.category_axis only forces a category axis while an 'Other' bar is shown
+            var layout = figure.layout;
+            if (label && !other.total && layout.yaxis && layout.yaxis.type === 'category') {
+                var yaxis = Object.assign({}, layout.yaxis);
+                delete yaxis.type;
+                layout = Object.assign({}, layout, {yaxis: yaxis});
+            }
+
+            return Object.assign({}, figure, {data: data, layout: layout});
+        }
+    }
+});
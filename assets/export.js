@@ -0,0 +1,39 @@
+// Href of the export button, built in the browser from the filters, the export
+// choice and format and the cutoff sliders, so that dragging a slider sends no
+// request. The query string is the one app.export reads.
+
+// Cutoff slider argument of each chart aggregate that has one, in the order of
+// app.CUTOFF_SLIDERS (Fig 3, class codes, insurer groups)
+var EXPORT_CUTOFF_SLIDERS = {
+    dials_by_call_number: 0,
+    dials_by_class_code: 1,
+    dials_by_insurer_group: 2
+};
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    export: {
+        export_href: function(startDate, endDate, classCode, salesRep, what, exportFormat,
+                              cutoffFig3, cutoffClassCode, cutoffInsurance, path) {
+            var query = new URLSearchParams();
+            query.append('what', what);
+            query.append('format', exportFormat);
+            [['start_date', startDate], ['end_date', endDate]].forEach(function(pair) {
+                if (pair[1]) {
+                    query.append(pair[0], pair[1]);
+                }
+            });
+            [['class_code', classCode], ['sales_rep', salesRep]].forEach(function(pair) {
+                var values = Array.isArray(pair[1]) ? pair[1] : (pair[1] ? [pair[1]] : []);
+                values.forEach(function(value) {
+                    query.append(pair[0], value);
+                });
+            });
+            if (what in EXPORT_CUTOFF_SLIDERS) {
+                var cutoffs = [cutoffFig3, cutoffClassCode, cutoffInsurance];
+                query.append('cutoff', cutoffs[EXPORT_CUTOFF_SLIDERS[what]] || 0);
+            }
+
+            return path + '?' + query.toString();
+        }
+    }
+});
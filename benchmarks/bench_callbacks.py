@@ -0,0 +1,199 @@
+# Offline benchmark of the dashboard callbacks on synthetic data. Run from the
+# repository root:
+#
+#   python -m benchmarks.bench_callbacks --rows 100000 1000000 10000000 --output bench.json
+#   python -m benchmarks.bench_callbacks --rows 1000000 --baseline bench.json
+#
+# The second form exits non-zero when a callback's p50 is slower than the baseline
+# by more than --tolerance.
+import argparse
+import gc
+import json
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.synthetic import generate_engagements
+from benchmarks.synthetic import generate_sdr_options
+from datastore import build_snapshot
+from engagements import filter_key
+from figures import payload_bytes
+from instrumentation import configure_logging
+from query_engine import frame_cache
+from views import build_class_code_table
+from views import build_fig0
+from views import build_fig1
+from views import build_fig2
+from views import build_cutoff_store
+from views import build_rep_leaderboard
+from views import build_total_table
+
+# Each callback's logic as the Dash callbacks run it. Fig 3-5 are sent once per
+# filter change and cut by their sliders in the browser, so no cutoff reaches the server.
+CALLBACKS = [('fig0', build_fig0),
+                ('fig1', build_fig1),
+                ('fig2', build_fig2),
+                ('fig3_store', lambda data, key: build_cutoff_store(data, key, 'fig3')),
+                ('fig4_store', lambda data, key: build_cutoff_store(data, key, 'fig4')),
+                ('fig5_store', lambda data, key: build_cutoff_store(data, key, 'fig5')),
+                ('class_code_table', build_class_code_table),
+                ('total_table', build_total_table),
+                ('rep_leaderboard', build_rep_leaderboard)]
+
+# Typical filter combinations: (name, start_date, end_date, class_code, sales_rep).
+# None entries are filled from the data: the busiest class code and rep, and dates
+# relative to the last activity_date.
+SCENARIOS = [('all', None, None, 'ALL', 'ALL'),
+                ('last_90_days', -90, None, 'ALL', 'ALL'),
+                ('one_class_code', None, None, 'top', 'ALL'),
+                ('one_rep', None, None, 'ALL', 'top'),
+                ('rep_last_30_days', -30, None, 'ALL', 'top')]
+
+def scenario_keys(engagements):
+    last_day = engagements['activity_date'].max().normalize()
+    top_class_code = engagements['governing_class_code'].value_counts().index[0]
+    top_rep = engagements['updated_by'].value_counts().index[0]
+
+    keys = []
+    for name, start, end, class_code, sales_rep in SCENARIOS:
+        start_date = None if start is None else (last_day + np.timedelta64(start, 'D')).date().isoformat()
+        keys.append((name, filter_key(start_date, end,
+                                        top_class_code if class_code == 'top' else class_code,
+                                        top_rep if sales_rep == 'top' else sales_rep)))
+    return keys
+
+# Build and JSON-encode one output, as Dash does before sending it
+def run_callback(func, data, key):
+    return payload_bytes(func(data, key))
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return {'p50_ms': round(float(np.percentile(samples, 50)), 3),
+            'p95_ms': round(float(np.percentile(samples, 95)), 3),
+            'p99_ms': round(float(np.percentile(samples, 99)), 3),
+            'max_ms': round(float(samples.max()), 3),
+            'samples': len(samples)}
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+# Time every callback for every scenario. 'cold' runs start from an empty frame
+# cache, as the first request after a filter change does; 'warm' runs repeat them
+# with the cache filled, as the other outputs see it.
+def bench_scale(rows, repeats, seed, trace_memory):
+    started = time.perf_counter()
+    engagements = generate_engagements(rows, seed=seed)
+    generated = time.perf_counter() - started
+
+    started = time.perf_counter()
+    data = build_snapshot(engagements, generate_sdr_options())
+    snapshot_seconds = time.perf_counter() - started
+
+    timings = {}
+    memory = {}
+    payload = {}
+
+    for scenario, key in scenario_keys(engagements):
+        for name, func in CALLBACKS:
+            for mode in ['cold', 'warm']:
+                samples = timings.setdefault((name, mode), [])
+                for _ in range(repeats):
+                    if mode == 'cold':
+                        frame_cache.clear()
+                    started = time.perf_counter()
+                    payload[name] = run_callback(func, data, key)
+                    samples.append(time.perf_counter() - started)
+
+            if trace_memory:
+                frame_cache.clear()
+                gc.collect()
+                tracemalloc.start()
+                run_callback(func, data, key)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                memory[name] = max(memory.get(name, 0), peak)
+
+    callbacks = {}
+    for (name, mode), samples in sorted(timings.items()):
+        callbacks.setdefault(name, {'payload_bytes': payload[name]})[mode] = percentiles(samples)
+        if name in memory:
+            callbacks[name]['peak_traced_mb'] = round(memory[name] / 1024 ** 2, 2)
+
+    return {'rows': rows,
+            'leads': int(engagements['lead_id'].iloc[-1]) + 1,
+            'frame_mb': round(engagements.memory_usage(deep=True).sum() / 1024 ** 2, 1),
+            'generate_seconds': round(generated, 2),
+            'snapshot_seconds': round(snapshot_seconds, 2),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'callbacks': callbacks}
+
+def print_report(result):
+    print('\n{:,} rows, {:,} leads, frame {} MB, snapshot built in {}s, peak RSS {} MB'.format(
+        result['rows'], result['leads'], result['frame_mb'], result['snapshot_seconds'], result['peak_rss_mb']))
+    print('{:<18}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>12}'.format(
+        'callback', 'cold p50', 'cold p95', 'cold p99', 'warm p50', 'warm p95', 'warm p99', 'peak MB'))
+    for name, stats in result['callbacks'].items():
+        print('{:<18}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>12}'.format(
+            name, stats['cold']['p50_ms'], stats['cold']['p95_ms'], stats['cold']['p99_ms'],
+            stats['warm']['p50_ms'], stats['warm']['p95_ms'], stats['warm']['p99_ms'],
+            stats.get('peak_traced_mb', '-')))
+
+# Regressions against an earlier --output file: callbacks whose p50 grew by more
+# than `tolerance` (as a fraction) at the same scale
+def regressions(results, baseline, tolerance):
+    previous = {result['rows']: result for result in baseline}
+    found = []
+
+    for result in results:
+        if result['rows'] not in previous:
+            continue
+        for name, stats in result['callbacks'].items():
+            before = previous[result['rows']]['callbacks'].get(name)
+            if before is None:
+                continue
+            for mode in ['cold', 'warm']:
+                old, new = before[mode]['p50_ms'], stats[mode]['p50_ms']
+                if new > old * (1 + tolerance):
+                    found.append('{:,} rows {} {}: p50 {} ms -> {} ms'.format(result['rows'], name, mode, old, new))
+
+    return found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the dashboard callbacks on synthetic engagements.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000],
+                        help='dataset sizes in dials, e.g. 100000 1000000 10000000 50000000')
+    parser.add_argument('--repeats', type=int, default=5, help='runs per callback, scenario and mode')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='also record each callback\'s peak allocation with tracemalloc (slower)')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    parser.add_argument('--baseline', help='results JSON of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed p50 slowdown against the baseline, as a fraction')
+    args = parser.parse_args()
+
+    configure_logging('WARNING')
+
+    # Peak RSS only grows, so sizes run smallest first and each one reports the
+    # peak up to and including itself
+    results = []
+    for rows in sorted(args.rows):
+        results.append(bench_scale(rows, args.repeats, args.seed, args.trace_memory))
+        print_report(results[-1])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print('REGRESSION ' + line)
+        sys.exit(1 if found else 0)
@@ -0,0 +1,494 @@
+# Concurrent load test of the dashboard's Dash callback endpoints. Starts app.py on
+# synthetic data (or targets a running server with --url), simulates dashboard users
+# that load the page and then change the date range, pick dropdown values, drag the
+# cutoff sliders and page the class code table, sending the _dash-update-component
+# requests the Dash renderer would send, and reports throughput, p50/p95/p99 latency
+# per callback output and the server processes' CPU and RSS. Run from the repository
+# root:
+#
+#   python -m benchmarks.load_test --rows 1000000 --users 1 4 16 --duration 60 --output load.json
+#   CONSOLIDATED_CALLBACKS=1 AGGREGATION_PROCESSES=4 python -m benchmarks.load_test --rows 1000000 --users 16
+#   python -m benchmarks.load_test --url http://127.0.0.1:8050 --server-pid 1234 --users 8
+#
+# The server inherits the environment, so its settings are compared by exporting them.
+# --server-cmd runs another server (e.g. gunicorn with a wsgi module); {host} and
+# {port} in it are filled in. CPU and RSS are read with psutil when it is installed,
+# else from /proc on Linux.
+import argparse
+import importlib.util
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+
+from benchmarks.bench_callbacks import percentiles
+from benchmarks.synthetic import generate_engagements
+from benchmarks.synthetic import write_sdr
+from engagements import save_engagements
+
+# How often a simulated user does each action between think times
+ACTIONS = {'date_range': 0.35, 'class_code': 0.2, 'sales_rep': 0.2, 'slider': 0.15, 'table_page': 0.1}
+
+# Requests a browser sends to one host at once
+BROWSER_CONNECTIONS = 6
+
+# Cookie the server uses to cancel a session's superseded aggregations
+SESSION_COOKIE = 'dashboard_session'
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Synthetic engagements and SDR sheet in `directory`, and the environment that points
+# the server at them
+def prepare_data(rows, directory, seed, start_date, days):
+    engagements_path = os.path.join(directory, 'engagements.feather')
+    sdr_path = os.path.join(directory, 'SDR.xls')
+    save_engagements(generate_engagements(rows, seed=seed, start_date=start_date, days=days), engagements_path)
+    write_sdr(sdr_path)
+
+    return {'ENGAGEMENTS_PATH': engagements_path,
+            'SDR_PATH': sdr_path,
+            'ENGAGEMENTS_OPTIONS_CACHE': os.path.join(directory, 'engagements.options.json'),
+            'ENGAGEMENTS_REFRESH_SECONDS': '0'}
+
+def start_server(server_cmd, env, host, port):
+    if server_cmd:
+        cmd = shlex.split(server_cmd.format(host=host, port=port))
+    else:
+        cmd = [sys.executable, '-c',
+                'import app; app.app.run_server(host={!r}, port={}, debug=False)'.format(host, port)]
+
+    return subprocess.Popen(cmd, cwd=REPO_ROOT, env=dict(os.environ, **env))
+
+# Wait for /ready, i.e. the data loaded and the response cache warmed
+def wait_ready(url, process, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError('Server exited with code {}'.format(process.returncode))
+        try:
+            if requests.get(url + '/ready', timeout=5).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+
+    raise RuntimeError('Server not ready after {}s'.format(timeout))
+
+
+# CPU and RSS of the server process and its children (workers, aggregation pool),
+# sampled every `interval` seconds while the load runs
+class ResourceSampler:
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []  # (time, {pid: (cpu_seconds, rss_bytes)})
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def available():
+        return importlib.util.find_spec('psutil') is not None or os.path.isdir('/proc/self')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.samples.append((time.perf_counter(), self.measure()))
+            self._stop.wait(self.interval)
+
+    def measure(self):
+        if importlib.util.find_spec('psutil') is not None:
+            return self._measure_psutil()
+
+        return self._measure_proc()
+
+    def _measure_psutil(self):
+        import psutil
+
+        usage = {}
+        try:
+            root = psutil.Process(self.pid)
+            for process in [root] + root.children(recursive=True):
+                try:
+                    times = process.cpu_times()
+                    usage[process.pid] = (times.user + times.system, process.memory_info().rss)
+                except psutil.NoSuchProcess:
+                    pass
+        except psutil.NoSuchProcess:
+            pass
+
+        return usage
+
+    def _measure_proc(self):
+        parents = {}
+        for name in os.listdir('/proc'):
+            if name.isdigit():
+                stat = _read_proc_stat(name)
+                if stat is not None:
+                    parents[int(name)] = stat
+
+        tree, frontier = [self.pid], [self.pid]
+        while frontier:
+            frontier = [pid for pid, stat in parents.items() if stat[0] in frontier]
+            tree.extend(frontier)
+
+        ticks = os.sysconf('SC_CLK_TCK')
+        page = os.sysconf('SC_PAGE_SIZE')
+
+        return {pid: (parents[pid][1] / ticks, parents[pid][2] * page) for pid in tree if pid in parents}
+
+    # Per process: mean and peak CPU (percent of one core) and peak RSS, plus the sums
+    def report(self):
+        if len(self.samples) < 2:
+            return None
+
+        processes = {}
+        totals = []
+        for (t0, before), (t1, after) in zip(self.samples, self.samples[1:]):
+            cpu_total = rss_total = 0.0
+            for pid, (cpu, rss) in after.items():
+                percent = 100.0 * max(cpu - before[pid][0], 0.0) / (t1 - t0) if pid in before else 0.0
+                stats = processes.setdefault(pid, {'cpu': [], 'rss': []})
+                stats['cpu'].append(percent)
+                stats['rss'].append(rss)
+                cpu_total += percent
+                rss_total += rss
+            totals.append((cpu_total, rss_total))
+
+        def summary(cpu, rss):
+            return {'cpu_mean_percent': round(float(np.mean(cpu)), 1),
+                    'cpu_peak_percent': round(float(np.max(cpu)), 1),
+                    'rss_peak_mb': round(float(np.max(rss)) / 1024 ** 2, 1)}
+
+        return {'total': summary([c for c, _ in totals], [r for _, r in totals]),
+                'processes': {str(pid): summary(stats['cpu'], stats['rss']) for pid, stats in sorted(processes.items())}}
+
+# (parent pid, cpu ticks, rss pages) from /proc/<pid>/stat
+def _read_proc_stat(pid):
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (OSError, IndexError):
+        return None
+
+    return int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[21])
+
+
+# Every component prop in a Dash layout, by (id, prop)
+def layout_props(component, props=None):
+    props = {} if props is None else props
+    if isinstance(component, list):
+        for child in component:
+            layout_props(child, props)
+    elif isinstance(component, dict) and 'props' in component:
+        component_id = component['props'].get('id')
+        for name, value in component['props'].items():
+            if component_id is not None and name != 'children':
+                props[(component_id, name)] = value
+        layout_props(component['props'].get('children'), props)
+
+    return props
+
+# Outputs of a callback as (id, prop) pairs from its dependency's output string
+def output_props(output):
+    parts = output[2:-2].split('...') if output.startswith('..') else [output]
+
+    return [tuple(part.rsplit('.', 1)) for part in parts]
+
+# Name of a callback in the report: its first output, with the number of others
+def callback_name(output):
+    outputs = output_props(output)
+    name = '.'.join(outputs[0])
+
+    return name if len(outputs) == 1 else '{}+{}'.format(name, len(outputs) - 1)
+
+
+# One simulated user: the browser-side props of the page, and the server callbacks it
+# triggers when a prop changes, sent BROWSER_CONNECTIONS at a time
+class SimulatedUser:
+
+    def __init__(self, url, rng, record, start_date, days):
+        self.url = url
+        self.rng = rng
+        self.record = record
+        self.start_date = pd.Timestamp(start_date)
+        self.days = days
+        self.cookies = {SESSION_COOKIE: uuid.uuid4().hex}
+        self.sessions = threading.local()
+        self.pool = ThreadPoolExecutor(BROWSER_CONNECTIONS)
+        self.props = {}
+        self.callbacks = []
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def session(self):
+        if not hasattr(self.sessions, 'session'):
+            self.sessions.session = requests.Session()
+        return self.sessions.session
+
+    def get(self, path, name):
+        started = time.perf_counter()
+        response = self.session().get(self.url + path, cookies=self.cookies, timeout=300)
+        self.record(name, started, time.perf_counter() - started, response.status_code)
+        return response
+
+    # The page, its layout and callbacks, then every server callback as on first render
+    def load_page(self):
+        self.get('/', 'page')
+        self.props = layout_props(self.get('/_dash-layout', 'layout').json())
+        self.callbacks = [callback for callback in self.get('/_dash-dependencies', 'dependencies').json()
+                            if not callback.get('clientside_function')]
+        self.fire(None)
+
+    # Send the callbacks with an input among `changed` (all of them for None), then
+    # those triggered by their outputs, like the renderer's callback chain
+    def fire(self, changed):
+        while changed is None or changed:
+            batch = [callback for callback in self.callbacks
+                        if changed is None or any((i['id'], i['property']) in changed for i in callback['inputs'])]
+            responses = list(self.pool.map(lambda callback: self.update(callback, changed or set()), batch))
+
+            changed = set()
+            for callback, outputs in zip(batch, responses):
+                for prop, value in outputs.items():
+                    self.props[prop] = value
+                    changed.add(prop)
+
+    def update(self, callback, changed):
+        inputs = [{'id': i['id'], 'property': i['property'], 'value': self.props.get((i['id'], i['property']))}
+                    for i in callback['inputs']]
+        outputs = [{'id': component_id, 'property': prop} for component_id, prop in output_props(callback['output'])]
+        payload = {'output': callback['output'],
+                    'outputs': outputs if len(outputs) > 1 else outputs[0],
+                    'inputs': inputs,
+                    'state': [{'id': s['id'], 'property': s['property'], 'value': self.props.get((s['id'], s['property']))}
+                                for s in callback['state']],
+                    'changedPropIds': ['{}.{}'.format(i['id'], i['property']) for i in inputs
+                                        if (i['id'], i['property']) in changed]}
+
+        started = time.perf_counter()
+        try:
+            response = self.session().post(self.url + '/_dash-update-component', json=payload,
+                                            cookies=self.cookies, timeout=300)
+        except requests.RequestException:
+            self.record(callback_name(callback['output']), started, time.perf_counter() - started, None)
+            return {}
+        self.record(callback_name(callback['output']), started, time.perf_counter() - started, response.status_code)
+
+        if response.status_code != 200:
+            return {}
+        return {(component_id, prop): value for component_id, values in response.json()['response'].items()
+                for prop, value in values.items()}
+
+    def option_values(self, dropdown):
+        return [option['value'] for option in self.props.get((dropdown, 'options')) or [] if option['value'] != 'ALL']
+
+    # A window of 7 to 180 days, or no date filter
+    def date_range(self):
+        if self.rng.random() < 0.1:
+            return {('my-date-picker-range', 'start_date'): None, ('my-date-picker-range', 'end_date'): None}
+
+        length = int(self.rng.integers(7, min(180, self.days) + 1))
+        start = self.start_date + pd.Timedelta(days=int(self.rng.integers(0, max(self.days - length, 1))))
+
+        return {('my-date-picker-range', 'start_date'): start.date().isoformat(),
+                ('my-date-picker-range', 'end_date'): (start + pd.Timedelta(days=length)).date().isoformat()}
+
+    # One value, a few values of a multi-select, or cleared
+    def dropdown(self, dropdown):
+        values = self.option_values(dropdown)
+        draw = self.rng.random()
+        if not values or draw < 0.2:
+            return {(dropdown, 'value'): None}
+        if draw < 0.8:
+            return {(dropdown, 'value'): [values[int(self.rng.integers(len(values)))]]}
+
+        picks = self.rng.choice(len(values), min(3, len(values)), replace=False)
+        return {(dropdown, 'value'): [values[i] for i in sorted(picks)]}
+
+    # A slider dragged across a few of its marks, one update per mark
+    def slider_drag(self):
+        sliders = sorted({component_id for component_id, prop in self.props
+                            if prop == 'marks' and 'slider' in component_id})
+        if not sliders:
+            return []
+
+        slider = sliders[int(self.rng.integers(len(sliders)))]
+        marks = sorted(int(mark) for mark in self.props[(slider, 'marks')])
+        start = int(self.rng.integers(len(marks)))
+        path = marks[start:start + int(self.rng.integers(2, 5))]
+
+        return [{(slider, 'value'): mark} for mark in path]
+
+    def table_page(self):
+        page_count = self.props.get(('governing-class-code-table', 'page_count')) or 1
+
+        return {('governing-class-code-table', 'page_current'): int(self.rng.integers(page_count))}
+
+    def act(self):
+        action = self.rng.choice(list(ACTIONS), p=np.array(list(ACTIONS.values())) / sum(ACTIONS.values()))
+        if action == 'date_range':
+            steps = [self.date_range()]
+        elif action == 'class_code':
+            steps = [self.dropdown('class_code_dropdown')]
+        elif action == 'sales_rep':
+            steps = [self.dropdown('sales_rep_dropdown')]
+        elif action == 'slider':
+            steps = self.slider_drag()
+        else:
+            steps = [self.table_page()]
+
+        for step in steps:
+            self.props.update(step)
+            self.fire(set(step))
+
+    def run(self, stop, think_seconds):
+        self.load_page()
+        while not stop.is_set():
+            if stop.wait(self.rng.exponential(think_seconds) if think_seconds > 0 else 0):
+                break
+            self.act()
+
+
+# Run `users` simulated users for `duration` seconds after `ramp` seconds of staggered
+# starts; only requests started after the ramp are reported
+def run_load(url, users, duration, ramp, think_seconds, seed, start_date, days, server_pid):
+    records = []
+    stop = threading.Event()
+
+    def record(name, started, seconds, status):
+        records.append((name, started, seconds, status))
+
+    simulated = [SimulatedUser(url, np.random.default_rng(seed + i), record, start_date, days) for i in range(users)]
+    errors = []
+
+    def run_user(user, delay):
+        if not stop.wait(delay):
+            try:
+                user.run(stop, think_seconds)
+            except Exception as e:
+                errors.append(repr(e))
+        user.close()
+
+    threads = [threading.Thread(target=run_user, args=(user, ramp * i / max(users, 1)), daemon=True)
+                for i, user in enumerate(simulated)]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(ramp)
+    sampler = ResourceSampler(server_pid) if server_pid and ResourceSampler.available() else None
+    if sampler is not None:
+        sampler.start()
+    measured_from = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    measured = time.perf_counter() - measured_from
+    if sampler is not None:
+        sampler.stop()
+
+    window = [r for r in records if r[1] >= measured_from]
+    outputs = {}
+    for name, _, seconds, status in window:
+        stats = outputs.setdefault(name, {'samples': [], 'errors': 0})
+        stats['samples'].append(seconds)
+        stats['errors'] += status is None or status >= 400
+
+    return {'users': users,
+            'seconds': round(measured, 1),
+            'requests': len(window),
+            'errors': sum(stats['errors'] for stats in outputs.values()),
+            'throughput_rps': round(len(window) / measured, 2),
+            'user_errors': errors,
+            'outputs': {name: dict(percentiles(stats['samples']), errors=stats['errors'])
+                        for name, stats in sorted(outputs.items())},
+            'server': sampler.report() if sampler is not None else None}
+
+def print_report(result):
+    print('\n{} users: {:,} requests in {}s, {} req/s, {} errors'.format(
+        result['users'], result['requests'], result['seconds'], result['throughput_rps'], result['errors']))
+    for error in result['user_errors']:
+        print('  user failed: {}'.format(error))
+    print('{:<60}{:>9}{:>10}{:>10}{:>10}{:>8}'.format('output', 'requests', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for name, stats in result['outputs'].items():
+        print('{:<60}{:>9}{:>10}{:>10}{:>10}{:>8}'.format(
+            name[:59], stats['samples'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['errors']))
+
+    server = result['server']
+    if server is not None:
+        print('server: CPU mean {}% peak {}%, RSS peak {} MB ({} processes)'.format(
+            server['total']['cpu_mean_percent'], server['total']['cpu_peak_percent'],
+            server['total']['rss_peak_mb'], len(server['processes'])))
+        for pid, stats in server['processes'].items():
+            print('  pid {:<8} CPU mean {:>6}% peak {:>6}%  RSS peak {:>8} MB'.format(
+                pid, stats['cpu_mean_percent'], stats['cpu_peak_percent'], stats['rss_peak_mb']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load-test the dashboard callbacks with simulated users.')
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 4, 16],
+                        help='simulated users, one run per value')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds per run')
+    parser.add_argument('--ramp', type=float, default=5, help='seconds over which the users start, not measured')
+    parser.add_argument('--think', type=float, default=1.0, help='mean seconds between a user\'s actions, 0 for none')
+    parser.add_argument('--rows', type=int, default=1000000, help='synthetic dials for the started server')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start-date', default='2020-01-01', help='first activity_date of the data')
+    parser.add_argument('--days', type=int, default=365, help='days of activity in the data')
+    parser.add_argument('--url', help='load an already running server instead of starting one')
+    parser.add_argument('--server-pid', type=int, help='process to sample CPU and RSS of with --url')
+    parser.add_argument('--server-cmd', help='command starting the server, with {host} and {port} placeholders')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8051)
+    parser.add_argument('--ready-timeout', type=float, default=600, help='seconds to wait for /ready')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    args = parser.parse_args()
+
+    directory = process = None
+    url, server_pid = args.url, args.server_pid
+    try:
+        if url is None:
+            directory = tempfile.mkdtemp(prefix='dashboard-load-')
+            print('Generating {:,} synthetic dials in {}'.format(args.rows, directory))
+            env = prepare_data(args.rows, directory, args.seed, args.start_date, args.days)
+            process = start_server(args.server_cmd, env, args.host, args.port)
+            url, server_pid = 'http://{}:{}'.format(args.host, args.port), process.pid
+        url = url.rstrip('/')
+        wait_ready(url, process, args.ready_timeout)
+
+        results = []
+        for users in args.users:
+            results.append(run_load(url, users, args.duration, args.ramp, args.think, args.seed,
+                                    args.start_date, args.days, server_pid))
+            print_report(results[-1])
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,124 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from engagements import FLAG_COLUMNS
+from engagements import MONTHS
+from engagements import normalize_schema
+from engagements import save_engagements
+from engagements import sort_by_lead
+
+# Lead statuses and their share of dials
+LEAD_STATUSES = {'New': 0.18,
+                    'Attempting Contact': 0.30,
+                    'Connected': 0.17,
+                    'DM Reached': 0.12,
+                    'App Started': 0.06,
+                    'Application Submitted': 0.05,
+                    'Lost': 0.12}
+
+INSURER_GROUPS = ['', 'AmTrust Group', 'Berkshire Hathaway', 'Chubb', 'CNA', 'Employers Holdings',
+                    'Hartford', 'Liberty Mutual', 'Nationwide', 'Travelers', 'Zurich']
+
+# Zipf-like weights so a few class codes / insurers / reps carry most dials, like
+# the real data
+def skewed_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+def sdr_hashes(count):
+    return ['{:08x}'.format(0x9e3779b1 * (i + 1) & 0xffffffff) for i in range(count)]
+
+# Synthetic engagements frame with the columns the callbacks use, in the normalised
+# schema and sort_by_lead order. Leads keep one class code, insurer, rep and
+# effective month across their dials; activity dates are spread over `days` days
+# from start_date.
+def generate_engagements(rows, seed=0, dials_per_lead=6, class_codes=400, insurer_groups=40, reps=24,
+                            start_date='2020-01-01', days=365):
+    rng = np.random.default_rng(seed)
+    leads = max(rows // dials_per_lead, 1)
+
+    lead_codes = np.sort(rng.integers(0, leads, rows))
+    used_leads, lead_ids = np.unique(lead_codes, return_inverse=True)
+    lead_names = np.array(['L{:09d}'.format(lead) for lead in used_leads], dtype=object)
+
+    class_code_names = np.array(sorted({'{:04d}'.format(code) for code in rng.integers(1000, 10000, class_codes * 2)})[:class_codes], dtype=object)
+    insurer_names = np.array((INSURER_GROUPS + ['Insurer Group {:03d}'.format(i) for i in range(insurer_groups)])[:insurer_groups], dtype=object)
+    rep_names = np.array(sdr_hashes(reps), dtype=object)
+
+    # Per-lead attributes, broadcast to the lead's dials
+    lead_class_code = rng.choice(len(class_code_names), len(used_leads), p=skewed_weights(len(class_code_names)))
+    lead_insurer = rng.choice(len(insurer_names), len(used_leads), p=skewed_weights(len(insurer_names)))
+    lead_rep = rng.choice(len(rep_names), len(used_leads), p=skewed_weights(len(rep_names), 0.5))
+    lead_month = rng.integers(0, len(MONTHS), len(used_leads))
+
+    # Dials of a lead are in date order, as the table is built from the call log
+    seconds = rng.integers(0, days * 24 * 3600, rows)
+    order = np.lexsort((seconds, lead_ids))
+    seconds = seconds[order]
+    activity_date = np.datetime64(start_date, 's') + seconds.astype('timedelta64[s]')
+
+    statuses = np.array(list(LEAD_STATUSES), dtype=object)
+    status = rng.choice(len(statuses), rows, p=np.array(list(LEAD_STATUSES.values())) / sum(LEAD_STATUSES.values()))
+
+    df = pd.DataFrame({
+        'lead': lead_names[lead_ids],
+        'activity_date': pd.to_datetime(activity_date),
+        'effective_month': pd.Categorical.from_codes(lead_month[lead_ids], categories=MONTHS, ordered=True),
+        'lead_status': pd.Categorical.from_codes(status, categories=statuses),
+        'call_number': np.minimum(rng.geometric(0.2, rows), 60).astype(np.int16),
+        'governing_class_code': pd.Categorical.from_codes(lead_class_code[lead_ids], categories=class_code_names),
+        'updated_by': pd.Categorical.from_codes(lead_rep[lead_ids], categories=rep_names),
+        'current_coverage_insurers_group_name': pd.Categorical.from_codes(lead_insurer[lead_ids], categories=insurer_names),
+    })
+
+    status_name = statuses[status]
+    flags = {'is_lead': np.ones(rows, dtype=np.int8),
+                'is_active': status_name != 'Lost',
+                'lost': status_name == 'Lost',
+                'call_connected': rng.random(rows) < 0.35,
+                'dm_reached': rng.random(rows) < 0.15,
+                'app_started': np.isin(status_name, ['App Started', 'Application Submitted']),
+                'app_submitted': status_name == 'Application Submitted'}
+    for col in FLAG_COLUMNS:
+        df[col] = flags[col].astype(np.int8)
+
+    df['lead_id'] = lead_ids.astype(np.int32)
+
+    return sort_by_lead(normalize_schema(df))
+
+# SDR options as load_sdr_options reads them from SDR.xls
+def generate_sdr_options(reps=24):
+    return [{'label': 'Rep {:02d}'.format(i), 'value': rep} for i, rep in enumerate(sdr_hashes(reps))] + \
+            [{'label': 'ALL', 'value': 'ALL'}]
+
+# Write an SDR.xls sheet (hash, name) for the synthetic reps. Needs xlwt.
+def write_sdr(path, reps=24):
+    import xlwt
+
+    book = xlwt.Workbook()
+    sheet = book.add_sheet('Sheet1')
+    for i, option in enumerate(generate_sdr_options(reps)[:-1]):
+        sheet.write(i, 0, option['value'])
+        sheet.write(i, 1, option['label'].lower())
+    book.save(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic engagements file (and SDR.xls) for benchmarks.')
+    parser.add_argument('rows', type=int, help='number of dials, e.g. 100000 to 50000000')
+    parser.add_argument('destination', help='.feather/.arrow/.ipc, .parquet/.pq, or a pickle path')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--reps', type=int, default=24)
+    parser.add_argument('--sdr', help='also write the SDR sheet to this .xls path (needs xlwt)')
+    args = parser.parse_args()
+
+    df = generate_engagements(args.rows, seed=args.seed, reps=args.reps)
+    save_engagements(df, args.destination)
+    print('Wrote {:,} rows ({:,} leads) to {}'.format(len(df), df['lead_id'].iloc[-1] + 1, os.path.abspath(args.destination)))
+
+    if args.sdr:
+        write_sdr(args.sdr, reps=args.reps)
+        print('Wrote {} reps to {}'.format(args.reps, os.path.abspath(args.sdr)))
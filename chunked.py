@@ -0,0 +1,431 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from aggregates import add_group_dials
+from engagements import CATEGORY_COLUMNS
+from engagements import ENGAGEMENT_COLUMNS
+from engagements import FEATHER_SUFFIXES
+from engagements import FLAG_COLUMNS
+from engagements import MONTHS
+from engagements import PARQUET_SUFFIXES
+from engagements import filter_engagements
+from engagements import filter_key
+from partitions import PartitionCatalog
+from partitions import is_partitioned
+from partitions import load_partitioned
+import query_engine
+from query_engine import CLASS_CODE_OUTCOMES
+from query_engine import call_number_dials
+from query_engine import class_code_dials
+from query_engine import class_code_outcomes
+from query_engine import class_code_table
+from query_engine import insurer_group_dials
+from query_engine import month_lead_totals
+from query_engine import month_status_dial_rates
+from query_engine import month_status_lead_rates
+from query_engine import rep_table
+from query_engine import totals_table
+from rollup import CUBE_DIMENSIONS
+
+# Out-of-core versions of the query_engine metrics, for engagement histories larger
+# than memory. A Parquet or Arrow IPC file is read CHUNK_ROWS rows at a time; each
+# chunk is filtered and folded into partial aggregates that merge exactly (dial
+# counts and outcome sums add up, each lead keeps its latest engagement) and the
+# merged partials go through the same query_engine steps as the in-memory path.
+# Memory scales with the number of leads and groups rather than with dials. A
+# date-partitioned directory (partitions.py) can stand in for the file, in which
+# case only the parts overlapping the keys' date ranges are read, e.g.
+#   python chunked.py ./df_engagements_leads.parquet --start 2020-01-01
+# prints every metric for one filter key, and with --check compares them against
+# the in-memory path for a handful of keys.
+
+CHUNK_ROWS = int(os.environ.get('CHUNK_ROWS', 1000000))
+
+# Columns read from the file; lead_id is derived in memory and not needed here
+CHUNK_COLUMNS = [c for c in ENGAGEMENT_COLUMNS if c != 'lead_id']
+
+# Columns of each lead's last engagement used by the lead-based metrics
+LATEST_COLUMNS = ['lead', 'effective_month', 'lead_status', 'governing_class_code',
+                    'is_lead', 'is_active', 'lost', 'app_submitted']
+
+# Key of the per-rep lead partial of the rep leaderboard
+REP_LEAD_KEY = ['lead', 'updated_by']
+
+# Sort key of rows with no activity_date: sort_by_lead puts them after a lead's
+# dated rows, so one of them is the lead's last engagement
+NAT_LAST = np.iinfo(np.int64).max
+
+
+# Chunks of the engagements file as frames with the flag and month dtypes of
+# normalize_schema. String columns are left as read; partials compare them by value.
+def iter_chunks(path, chunk_rows=CHUNK_ROWS, columns=CHUNK_COLUMNS):
+    import pyarrow as pa
+
+    suffix = os.path.splitext(path)[1].lower()
+
+    if suffix in PARQUET_SUFFIXES:
+        import pyarrow.parquet as pq
+
+        source = pq.ParquetFile(path, memory_map=True)
+        names = [c for c in columns if c in source.schema_arrow.names]
+        batches = source.iter_batches(batch_size=chunk_rows, columns=names)
+    elif suffix in FEATHER_SUFFIXES:
+        reader = pa.ipc.open_file(pa.memory_map(path))
+        names = [c for c in columns if c in reader.schema.names]
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    else:
+        raise ValueError('Chunked reads need a Parquet or Arrow IPC file: {}'.format(path))
+
+    pending, rows = [], 0
+    for batch in batches:
+        pending.append(batch)
+        rows += batch.num_rows
+
+        if rows >= chunk_rows:
+            yield prepare_chunk(pa.Table.from_batches(pending).select(names).to_pandas())
+            pending, rows = [], 0
+
+    if pending:
+        yield prepare_chunk(pa.Table.from_batches(pending).select(names).to_pandas())
+
+# A chunk with no rows and the file's columns, for keys that match no chunk at all
+def empty_chunk(path, columns=CHUNK_COLUMNS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if os.path.splitext(path)[1].lower() in PARQUET_SUFFIXES:
+        schema = pq.read_schema(path)
+    else:
+        schema = pa.ipc.open_file(pa.memory_map(path)).schema
+
+    names = [c for c in columns if c in schema.names]
+    return prepare_chunk(schema.empty_table().select(names).to_pandas())
+
+def prepare_chunk(df):
+    for col in FLAG_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].fillna(0).astype(np.int8)
+
+    df['effective_month'] = pd.Categorical(df['effective_month'], categories=MONTHS, ordered=True)
+
+    return df
+
+# String columns as plain values, so that partials from chunks with different
+# categories concatenate and group by value
+def _as_values(df):
+    return df.astype({col: object for col in CATEGORY_COLUMNS + ['lead'] if col in df.columns})
+
+# String columns back to categoricals with sorted categories, as normalize_schema
+# leaves them, for the query_engine steps that group on them
+def _as_categories(df):
+    return df.astype({col: 'category' for col in CATEGORY_COLUMNS if col in df.columns})
+
+# Sum `values` per `by` over the concatenation of two partial tables
+def _sum_partials(total, part, by, values):
+    part = _as_values(part)
+    if total is not None:
+        part = pd.concat([total, part], ignore_index=True)
+
+    return part.groupby(by, observed=True, sort=True)[values].sum().reset_index()
+
+# Lead candidates of a filtered chunk: every row with its file position and a date
+# key that orders rows the way sort_by_lead does, plus flags for the totals
+def lead_candidates(dff, offset, columns=LATEST_COLUMNS):
+    days = dff['activity_date'].to_numpy().astype('datetime64[ns]').astype(np.int64)
+    days[dff['activity_date'].isna().to_numpy()] = NAT_LAST
+
+    return _as_values(dff[columns]).assign(_day=days,
+                                                    _position=offset + dff.index.to_numpy(),
+                                                    was_active=(dff['is_active'] == 1).to_numpy(),
+                                                    had_app_submitted=(dff['app_submitted'] == 1).to_numpy())
+
+# One row per lead (or per value of the `by` columns) in sorted order: its last
+# candidate by (activity date, file position), with the flags true if any of its
+# candidates had them. Lead order matters: grouping on observed categoricals keeps
+# the order rows appear in.
+def reduce_leads(candidates, by=('lead',)):
+    if not len(candidates):
+        return candidates
+
+    codes = np.zeros(len(candidates), dtype=np.int64)
+    for column in by:
+        column_codes, uniques = pd.factorize(candidates[column], sort=True, use_na_sentinel=False)
+        codes = codes * (len(uniques) + 1) + column_codes
+    order = np.lexsort((candidates['_position'].to_numpy(), candidates['_day'].to_numpy(), codes))
+    codes = codes[order]
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    is_last = np.r_[codes[1:] != codes[:-1], True]
+
+    latest = candidates.iloc[order[is_last]].reset_index(drop=True)
+    for col in ['was_active', 'had_app_submitted']:
+        latest[col] = np.logical_or.reduceat(candidates[col].to_numpy()[order], starts)
+
+    return latest
+
+
+# Partial aggregates of the rows matching one filter key, folded in chunk by chunk
+class PartialAggregates:
+
+    def __init__(self, key):
+        self.key = key
+        self.dials = 0
+        self.counts = dict.fromkeys(CUBE_DIMENSIONS)
+        self.outcomes = None
+        self.rep_dials = None
+        self._leads = None
+        self._rep_leads = None
+        self._pending = []
+        self._rep_pending = []
+        self._pending_rows = 0
+
+    # Fold in a chunk whose first row is at file position `offset`
+    def add(self, chunk, offset):
+        dff = filter_engagements(chunk, self.key)
+        self.dials += len(dff)
+
+        for dimension in CUBE_DIMENSIONS:
+            counts = dff.groupby([dimension, 'lead_status'], observed=True).size().reset_index(name='Dials')
+            self.counts[dimension] = _sum_partials(self.counts[dimension], counts, [dimension, 'lead_status'], ['Dials'])
+
+        self.outcomes = _sum_partials(self.outcomes, class_code_outcomes(dff), ['governing_class_code'], CLASS_CODE_OUTCOMES)
+        self.rep_dials = _sum_partials(self.rep_dials, dff.groupby('updated_by', observed=True).size().reset_index(name='total_dials'),
+                                        ['updated_by'], ['total_dials'])
+
+        # Candidates are reduced once they outnumber the leads kept so far, which
+        # bounds memory to about twice the leads without re-sorting on every chunk
+        self._pending.append(lead_candidates(dff, offset))
+        self._rep_pending.append(lead_candidates(dff, offset, REP_LEAD_KEY))
+        self._pending_rows += len(dff)
+        if self._leads is None or self._pending_rows >= len(self._leads):
+            self._reduce()
+
+    def _reduce(self):
+        frames = ([self._leads] if self._leads is not None else []) + self._pending
+        self._leads = reduce_leads(pd.concat(frames, ignore_index=True))
+        frames = ([self._rep_leads] if self._rep_leads is not None else []) + self._rep_pending
+        self._rep_leads = reduce_leads(pd.concat(frames, ignore_index=True), REP_LEAD_KEY)
+        self._pending, self._rep_pending, self._pending_rows = [], [], 0
+
+    # Each lead's last engagement, like query_engine.latest_engagements
+    def latest(self):
+        if self._pending:
+            self._reduce()
+
+        return _as_categories(self._leads)
+
+    # Each (lead, sales rep) pair's last engagement, with the flags of the rep's dials
+    def rep_leads(self):
+        if self._pending:
+            self._reduce()
+
+        return self._rep_leads
+
+    # Dials per (dimension, lead_status), like the daily cube counts
+    def dial_counts(self, dimension):
+        return _as_categories(self.counts[dimension])
+
+    def class_code_outcomes(self):
+        return _as_categories(self.outcomes)
+
+# Stream the file once and return PartialAggregates for each filter key
+def aggregate(path, keys, chunk_rows=CHUNK_ROWS):
+    partials = {key: PartialAggregates(key) for key in keys}
+    fed = set()
+
+    for source, offset, source_keys in _sources(path, keys):
+        for chunk in iter_chunks(source, chunk_rows):
+            for key in source_keys:
+                partials[key].add(chunk, offset)
+            fed.update(source_keys)
+            offset += len(chunk)
+
+    for key in set(keys) - fed:
+        partials[key].add(empty_chunk(_schema_source(path)), 0)
+
+    return partials
+
+# (file, position of its first row, keys that need it) for a single engagements file
+# or for each part of a partitioned directory. Parts outside every key's date range
+# are never opened; positions count all parts, as load_partitioned concatenates them.
+def _sources(path, keys):
+    if not is_partitioned(path):
+        yield path, 0, list(keys)
+        return
+
+    catalog = PartitionCatalog.read(path)
+    selected = {key: {part['path'] for part in catalog.select(key[0], key[1])} for key in keys}
+    offsets = catalog.offsets()
+
+    for part in catalog.parts:
+        part_keys = [key for key in keys if part['path'] in selected[key]]
+        if part_keys:
+            yield catalog.part_path(part), offsets[part['path']], part_keys
+
+# A file with the columns of `path`, which may be a partitioned directory
+def _schema_source(path):
+    if not is_partitioned(path):
+        return path
+
+    catalog = PartitionCatalog.read(path)
+    if not catalog.parts:
+        raise ValueError('No parts in {}'.format(path))
+
+    return catalog.part_path(catalog.parts[0])
+
+
+# The query_engine metrics over PartialAggregates instead of a snapshot and key
+
+def leads_by_month(partial):
+    return month_lead_totals(partial.latest())
+
+def dials_by_month_status(partial):
+    return month_status_dial_rates(partial.dial_counts('effective_month'))
+
+def leads_by_month_status(partial):
+    return month_status_lead_rates(partial.latest())
+
+def dials_by_call_number(partial, cutoff=0):
+    return call_number_dials(add_group_dials(partial.dial_counts('call_number'), 'call_number'), cutoff)
+
+def dials_by_class_code(partial, cutoff=0, top_n=0):
+    counts = add_group_dials(partial.dial_counts('governing_class_code'), 'governing_class_code')
+
+    return class_code_dials(counts, cutoff, top_n)
+
+def dials_by_insurer_group(partial, cutoff=0, top_n=0):
+    dimension = 'current_coverage_insurers_group_name'
+
+    return insurer_group_dials(add_group_dials(partial.dial_counts(dimension), dimension), cutoff, top_n)
+
+def class_code_summary(partial):
+    return class_code_table(partial.class_code_outcomes(), partial.latest())
+
+def lead_totals(partial):
+    latest = partial.latest()
+
+    return totals_table(len(latest), int(latest['was_active'].sum()),
+                        int(latest['had_app_submitted'].sum()), partial.dials)
+
+def rep_leaderboard(partial):
+    leads = partial.rep_leads().groupby('updated_by', sort=True).agg(
+        total_leads=('lead', 'size'), active_leads_dialed=('was_active', 'sum'),
+        app_submitted=('had_app_submitted', 'sum'))
+    table = partial.rep_dials.set_index('updated_by').join(leads, how='outer').fillna(0).sort_index()
+
+    return rep_table(table.index.to_numpy(), table['total_leads'].to_numpy(np.int64),
+                        table['active_leads_dialed'].to_numpy(np.int64), table['app_submitted'].to_numpy(np.int64),
+                        table['total_dials'].to_numpy(np.int64))
+
+METRICS = {'leads_by_month': leads_by_month,
+            'dials_by_month_status': dials_by_month_status,
+            'leads_by_month_status': leads_by_month_status,
+            'dials_by_call_number': dials_by_call_number,
+            'dials_by_class_code': dials_by_class_code,
+            'dials_by_insurer_group': dials_by_insurer_group,
+            'class_code_summary': class_code_summary,
+            'lead_totals': lead_totals,
+            'rep_leaderboard': rep_leaderboard}
+
+# Metric arguments compared by check(): the dials_by_* metrics at a few cutoffs; every
+# other metric in METRICS, rep_leaderboard included, is compared once per key
+CHECK_ARGS = {'dials_by_call_number': [(0,), (50,), (500,)],
+                'dials_by_class_code': [(0, 0), (50, 0), (0, 10)],
+                'dials_by_insurer_group': [(0, 0), (50, 0), (0, 5)]}
+
+
+# Run a metric, returning the exception type instead if it raises
+def _outcome(metric, *args):
+    try:
+        return metric(*args)
+    except Exception as e:
+        return type(e)
+
+# Whether two metric results are equal by value; categoricals are compared by their
+# values since the in-memory path keeps every category of the full frame
+def same_result(expected, actual):
+    if not isinstance(expected, pd.DataFrame) or not isinstance(actual, pd.DataFrame):
+        return expected == actual
+
+    expected = expected.astype({col: object for col in expected.columns if isinstance(expected[col].dtype, pd.CategoricalDtype)})
+    actual = actual.astype({col: object for col in actual.columns if isinstance(actual[col].dtype, pd.CategoricalDtype)})
+
+    try:
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False, check_index_type=False)
+    except AssertionError:
+        return False
+
+    return True
+
+# Filter keys exercised by check(): everything, the second half of the date range,
+# the busiest sales rep and class code, and a key matching nothing
+def check_keys(engagements):
+    dates = engagements['activity_date'].dropna()
+    middle = (dates.min() + (dates.max() - dates.min()) / 2).date().isoformat()
+    after = (dates.max() + pd.Timedelta(days=1)).date().isoformat()
+    sales_rep = engagements['updated_by'].value_counts().index[0]
+    class_code = engagements['governing_class_code'].value_counts().index[0]
+
+    return [filter_key(None, None, 'ALL', 'ALL'),
+            filter_key(middle, None, 'ALL', 'ALL'),
+            filter_key(None, middle, class_code, 'ALL'),
+            filter_key(None, None, 'ALL', sales_rep),
+            filter_key(after, None, 'ALL', 'ALL')]
+
+# Compare every metric of the chunked path against the in-memory path on the same
+# file. Returns the (key, metric, args) combinations that differ.
+def check(path, keys=None, chunk_rows=CHUNK_ROWS):
+    from datastore import build_snapshot
+    from engagements import load_engagements
+    from engagements import normalize_schema
+    from engagements import sort_by_lead
+
+    engagements = load_partitioned(path) if is_partitioned(path) else load_engagements(path)
+    data = build_snapshot(sort_by_lead(normalize_schema(engagements)), sdr_options=[], approx_distinct=False)
+    keys = keys or check_keys(data.engagements)
+    partials = aggregate(path, keys, chunk_rows)
+    query_engine.frame_cache.clear()
+
+    mismatches = []
+    for key in keys:
+        for name, metric in METRICS.items():
+            for args in CHECK_ARGS.get(name, [()]):
+                expected = _outcome(query_engine.METRICS[name], data, key, *args)
+                if not same_result(expected, _outcome(metric, partials[key], *args)):
+                    mismatches.append((key, name, args))
+
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute the dashboard metrics by streaming the engagements file in chunks')
+    parser.add_argument('path', help='.parquet or .feather/.arrow/.ipc engagements file, or a partitioned directory')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--start', default=None, help='start date, YYYY-MM-DD')
+    parser.add_argument('--end', default=None, help='end date (exclusive), YYYY-MM-DD')
+    parser.add_argument('--class-code', default='ALL')
+    parser.add_argument('--sales-rep', default='ALL')
+    parser.add_argument('--check', action='store_true',
+                        help='compare against the in-memory path (loads the whole file)')
+    args = parser.parse_args()
+
+    key = filter_key(args.start, args.end, args.class_code, args.sales_rep)
+
+    if args.check:
+        keys = [key] if key != filter_key(None, None, 'ALL', 'ALL') else None
+        mismatches = check(args.path, keys, args.chunk_rows)
+        for mismatch in mismatches:
+            print('Mismatch: key={} metric={} args={}'.format(*mismatch))
+        print('{} mismatches'.format(len(mismatches)))
+        sys.exit(1 if mismatches else 0)
+
+    partial = aggregate(args.path, [key], args.chunk_rows)[key]
+    for name, metric in METRICS.items():
+        print('== {}'.format(name))
+        print(_outcome(metric, partial))
+
+if __name__ == '__main__':
+    main()
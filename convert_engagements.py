@@ -0,0 +1,41 @@
+import argparse
+import os
+
+from engagements import ENGAGEMENT_COLUMNS
+from engagements import expired_rows
+from engagements import load_engagements
+from engagements import normalize_schema
+from engagements import save_engagements
+from engagements import sort_by_lead
+
+# One-shot conversion of the processed engagements pickle to Arrow IPC (Feather) or
+# Parquet, e.g.
+#   python convert_engagements.py ./df_engagements_leads_processed ./df_engagements_leads.feather
+# then start the app with ENGAGEMENTS_PATH=./df_engagements_leads.feather
+# Rows are written with the compact schema, in (lead, activity_date) order and with lead_id,
+# so the app can skip its load-time sort. Rows older than the retention window are left
+# out (--retention-days, ENGAGEMENTS_RETENTION_DAYS by default, 0 keeps all), so the
+# app has none to drop and keeps using the memory-mapped file as written.
+def main():
+    parser = argparse.ArgumentParser(description='Convert the engagements pickle to a columnar format')
+    parser.add_argument('source', help='pickle (or Parquet/Arrow) file to read')
+    parser.add_argument('destination', help='.feather/.arrow/.ipc or .parquet file to write')
+    parser.add_argument('--compression', default=None,
+                        help='codec to use; Arrow files stay uncompressed by default so they can be memory-mapped')
+    parser.add_argument('--retention-days', type=int, default=int(os.environ.get('ENGAGEMENTS_RETENTION_DAYS', 365)),
+                        help='days of history before the newest activity_date to keep, as the app does; 0 keeps all')
+    args = parser.parse_args()
+
+    df = normalize_schema(load_engagements(args.source, columns=ENGAGEMENT_COLUMNS))
+    if args.retention_days:
+        _, expired = expired_rows(df, args.retention_days)
+        if expired.any():
+            print('Leaving out {} rows older than {} days'.format(expired.sum(), args.retention_days))
+            df = df[~expired].drop(columns=['lead_id'], errors='ignore')
+    df = sort_by_lead(df)
+    save_engagements(df, args.destination, compression=args.compression)
+
+    print('Wrote {} rows x {} columns to {}'.format(len(df), len(df.columns), args.destination))
+
+if __name__ == '__main__':
+    main()
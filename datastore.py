@@ -0,0 +1,445 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from xlrd import open_workbook
+
+from distinct import APPROX_DISTINCT
+from distinct import DailyLeadSketches
+from engagements import FEATHER_SUFFIXES
+from engagements import PARQUET_SUFFIXES
+from engagements import append_engagements
+from engagements import expired_rows
+from engagements import load_engagements
+from engagements import normalize_schema
+from engagements import selected_values
+from engagements import sort_by_lead
+from instrumentation import startup_phase
+from partitions import PartitionCatalog
+from partitions import catalog_path
+from partitions import is_partitioned
+from partitions import load_parts
+from rollup import CUBE_DIMENSIONS
+from rollup import DailyCube
+from rollup import day_number
+from row_index import RowIndex
+
+logger = logging.getLogger(__name__)
+
+# Suffixes of files picked up from the increments directory
+INCREMENT_SUFFIXES = FEATHER_SUFFIXES + PARQUET_SUFFIXES + ('.pkl', '.pickle')
+
+# Everything the callbacks read, replaced as a whole when the data is refreshed so an
+# in-flight callback keeps working on the snapshot it started with. fingerprint
+# identifies the source files it was read from, the same in every worker process; a
+# snapshot built from a frame in memory gets a unique one.
+DataSnapshot = namedtuple('DataSnapshot', ['version', 'fingerprint', 'engagements', 'row_index', 'daily_cubes',
+                                            'class_code_options', 'sdr_options', 'earliest_data_date', 'lead_sketches'])
+
+# Generate dict of class codes to populate drop down menu
+def class_code_list(class_codes):
+    options_list = []
+    class_codes = np.sort(class_codes)
+
+    for code in class_codes:
+        code_dict = {}
+        code_dict['label'] = code
+        code_dict['value'] = code
+        options_list.append(code_dict)
+
+    options_list.append({'label':'ALL', 'value':'ALL'})
+
+    return options_list
+
+def sdr_list(sheet):
+    options_list = []
+
+    for i in range(0, sheet.nrows):
+        sdr_dict = {}
+        row = sheet.row_values(i)
+        sdr_dict['label'] = row[1].title()
+        sdr_dict['value'] = row[0]
+        options_list.append(sdr_dict)
+
+    options_list.append({'label':'ALL', 'value':'ALL'})
+
+    return options_list
+
+# Load SDR hash -> SDR name
+def load_sdr_options(path):
+    book = open_workbook(path, on_demand=True)
+
+    return sdr_list(book.sheet_by_name('Sheet1'))
+
+# Snapshot of a normalised, lead-sorted engagements frame with its row index, daily
+# cubes and dropdown options, and daily lead sketches if distinct counts may be estimated
+def build_snapshot(engagements, sdr_options, version=1, earliest_data_date=None, fingerprint=None,
+                    approx_distinct=APPROX_DISTINCT):
+    class_codes = engagements['governing_class_code'].cat.remove_unused_categories().cat.categories
+
+    return DataSnapshot(version=version,
+                        fingerprint=fingerprint or 'snapshot-' + uuid.uuid4().hex,
+                        engagements=engagements,
+                        row_index=RowIndex(engagements),
+                        daily_cubes={dimension: DailyCube(engagements, dimension)
+                                        for dimension in CUBE_DIMENSIONS},
+                        class_code_options=class_code_list(class_codes),
+                        sdr_options=sdr_options,
+                        earliest_data_date=earliest_data_date,
+                        lead_sketches=DailyLeadSketches(engagements) if approx_distinct else None)
+
+# Signature of a source file; for a partitioned directory, of its catalog
+def file_signature(path):
+    if os.path.isdir(path):
+        path = catalog_path(path)
+
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+# What a refresh changed, used to carry forward only the cached aggregates whose
+# filters cannot see the added or dropped rows, from the snapshot with
+# previous_fingerprint to the one with fingerprint
+class DataChange:
+
+    def __init__(self, rows=None, full=False):
+        self.full = full
+        self.previous_fingerprint = self.fingerprint = None
+        self.first_day = self.last_day = None
+        self.has_undated = False
+        self.reps = self.class_codes = frozenset()
+
+        if rows is not None and len(rows):
+            days = rows['activity_date'].dropna()
+            if len(days):
+                self.first_day = day_number(days.min())
+                self.last_day = day_number(days.max())
+            self.has_undated = len(days) < len(rows)
+            self.reps = frozenset(rows['updated_by'].dropna().unique())
+            self.class_codes = frozenset(rows['governing_class_code'].dropna().unique())
+
+    @property
+    def touches_rows(self):
+        return self.full or self.first_day is not None or self.has_undated
+
+    # Whether a cache key starting with (start_date, end_date, class_code, sales_rep)
+    # covers any changed row
+    def affects(self, key):
+        if self.full:
+            return True
+
+        start_date, end_date, class_code, sales_rep = key[:4]
+
+        if sales_rep != 'ALL' and self.reps.isdisjoint(selected_values(sales_rep)):
+            return False
+        if class_code != 'ALL' and self.class_codes.isdisjoint(selected_values(class_code)):
+            return False
+
+        if start_date is None and end_date is None and self.has_undated:
+            return True
+        if self.first_day is None:
+            return False
+        if start_date is not None and day_number(start_date) > self.last_day:
+            return False
+        if end_date is not None and day_number(end_date) <= self.first_day:
+            return False
+
+        return True
+
+
+# Owns the engagements data and SDR options, and refreshes them from disk without a
+# restart: new files in the increments directory, and rows appended to files already
+# read, are merged in; a changed base file triggers a full reload; rows older than
+# the retention window are dropped. The base may also be a date-partitioned directory
+# (partitions.py): only the parts within the retention window are read, and parts
+# appended to its catalog are merged in like increments.
+class EngagementStore:
+
+    def __init__(self, engagements_path, sdr_path, increments_dir=None, retention_days=365, options_cache_path=None):
+        self.engagements_path = engagements_path
+        self.sdr_path = sdr_path
+        self.increments_dir = increments_dir
+        self.retention_days = retention_days
+        self.options_cache_path = options_cache_path
+        self.snapshot = None
+        self.loaded = threading.Event()
+        self._signatures = {}  # path -> file signature when last read
+        self._rows_loaded = {}  # increment path -> rows already merged
+        self._parts_seen = []  # catalog paths of the partitioned base's parts
+        self._lock = threading.Lock()
+
+    def increment_paths(self):
+        if not self.increments_dir:
+            return []
+
+        return sorted(path for path in glob.glob(os.path.join(self.increments_dir, '*'))
+                        if os.path.splitext(path)[1].lower() in INCREMENT_SUFFIXES)
+
+    def _changed(self, path):
+        return self._signatures.get(path) != file_signature(path)
+
+    def _read(self, path):
+        self._signatures[path] = file_signature(path)
+        return load_engagements(path)
+
+    # Hash of the source files and rows read so far (the SDR sheet included, since rep
+    # names appear in the outputs) and of the settings that change outputs, equal
+    # across processes that read the same files
+    def fingerprint(self):
+        sources = sorted((path, signature, self._rows_loaded.get(path)) for path, signature in self._signatures.items())
+        return hashlib.sha1(repr((sources, self.retention_days, APPROX_DISTINCT)).encode()).hexdigest()
+
+    def load(self):
+        with self._lock:
+            self._load()
+        self.loaded.set()
+
+    # Load on a daemon thread, then call on_loaded; on failure call on_error with the
+    # exception instead
+    def load_in_background(self, on_loaded, on_error):
+        def run():
+            try:
+                self.load()
+            except Exception as e:
+                logger.exception('Engagements load failed')
+                on_error(e)
+                return
+            on_loaded()
+
+        thread = threading.Thread(target=run, name='engagements-loader', daemon=True)
+        thread.start()
+
+        return thread
+
+    def wait_loaded(self, timeout=None):
+        return self.loaded.wait(timeout)
+
+    # Dropdown options and data version for a page load: the snapshot's once loaded,
+    # before that the options sidecar's if its sources are unchanged
+    def current_options(self):
+        snapshot = self.snapshot
+        if snapshot is not None:
+            return snapshot.class_code_options, snapshot.sdr_options, snapshot.version
+
+        cached = self._read_options_cache()
+        if cached is not None and cached['engagements'] == self._source_key():
+            return cached['class_code_options'], cached['sdr_options'], 0
+
+        return [], [], 0
+
+    # Signatures of the engagements sources and the settings that shape the class code
+    # options, compared as a string with the one stored in the sidecar
+    def _source_key(self):
+        paths = [self.engagements_path] + self.increment_paths()
+
+        return repr(([(path, file_signature(path)) for path in paths], self.retention_days))
+
+    def _read_options_cache(self):
+        if not self.options_cache_path or not os.path.exists(self.options_cache_path):
+            return None
+
+        try:
+            with open(self.options_cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            logger.warning('Ignoring unreadable options cache %s', self.options_cache_path)
+            return None
+
+    # Rewrite the sidecar from the current snapshot and the signatures it was read from.
+    # The sidecar is only a cache: a failed write is logged and otherwise ignored.
+    def _write_options_cache(self, source_key):
+        if not self.options_cache_path:
+            return
+
+        cache = {'engagements': source_key,
+                    'sdr': repr(self._signatures[self.sdr_path]),
+                    'class_code_options': self.snapshot.class_code_options,
+                    'sdr_options': self.snapshot.sdr_options}
+        directory = os.path.dirname(os.path.abspath(self.options_cache_path))
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(cache, f, default=str)
+            os.replace(tmp_path, self.options_cache_path)
+        except OSError:
+            logger.warning('Options cache write to %s failed', self.options_cache_path, exc_info=True)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # SDR options from the sidecar when SDR.xls is unchanged, otherwise from the sheet
+    def _sdr_options(self):
+        self._signatures[self.sdr_path] = file_signature(self.sdr_path)
+
+        cached = self._read_options_cache()
+        if cached is not None and cached['sdr'] == repr(self._signatures[self.sdr_path]):
+            return cached['sdr_options']
+
+        return load_sdr_options(self.sdr_path)
+
+    # Parts of a partitioned base that can hold rows within the retention window
+    def _retained_parts(self, catalog):
+        latest = catalog.latest_date()
+        if not self.retention_days or latest is None:
+            return catalog.parts
+
+        return catalog.since(latest - pd.Timedelta(days=self.retention_days))
+
+    def _read_partitioned(self):
+        self._signatures[self.engagements_path] = file_signature(self.engagements_path)
+        catalog = PartitionCatalog.read(self.engagements_path)
+        self._parts_seen = [part['path'] for part in catalog.parts]
+        self._rows_loaded[self.engagements_path] = len(self._parts_seen)
+
+        return catalog
+
+    # Rows of the parts added to a partitioned base's catalog since it was read, or
+    # None if parts were removed or replaced and it needs a full reload
+    def _read_new_parts(self):
+        if not is_partitioned(self.engagements_path):
+            return None
+
+        seen = self._parts_seen
+        catalog = self._read_partitioned()
+        if self._parts_seen[:len(seen)] != seen:
+            return None
+
+        return load_parts(catalog, catalog.parts[len(seen):])
+
+    def _load(self):
+        self._signatures = {}
+        self._rows_loaded = {}
+        source_key = self._source_key()
+
+        with startup_phase('read'):
+            if is_partitioned(self.engagements_path):
+                catalog = self._read_partitioned()
+                frames = [load_parts(catalog, self._retained_parts(catalog))]
+            else:
+                frames = [self._read(self.engagements_path)]
+
+            for path in self.increment_paths():
+                frames.append(self._read(path))
+                self._rows_loaded[path] = len(frames[-1])
+
+            if len(frames) > 1:
+                frames = [pd.concat([frame.drop(columns=['lead_id'], errors='ignore') for frame in frames],
+                                    ignore_index=True)]
+
+        with startup_phase('normalize'):
+            engagements = sort_by_lead(normalize_schema(frames[0]))
+
+        with startup_phase('sdr'):
+            sdr_options = self._sdr_options()
+
+        self._publish(engagements, sdr_options)
+        self._write_options_cache(source_key)
+
+    # Pick up changed source files. Returns a DataChange, or None if nothing changed.
+    def refresh(self):
+        with self._lock:
+            previous_fingerprint = self.snapshot.fingerprint
+            change = self._refresh()
+            if change is not None:
+                change.previous_fingerprint = previous_fingerprint
+                change.fingerprint = self.snapshot.fingerprint
+
+            return change
+
+    def _refresh(self):
+        new_frames = []
+        if self._changed(self.engagements_path):
+            new_parts = self._read_new_parts()
+            if new_parts is None:
+                self._load()
+                return DataChange(full=True)
+            new_frames.append(new_parts)
+
+        for path in self.increment_paths():
+            if not self._changed(path):
+                continue
+
+            rows = self._read(path)
+            if len(rows) < self._rows_loaded.get(path, 0):
+                # Rewritten rather than appended to
+                self._load()
+                return DataChange(full=True)
+
+            new_frames.append(rows.iloc[self._rows_loaded.get(path, 0):])
+            self._rows_loaded[path] = len(rows)
+
+        sdr_changed = self._changed(self.sdr_path)
+        new_frames = [frame for frame in new_frames if len(frame)]
+        if not new_frames and not sdr_changed:
+            return None
+
+        sdr_options = self.snapshot.sdr_options
+        if sdr_changed:
+            self._signatures[self.sdr_path] = file_signature(self.sdr_path)
+            sdr_options = load_sdr_options(self.sdr_path)
+
+        if not new_frames:
+            # A new fingerprint too, so responses built with the old names are not reused
+            self.snapshot = self.snapshot._replace(version=self.snapshot.version + 1,
+                                                    fingerprint=self.fingerprint(),
+                                                    sdr_options=sdr_options)
+            self._write_options_cache(self._source_key())
+            return DataChange()
+
+        new_rows = pd.concat(new_frames, ignore_index=True)
+        dropped = self._publish(append_engagements(self.snapshot.engagements, new_rows), sdr_options)
+        self._write_options_cache(self._source_key())
+
+        return DataChange(pd.concat([rows[['activity_date', 'updated_by', 'governing_class_code']].astype(object)
+                                        for rows in (new_rows, dropped)], ignore_index=True))
+
+    # Apply the retention window, build the derived structures and swap in the new
+    # snapshot. Returns the rows dropped by the retention window. Dropping rows copies
+    # the frame, memory-mapped columns included, since the expired rows of a
+    # lead-ordered frame are not one slice; a base file written by
+    # convert_engagements.py with the same --retention-days has none to drop on load.
+    def _publish(self, engagements, sdr_options):
+        earliest_data_date = None
+        dropped = engagements.iloc[:0]
+
+        if self.retention_days:
+            earliest_data_date, expired = expired_rows(engagements, self.retention_days)
+            if expired.any():
+                logger.info('Dropping %d rows older than %s', expired.sum(), earliest_data_date)
+                dropped = engagements[expired]
+                engagements = engagements[~expired]
+
+        version = self.snapshot.version + 1 if self.snapshot is not None else 1
+        with startup_phase('index'):
+            self.snapshot = build_snapshot(engagements, sdr_options, version=version,
+                                            earliest_data_date=earliest_data_date,
+                                            fingerprint=self.fingerprint())
+        return dropped
+
+    # Poll the source files every `interval` seconds on a daemon thread, calling
+    # on_change with the DataChange of each refresh that changed something
+    def start_watcher(self, interval, on_change):
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    change = self.refresh()
+                except Exception:
+                    logger.exception('Engagements refresh failed')
+                    continue
+                if change is not None:
+                    on_change(change)
+
+        thread = threading.Thread(target=watch, name='engagements-watcher', daemon=True)
+        thread.start()
+
+        return thread
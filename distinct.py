@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from rollup import activity_days
+from rollup import day_range
+
+# Distinct-lead counts for the total table. Exact counts work on the integer lead_id:
+# a view in sort_by_lead order holds each lead as one run of equal ids, so leads are
+# counted from run boundaries without copying the view. With DISTINCT_COUNTS=approx,
+# wide unfiltered date ranges are answered from per-day HyperLogLog sketches instead,
+# without touching the rows; their relative standard error is shown in the table.
+
+APPROX_DISTINCT = os.environ.get('DISTINCT_COUNTS', 'exact') == 'approx'
+
+# Rows a date range must cover before its leads are estimated rather than counted
+APPROX_MIN_ROWS = int(os.environ.get('DISTINCT_APPROX_MIN_ROWS', 1000000))
+
+# Sketch precision: 2**HLL_PRECISION one-byte registers per sketch
+HLL_PRECISION = int(os.environ.get('HLL_PRECISION', 12))
+
+
+# Distinct ids overall and among the rows where each boolean mask holds. Sorted ids
+# are counted by runs; anything else through a bitset over the id range.
+def count_distinct(ids, masks=()):
+    if not len(ids):
+        return [0] * (1 + len(masks))
+
+    if (ids[1:] >= ids[:-1]).all():
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        return [len(starts)] + [int(np.logical_or.reduceat(mask, starts).sum()) for mask in masks]
+
+    offset = ids.min()
+    seen = np.zeros(int(ids.max()) - int(offset) + 1, dtype=bool)
+    counts = []
+    for mask in [None] + list(masks):
+        seen[:] = False
+        seen[(ids if mask is None else ids[mask]) - offset] = True
+        counts.append(int(np.count_nonzero(seen)))
+
+    return counts
+
+# Distinct ids per group, overall and among the rows where each mask holds, for
+# integer group codes below n_groups (negative codes are skipped). Each count is one
+# hashed first-occurrence pass over (id, group) pairs and one bincount.
+def count_distinct_per_group(groups, ids, n_groups, masks=()):
+    keys = ids.astype(np.int64) * n_groups + groups
+    coded = groups >= 0
+
+    counts = []
+    for mask in [coded] + [coded & mask for mask in masks]:
+        first = ~pd.Series(keys[mask]).duplicated().to_numpy()
+        counts.append(np.bincount(groups[mask][first], minlength=n_groups))
+
+    return counts
+
+# 64-bit mix of integer ids (splitmix64 finaliser)
+def hash_ids(ids):
+    h = ids.astype(np.uint64) + np.uint64(0x9e3779b97f4a7c15)
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+
+    return h ^ (h >> np.uint64(31))
+
+# Register and rank (position of the first set bit, from 1) of each id's hash: the
+# top `precision` bits pick the register, the rest give the rank
+def sketch_cells(ids, precision=HLL_PRECISION):
+    h = hash_ids(ids)
+    registers = (h >> np.uint64(64 - precision)).astype(np.int64)
+    w = h & np.uint64((1 << (64 - precision)) - 1)
+
+    length = np.zeros(len(w), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        wide = w >= np.uint64(1 << shift)
+        w = np.where(wide, w >> np.uint64(shift), w)
+        length += wide * shift
+    length += w > 0
+
+    return registers, (64 - precision - length + 1).astype(np.uint8)
+
+# HyperLogLog cardinality estimate from one sketch's registers
+def estimate_cardinality(registers):
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+
+    zeros = np.count_nonzero(registers == 0)
+    if raw <= 2.5 * m and zeros:
+        return int(round(m * np.log(m / zeros)))
+
+    return int(round(raw))
+
+def relative_error(precision=HLL_PRECISION):
+    return 1.04 / float(np.sqrt(1 << precision))
+
+
+# HyperLogLog sketches of the lead_ids dialled per activity day, for all rows, active
+# rows and rows with an app submitted. A date range merges its days' sketches
+# (register-wise max), so its cost depends on the number of days, not of dials.
+class DailyLeadSketches:
+
+    def __init__(self, df, precision=HLL_PRECISION):
+        self.precision = precision
+        self.relative_error = relative_error(precision)
+
+        self.days, day_slots, dials = np.unique(activity_days(df), return_inverse=True, return_counts=True)
+        self.cumulative_dials = np.r_[0, np.cumsum(dials)]
+
+        registers, ranks = sketch_cells(df['lead_id'].to_numpy(), precision)
+        self.sketches = []
+        for mask in [None, df['is_active'].to_numpy() == 1, df['app_submitted'].to_numpy() == 1]:
+            sketch = np.zeros((len(self.days), 1 << precision), dtype=np.uint8)
+            if mask is None:
+                np.maximum.at(sketch, (day_slots, registers), ranks)
+            else:
+                np.maximum.at(sketch, (day_slots[mask], registers[mask]), ranks[mask])
+            self.sketches.append(sketch)
+
+    @property
+    def nbytes(self):
+        return sum(sketch.nbytes for sketch in self.sketches)
+
+    # Dials in [start_date, end_date), with filter_engagements' handling of undated rows
+    def dials(self, start_date, end_date):
+        lo, hi = day_range(self.days, start_date, end_date)
+
+        return int(self.cumulative_dials[hi] - self.cumulative_dials[lo])
+
+    # Estimated distinct leads, active leads and leads with an app submitted
+    def estimate(self, start_date, end_date):
+        lo, hi = day_range(self.days, start_date, end_date)
+        if lo == hi:
+            return [0, 0, 0]
+
+        return [estimate_cardinality(sketch[lo:hi].max(axis=0)) for sketch in self.sketches]
@@ -0,0 +1,197 @@
+from datetime import date
+from datetime import datetime
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Columns read by the dashboard callbacks; everything else in the source file is skipped
+ENGAGEMENT_COLUMNS = ['lead', 'activity_date', 'effective_month', 'lead_status', 'call_number',
+                        'governing_class_code', 'updated_by', 'current_coverage_insurers_group_name',
+                        'is_lead', 'is_active', 'lost', 'call_connected', 'dm_reached',
+                        'app_started', 'app_submitted', 'lead_id']
+
+# String columns compared and grouped on every request, stored as categoricals
+CATEGORY_COLUMNS = ['lead_status', 'governing_class_code', 'updated_by',
+                        'current_coverage_insurers_group_name']
+
+# 0/1 flags summed on every request, stored as int8
+FLAG_COLUMNS = ['is_lead', 'is_active', 'lost', 'call_connected', 'dm_reached',
+                    'app_started', 'app_submitted']
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+            "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+FEATHER_SUFFIXES = ('.feather', '.arrow', '.ipc')
+PARQUET_SUFFIXES = ('.parquet', '.pq')
+
+# Read the engagements frame from a pickle, Parquet or Arrow IPC (Feather) file,
+# chosen by file suffix. Arrow IPC files are memory-mapped: written uncompressed,
+# their numeric columns are used in place and the pages are shared by every
+# worker process that maps the same file.
+def load_engagements(path, columns=ENGAGEMENT_COLUMNS):
+    suffix = os.path.splitext(path)[1].lower()
+
+    if suffix in FEATHER_SUFFIXES:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+
+        with pa.memory_map(path) as source:
+            names = pa.ipc.open_file(source).schema.names
+        table = feather.read_table(path, columns=[c for c in columns if c in names], memory_map=True)
+        return table.to_pandas(split_blocks=True)
+
+    if suffix in PARQUET_SUFFIXES:
+        import pyarrow.parquet as pq
+
+        names = pq.read_schema(path).names
+        table = pq.read_table(path, columns=[c for c in columns if c in names], memory_map=True)
+        return table.to_pandas(split_blocks=True)
+
+    df = pd.read_pickle(path)
+    return df.drop(columns=[c for c in df.columns if c not in columns])
+
+# Write the engagements frame in the format given by the path suffix. Arrow IPC
+# defaults to uncompressed so that load_engagements can memory-map it.
+def save_engagements(df, path, compression=None):
+    suffix = os.path.splitext(path)[1].lower()
+
+    if suffix in FEATHER_SUFFIXES:
+        import pyarrow.feather as feather
+
+        feather.write_feather(df, path, compression=compression or 'uncompressed')
+    elif suffix in PARQUET_SUFFIXES:
+        df.to_parquet(path, compression=compression or 'snappy', index=False)
+    else:
+        df.to_pickle(path)
+
+
+# Rows outside a rolling window of retention_days before the newest activity_date:
+# the window's earliest activity_date and a mask of the rows older than it
+def expired_rows(df, retention_days):
+    earliest_data_date = df['activity_date'].max() - pd.Timedelta(days=retention_days)
+
+    return earliest_data_date, (df['activity_date'] < earliest_data_date).to_numpy()
+
+
+# Normalise the dashboard filter inputs into a hashable key,
+# treating an empty dropdown the same as 'ALL'
+def filter_key(start_date, end_date, class_code, sales_rep):
+    return (start_date, end_date, selection(class_code), selection(sales_rep))
+
+# A dropdown value as a filter: 'ALL', a single value, or a sorted tuple of the
+# values picked in a multi-select. Picking 'ALL' among others selects everything.
+def selection(value):
+    if not isinstance(value, (list, tuple)):
+        return 'ALL' if value is None else value
+
+    values = sorted(set(value))
+    if not values or 'ALL' in values:
+        return 'ALL'
+
+    return values[0] if len(values) == 1 else tuple(values)
+
+# The values a filter selection matches (not meaningful for 'ALL')
+def selected_values(selection):
+    return selection if isinstance(selection, tuple) else (selection,)
+
+# Apply the date range, class code and sales rep filters in a single masking pass
+def filter_engagements(df, key):
+    start_date, end_date, class_code, sales_rep = key
+    mask = np.ones(len(df), dtype=bool)
+
+    if sales_rep != 'ALL':
+        mask &= df['updated_by'].isin(selected_values(sales_rep)).to_numpy()
+
+    if class_code != 'ALL':
+        mask &= df['governing_class_code'].isin(selected_values(class_code)).to_numpy()
+
+    if start_date is not None:
+        st_date = date.fromisoformat(start_date)
+        mask &= (df['activity_date'] >=
+                    datetime(st_date.year, st_date.month, st_date.day)).to_numpy()
+    if end_date is not None:
+        end_date = date.fromisoformat(end_date)
+        mask &= (df['activity_date'] <
+                    datetime(end_date.year, end_date.month, end_date.day)).to_numpy()
+
+    return df[mask]
+
+# Compact dtypes for the columns the callbacks filter, group and sum on: categoricals
+# with sorted categories for the string columns, int8 flags, a small int call_number
+# and effective_month as the ordered month categorical. activity_date stays
+# datetime64, which is already stored as int64.
+def normalize_schema(df):
+    before = df.memory_usage(deep=True).sum()
+    df = df.copy(deep=False)
+
+    # A column already in its target dtype (as convert_engagements.py writes it) is
+    # left untouched, so a memory-mapped column stays shared rather than copied
+    for col in CATEGORY_COLUMNS:
+        if col not in df.columns:
+            continue
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+        elif not df[col].cat.categories.is_monotonic_increasing:
+            df[col] = df[col].cat.reorder_categories(df[col].cat.categories.sort_values())
+
+    for col in FLAG_COLUMNS:
+        if col not in df.columns:
+            continue
+        if df[col].hasnans:
+            df[col] = df[col].fillna(0)
+        if df[col].dtype != np.int8:
+            df[col] = df[col].astype(np.int8)
+
+    if 'call_number' in df.columns and pd.api.types.is_integer_dtype(df['call_number']):
+        call_number = pd.to_numeric(df['call_number'], downcast='integer')
+        if call_number.dtype != df['call_number'].dtype:
+            df['call_number'] = call_number
+
+    month_dtype = pd.CategoricalDtype(MONTHS, ordered=True)
+    if 'effective_month' in df.columns and df['effective_month'].dtype != month_dtype:
+        df['effective_month'] = pd.Categorical(df['effective_month'], dtype=month_dtype)
+
+    after = df.memory_usage(deep=True).sum()
+    logger.info('Engagements memory usage: %.1f MB -> %.1f MB', before / 1e6, after / 1e6)
+
+    return df
+
+# Merge newly loaded rows into a normalised frame. Categorical columns are widened to
+# the union of both sides' categories and the result is re-sorted by lead.
+def append_engagements(df, new_rows):
+    df = df.drop(columns=['lead_id'])
+    new_rows = normalize_schema(new_rows.drop(columns=['lead_id'], errors='ignore'))
+
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and col in new_rows.columns:
+            categories = df[col].cat.categories.union(new_rows[col].cat.categories)
+            df[col] = df[col].cat.set_categories(categories)
+            new_rows[col] = new_rows[col].cat.set_categories(categories)
+
+    return sort_by_lead(pd.concat([df, new_rows], ignore_index=True))
+
+# Stable-sort by (lead, activity_date) and add an integer lead_id. Filters that keep
+# row order then leave each lead's dials contiguous and in date order, which lets
+# latest_per_lead find the last engagement without re-sorting.
+def sort_by_lead(df):
+    # Files written by convert_engagements.py are already in this order
+    if 'lead_id' in df.columns and df['lead_id'].is_monotonic_increasing:
+        return df
+
+    df = df.sort_values(by=['lead', 'activity_date'], kind='mergesort').reset_index(drop=True)
+    df['lead_id'] = pd.factorize(df['lead'], sort=True)[0].astype(np.int32)
+
+    return df
+
+# Last row per lead of a frame (or filtered view) in sort_by_lead order,
+# equivalent to sort_values('activity_date').drop_duplicates('lead', keep='last')
+def latest_per_lead(dff):
+    lead_ids = dff['lead_id'].to_numpy()
+    is_last = np.ones(len(lead_ids), dtype=bool)
+    is_last[:-1] = lead_ids[1:] != lead_ids[:-1]
+
+    return dff[is_last]
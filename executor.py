@@ -0,0 +1,180 @@
+import atexit
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+import query_engine
+from frame_cache import FrameCache
+from instrumentation import collect_stages
+from instrumentation import current_callback
+from instrumentation import observe_stages
+from instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# Optional process pool for the query_engine metrics, so a slow aggregation runs
+# outside the web worker's request thread and only its small result comes back.
+# Worker processes are forked with the data snapshot already in memory and share its
+# pages read-only; a new pool is forked once per data change, and requests still on
+# the previous snapshot run in their own thread. Each result comes back with the
+# worker's stage timings and frame cache stats, which only the parent process exports.
+
+# Snapshot of the worker process, inherited through fork rather than pickled
+_worker_data = None
+
+# Session of the request being handled on this thread, for supersession
+_local = threading.local()
+
+
+# A metric whose request was superseded by a newer one from the same session, or
+# that did not finish within the timeout; the callback should leave its output as is
+class QueryCancelled(Exception):
+    pass
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+    # The parent's cache and its lock may have been mid-use by another thread at fork
+    query_engine.frame_cache = FrameCache(max_entries=query_engine.frame_cache.max_entries,
+                                            max_bytes=query_engine.frame_cache.max_bytes)
+
+def _run_metric(name, key, args):
+    with collect_stages() as stages:
+        result = query_engine.METRICS[name](_worker_data, key, *args)
+    return result, stages, os.getpid(), query_engine.frame_cache.stats()
+
+def set_request_session(session):
+    _local.session = session
+
+
+# Runs metrics in a fork-based process pool with a timeout per request. At most one
+# metric per process is handed to the pool; the others wait here, and a waiting
+# request that a newer request for the same metric of the same callback and session
+# has replaced is dropped before it runs, telling its callback to skip the update.
+class AggregationPool:
+
+    def __init__(self, processes, timeout=30):
+        self.processes = processes
+        self.timeout = timeout
+        self._executor = None
+        self._version = None
+        self._fingerprint = None
+        self._free = threading.BoundedSemaphore(processes)
+        self._slots = {}  # (session, callback, metric) -> token of the latest request
+        self._worker_cache_stats = {}  # pid -> latest frame cache stats of a worker
+        self._lock = threading.Lock()
+
+    # Fork the pool for a new snapshot. The previous pool is shut down without
+    # cancelling anything: its workers finish the metrics already handed to them, then
+    # exit. Lock held.
+    def _fork(self, data):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_worker, initargs=(data,))
+        self._version = data.version
+        self._fingerprint = data.fingerprint
+        self._worker_cache_stats = {}
+
+    # Fork the pool for a snapshot that has just been published, once per snapshot
+    def fork(self, data):
+        with self._lock:
+            if self._fingerprint != data.fingerprint:
+                self._fork(data)
+
+    # Submit a metric to the pool forked with `data`. A snapshot newer than the pool's
+    # forks a new pool first, if fork() has not yet; a request still on an older
+    # snapshot gets None, for the caller to run in its own thread.
+    def _submit(self, data, name, key, args):
+        with self._lock:
+            if self._executor is None or data.version > self._version:
+                self._fork(data)
+            if data.fingerprint != self._fingerprint:
+                return None
+            return self._executor.submit(_run_metric, name, key, args)
+
+    def _timed_out(self, name, key):
+        logger.warning('%s timed out after %s s for %s', name, self.timeout, key)
+        return QueryCancelled('{} timed out'.format(name))
+
+    def run(self, name, data, key, *args):
+        deadline = time.monotonic() + self.timeout
+        slot = (getattr(_local, 'session', None), current_callback(), name)
+        token = object()
+
+        if slot[0] is not None:
+            with self._lock:
+                self._slots[slot] = token
+
+        try:
+            with stage('pool'):
+                if not self._free.acquire(timeout=self.timeout):
+                    raise self._timed_out(name, key)
+                try:
+                    if slot[0] is not None and self._slots.get(slot) is not token:
+                        raise QueryCancelled('{} superseded'.format(name))
+
+                    future = self._submit(data, name, key, args)
+                    if future is None:
+                        return query_engine.METRICS[name](data, key, *args)
+                    try:
+                        result, stages, pid, cache_stats = future.result(timeout=max(deadline - time.monotonic(), 0))
+                    except concurrent.futures.TimeoutError:
+                        future.cancel()
+                        raise self._timed_out(name, key)
+                    except concurrent.futures.CancelledError:
+                        raise QueryCancelled('{} cancelled'.format(name))
+                finally:
+                    self._free.release()
+
+            observe_stages(stages)
+            with self._lock:
+                if self._fingerprint == data.fingerprint:
+                    self._worker_cache_stats[pid] = cache_stats
+            return result
+        finally:
+            if slot[0] is not None:
+                with self._lock:
+                    if self._slots.get(slot) is token:
+                        del self._slots[slot]
+
+    # Frame cache stats summed over the current pool's workers that have run a metric
+    def cache_stats(self):
+        with self._lock:
+            workers = list(self._worker_cache_stats.values())
+
+        stats = {name: sum(worker[name] for worker in workers)
+                    for name in ('entries', 'bytes', 'hits', 'misses', 'evictions')}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['processes'] = len(workers)
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                self._version = None
+                self._fingerprint = None
+
+
+# Pool from AGGREGATION_PROCESSES (0, the default, runs metrics in the request thread)
+# and AGGREGATION_TIMEOUT (seconds)
+aggregation_pool = None
+if int(os.environ.get('AGGREGATION_PROCESSES', 0)) > 0:
+    aggregation_pool = AggregationPool(int(os.environ['AGGREGATION_PROCESSES']),
+                                        timeout=float(os.environ.get('AGGREGATION_TIMEOUT', 30)))
+    atexit.register(aggregation_pool.shutdown)
+
+# Result of a query_engine metric, from the process pool when one is configured
+def run_metric(name, data, key, *args):
+    if aggregation_pool is None:
+        return query_engine.METRICS[name](data, key, *args)
+
+    return aggregation_pool.run(name, data, key, *args)
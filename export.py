@@ -0,0 +1,124 @@
+import os
+
+import pandas as pd
+
+from rollup import day_range
+
+# Downloads of the data behind the dashboard: the filtered engagement rows or one
+# metric's aggregate, encoded as CSV or Parquet a chunk at a time. Rows are gathered
+# EXPORT_CHUNK_ROWS at a time from the snapshot's date index, so an export holds one
+# chunk of rows and its encoding in memory however many rows it covers.
+
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 100000))
+
+# Media type of each export format
+EXPORT_FORMATS = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+# Internal columns left out of row exports
+INTERNAL_COLUMNS = ['lead_id']
+
+
+# The filtered engagement rows as frames of at most chunk_rows rows, in activity_date
+# order (undated rows first), with the semantics of engagements.filter_engagements.
+# Always yields at least one frame, empty when nothing matches, so the columns are known.
+def row_chunks(data, key, chunk_rows=EXPORT_CHUNK_ROWS):
+    start_date, end_date, class_code, sales_rep = key
+    index = data.row_index
+    lo, hi = day_range(index.days, start_date, end_date)
+    equal = [(index.columns[column], value) for column, value in [('updated_by', sales_rep),
+                                                                  ('governing_class_code', class_code)]
+                if value != 'ALL']
+
+    emitted = False
+    for chunk_start in range(lo, hi, chunk_rows):
+        positions = index.positions[chunk_start:min(chunk_start + chunk_rows, hi)]
+        for column_index, value in equal:
+            positions = positions[column_index.membership(value)[column_index.codes[positions]]]
+        if len(positions):
+            emitted = True
+            yield data.engagements.take(positions).drop(columns=INTERNAL_COLUMNS, errors='ignore')
+
+    if not emitted:
+        yield data.engagements.iloc[:0].drop(columns=INTERNAL_COLUMNS, errors='ignore')
+
+# Extra arguments of the metrics drawn with a cutoff slider, as the figures pass them
+def metric_args(name, cutoff=0, top_n=0):
+    if name == 'dials_by_call_number':
+        return [cutoff]
+    if name in ('dials_by_class_code', 'dials_by_insurer_group'):
+        return [cutoff, top_n]
+
+    return []
+
+# A metric's result as a flat frame: lead_totals' dict becomes one row
+def aggregate_frame(result):
+    if isinstance(result, dict):
+        return pd.DataFrame([result])
+
+    return result.reset_index(drop=True)
+
+
+def encode_csv(chunks):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+
+# Bytes written by a ParquetWriter, handed out as each row group is finished
+class _WrittenBytes:
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+# One Parquet row group per chunk. Categorical columns keep their categories, so
+# every chunk converts to the same schema.
+def encode_parquet(chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _WrittenBytes()
+    writer = None
+    for chunk in chunks:
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema, compression='snappy')
+        writer.write_table(table)
+        yield sink.take()
+
+    if writer is not None:
+        writer.close()
+    yield sink.take()
+
+def encode(chunks, export_format):
+    if export_format == 'parquet':
+        return encode_parquet(chunks)
+
+    return encode_csv(chunks)
+
+# Download name for an export, e.g. engagements_2021-01-01_2021-12-31.csv
+def export_filename(name, key, export_format):
+    start_date, end_date = key[0], key[1]
+    dates = '_'.join(str(d)[:10] for d in (start_date, end_date) if d is not None)
+
+    return '{}{}.{}'.format(name, '_' + dates if dates else '', export_format)
+
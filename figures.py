@@ -0,0 +1,74 @@
+import importlib.util
+
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+# Bar figures built straight from aggregate columns as go.Bar traces: one trace per
+# series with its legend name set up front, and the hover label sent once per bar as
+# hovertext rather than again as customdata.
+
+# orjson encodes figures several times faster than the standard json encoder; Dash
+# serialises callback outputs through plotly.io.json
+if importlib.util.find_spec('orjson') is not None:
+    pio.json.config.default_engine = 'orjson'
+
+def colorway(template):
+    return list(pio.templates[template].layout.colorway or pio.templates['plotly'].layout.colorway)
+
+def hover_template(hover_label, labels):
+    fields = ''.join('<br>{}={}'.format(name, value) for name, value in labels)
+    return '<b>%{hovertext}</b><br>' + fields + '<br>' + hover_label + '=%{hovertext}<extra></extra>'
+
+def bar_figure(traces, title, template, legend_title, barmode='stack'):
+    fig = go.Figure(data=traces)
+    fig.update_layout(title_text=title, template=template, barmode=barmode,
+                        legend_title_text=legend_title, legend_tracegroupgap=0, margin_t=60)
+    return fig
+
+# Stacked bars of `value` per `category` with one trace per lead_status, in order of
+# first appearance like px.bar(color='lead_status'). Horizontal bars put the values
+# on x.
+def status_bar_figure(counts, category, value, title, template, orientation='v', hover='app_rate'):
+    statuses = counts['lead_status'].to_numpy()
+    categories = counts[category].to_numpy()
+    values = counts[value].to_numpy()
+    hovertext = counts[hover].to_numpy()
+    colors = colorway(template)
+
+    traces = []
+    for i, status in enumerate(pd.unique(statuses)):
+        rows = statuses == status
+        x, y = categories[rows], values[rows]
+        labels = [('lead_status', status), (category, '%{x}'), (value, '%{y}')]
+        if orientation == 'h':
+            x, y = y, x
+            labels = [('lead_status', status), (value, '%{x}'), (category, '%{y}')]
+
+        traces.append(go.Bar(name=str(status), x=x, y=y, orientation=orientation, hovertext=hovertext[rows],
+                                hovertemplate=hover_template(hover, labels),
+                                marker_color=colors[i % len(colors)]))
+
+    fig = bar_figure(traces, title, template, 'lead_status')
+    x_title, y_title = (category, value) if orientation == 'v' else (value, category)
+    fig.update_layout(xaxis_title=x_title, yaxis_title=y_title)
+
+    return fig
+
+# Stacked bars of several columns against one category, like px.bar(y=[...]) on a
+# wide table; `names` maps the columns to their legend names
+def column_bar_figure(df, category, columns, names, title, template, hover='app_rate'):
+    categories = df[category].to_numpy()
+    hovertext = df[hover].to_numpy()
+    colors = colorway(template)
+
+    traces = [go.Bar(name=names.get(column, column), x=categories, y=df[column].to_numpy(), hovertext=hovertext,
+                        hovertemplate=hover_template(hover, [('variable', column), (category, '%{x}'), ('value', '%{y}')]),
+                        marker_color=colors[i % len(colors)])
+                for i, column in enumerate(columns)]
+
+    return bar_figure(traces, title, template, 'variable')
+
+# Payload size of a figure (or any callback output) as Dash would send it
+def payload_bytes(output):
+    return len(pio.json.to_json_plotly(output))
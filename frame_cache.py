@@ -0,0 +1,130 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+# Values sampled per object column to estimate the size of its Python objects
+OBJECT_SAMPLE_SIZE = 1000
+
+
+# Approximate in-memory size of a cached value in bytes. A deep memory_usage costs
+# more than most filters, so object columns are estimated from a sample instead.
+def value_nbytes(value):
+    if not hasattr(value, 'memory_usage'):
+        return sys.getsizeof(value)
+
+    usage = value.memory_usage(index=True, deep=False)
+    nbytes = int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+
+    if hasattr(value, 'columns'):
+        columns = [value.iloc[:, i] for i, dtype in enumerate(value.dtypes) if dtype == object]
+    else:
+        columns = [value] if value.dtype == object else []
+
+    return nbytes + sum(object_nbytes(column) for column in columns)
+
+# Estimated size of the objects in an object column, from evenly spaced values
+def object_nbytes(column):
+    if not len(column):
+        return 0
+
+    sample = column.iloc[::max(len(column) // OBJECT_SAMPLE_SIZE, 1)]
+
+    return int(sum(sys.getsizeof(v) for v in sample) * len(column) / len(sample))
+
+
+# Thread-safe LRU cache of computed frames, bounded by entry count and total bytes.
+# Concurrent requests for a key that is being computed wait for that single
+# computation instead of repeating it.
+class FrameCache:
+
+    def __init__(self, max_entries=32, max_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0  # bumped on invalidation so in-flight results are not stored
+        self._entries = OrderedDict()  # key -> (value, nbytes), least recently used first
+        self._pending = {}  # key -> threading.Event set when the computation finishes
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][0]
+
+                event = self._pending.get(key)
+                if event is None:
+                    self.misses += 1
+                    generation = self.generation
+                    event = self._pending[key] = threading.Event()
+                    break
+
+            event.wait()
+
+        try:
+            value = compute()
+            nbytes = value_nbytes(value)
+            with self._lock:
+                if generation == self.generation:
+                    self._store(key, value, nbytes)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+
+        return value
+
+    def _store(self, key, value, nbytes):
+        if nbytes > self.max_bytes:
+            return
+
+        self._entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+
+        while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+            _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= evicted_nbytes
+            self.evictions += 1
+
+    # Drop the entries whose key matches the predicate
+    def invalidate(self, predicate):
+        with self._lock:
+            self.generation += 1
+            for key in [key for key in self._entries if predicate(key)]:
+                _, nbytes = self._entries.pop(key)
+                self.nbytes -= nbytes
+
+    # Re-key the entries of one snapshot to its successor, for keys whose first element
+    # is the snapshot fingerprint: those `keep` accepts (given the key without the
+    # fingerprint) move to `new`, the rest are dropped
+    def carry_forward(self, old, new, keep):
+        with self._lock:
+            self.generation += 1
+            for key in [key for key in self._entries if key[0] == old]:
+                value, nbytes = self._entries.pop(key)
+                new_key = (new,) + key[1:]
+                if keep(key[1:]) and new_key not in self._entries:
+                    self._entries[new_key] = (value, nbytes)
+                else:
+                    self.nbytes -= nbytes
+
+    def clear(self):
+        self.invalidate(lambda key: True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._entries),
+                    'max_entries': self.max_entries,
+                    'bytes': self.nbytes,
+                    'max_bytes': self.max_bytes,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0}
@@ -0,0 +1,215 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds in bytes of the response size histogram buckets
+PAYLOAD_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Callback currently running on this thread, and its time spent so far in the request
+_local = threading.local()
+
+
+# Latency histograms labelled by callback and stage, rendered in the Prometheus
+# text exposition format
+class StageHistograms:
+
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._series = {}  # (callback, stage) -> [per-bucket counts incl. +Inf, sum of seconds]
+        self._lock = threading.Lock()
+
+    def observe(self, callback, stage, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+
+        with self._lock:
+            series = self._series.get((callback, stage))
+            if series is None:
+                series = self._series[(callback, stage)] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.description),
+                    '# TYPE {} histogram'.format(self.name)]
+
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+
+        for (callback, stage), counts, total in series:
+            labels = 'callback="{}",stage="{}"'.format(callback, stage)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (None,), counts):
+                cumulative += count
+                le = '+Inf' if bound is None else repr(bound)
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(self.name, labels, le, cumulative))
+            lines.append('{}_sum{{{}}} {}'.format(self.name, labels, total))
+            lines.append('{}_count{{{}}} {}'.format(self.name, labels, cumulative))
+
+        return '\n'.join(lines) + '\n'
+
+stage_seconds = StageHistograms('dashboard_callback_stage_seconds',
+                                'Seconds spent per dashboard callback and stage '
+                                '(filter, dedup, groupby, figure, callback, serialize, request)')
+
+response_bytes = StageHistograms('dashboard_callback_response_bytes',
+                                    'Size in bytes of each dashboard callback response (stage "response")',
+                                    buckets=PAYLOAD_BUCKETS)
+
+def current_callback():
+    return getattr(_local, 'callback', None)
+
+# Time a stage of the running callback; while collect_stages() is active on this
+# thread the duration is collected instead
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        collected = getattr(_local, 'collected_stages', None)
+        if collected is not None:
+            collected.append((name, elapsed))
+        else:
+            stage_seconds.observe(current_callback() or 'none', name, elapsed)
+
+# Stages timed inside the block, as a list of (stage, seconds), for a pool worker to
+# send back to the process that observes them with observe_stages
+@contextmanager
+def collect_stages():
+    _local.collected_stages = []
+    try:
+        yield _local.collected_stages
+    finally:
+        _local.collected_stages = None
+
+# Observe stages collected elsewhere as stages of the running callback
+def observe_stages(stages):
+    for name, seconds in stages:
+        stage_seconds.observe(current_callback() or 'none', name, seconds)
+
+# Decorator for Dash callbacks: labels the stages timed inside the callback and
+# records its total time
+def timed_callback(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            _local.callback = name
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stage_seconds.observe(name, 'callback', elapsed)
+                _local.request_callback = name
+                _local.callback_seconds = getattr(_local, 'callback_seconds', 0.0) + elapsed
+                _local.callback = None
+        return wrapper
+    return decorator
+
+def request_started():
+    _local.request_start = time.perf_counter()
+    _local.request_callback = None
+    _local.callback_seconds = 0.0
+
+# Record the whole callback request and, as 'serialize', the part of it spent outside
+# the callback function (JSON encoding of the outputs and Dash dispatch), and the
+# size of its response
+def request_finished(response):
+    callback = getattr(_local, 'request_callback', None)
+    if callback is None:
+        return
+
+    total = time.perf_counter() - _local.request_start
+    stage_seconds.observe(callback, 'request', total)
+    stage_seconds.observe(callback, 'serialize', max(total - _local.callback_seconds, 0.0))
+    if response.content_length is not None:
+        response_bytes.observe(callback, 'response', response.content_length)
+
+
+# Durations of the startup phases (reading the options sidecar, loading and indexing
+# the data, warming the response cache) and the time from process start until the
+# worker was ready to serve, for the /ready endpoint, the log and /metrics. Only the
+# first load is recorded; reloads after a refresh are not startup.
+class StartupReport:
+
+    def __init__(self):
+        self.started = time.time()
+        self.ready_seconds = None
+        self.error = None
+        self.phases = {}  # phase -> seconds, in the order they ran
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.ready_seconds is None:
+                self.phases[name] = time.perf_counter() - start
+                logger.info('Startup phase %s took %.3fs', name, self.phases[name])
+
+    def finished(self, error=None):
+        self.error = error
+        if error is None:
+            self.ready_seconds = time.time() - self.started
+            logger.info('Ready %.3fs after start: %s', self.ready_seconds,
+                        ', '.join('{} {:.3f}s'.format(name, seconds) for name, seconds in self.phases.items()))
+
+    @property
+    def ready(self):
+        return self.ready_seconds is not None
+
+    def report(self):
+        return {'ready': self.ready,
+                'seconds_since_start': round(time.time() - self.started, 3),
+                'seconds_to_ready': None if self.ready_seconds is None else round(self.ready_seconds, 3),
+                'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+                'error': self.error}
+
+    def render(self):
+        lines = ['# HELP dashboard_startup_phase_seconds Seconds spent in each startup phase',
+                    '# TYPE dashboard_startup_phase_seconds gauge']
+        lines += ['dashboard_startup_phase_seconds{{phase="{}"}} {}'.format(name, seconds)
+                    for name, seconds in self.phases.items()]
+        if self.ready_seconds is not None:
+            lines += ['# TYPE dashboard_startup_ready_seconds gauge',
+                        'dashboard_startup_ready_seconds {}'.format(self.ready_seconds)]
+
+        return '\n'.join(lines) + '\n'
+
+startup_report = StartupReport()
+startup_phase = startup_report.phase
+
+
+# One JSON object per log line, tagged with the callback that was running
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {'time': self.formatTime(record),
+                    'level': record.levelname,
+                    'logger': record.name,
+                    'message': record.getMessage()}
+
+        if current_callback() is not None:
+            entry['callback'] = current_callback()
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+def configure_logging(level='INFO'):
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    logging.basicConfig(level=level, handlers=[handler])
@@ -0,0 +1,246 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import plotly.io as pio
+
+logger = logging.getLogger(__name__)
+
+# Memoised callback outputs, stored as the JSON Dash would send. Keys combine the
+# callback name, a fingerprint of the data the output was built from and the
+# callback's input values, so outputs built from older data are never served.
+
+
+# In-process LRU of serialised outputs, bounded by entry count and total bytes,
+# with a time-to-live per entry
+class MemoryBackend:
+
+    shared = False
+
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (payload, expires_at), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, payload, ttl):
+        if len(payload) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (payload, time.time() + ttl)
+            self.nbytes += len(payload)
+
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        payload, _ = self._entries.pop(key)
+        self.nbytes -= len(payload)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'entries': len(self._entries), 'bytes': self.nbytes,
+                    'max_bytes': self.max_bytes, 'evictions': self.evictions}
+
+
+# One file per entry in a directory shared by every worker process on the host.
+# Writes go through a temporary file and a rename, so readers never see a partial
+# entry. Each file starts with its expiry time, and the oldest files are removed
+# once the directory grows past max_bytes.
+class FileBackend:
+
+    name = 'file'
+    shared = True
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires_at = float(f.readline())
+                if expires_at < time.time():
+                    os.remove(path)
+                    return None
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, payload, ttl):
+        if len(payload) > self.max_bytes:
+            return
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(repr(time.time() + ttl).encode() + b'\n')
+                f.write(payload)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            logger.exception('Response cache write failed')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        nbytes = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if nbytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                pass
+            nbytes -= size
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        entries = self._entries()
+        return {'backend': self.name, 'directory': self.directory, 'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries), 'max_bytes': self.max_bytes,
+                'evictions': self.evictions}
+
+
+# FileBackend on the host's tmpfs, so entries live in shared memory and are read by
+# every gunicorn worker without touching disk
+class SharedMemoryBackend(FileBackend):
+
+    name = 'shm'
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024):
+        super().__init__(directory or os.path.join('/dev/shm', 'sales-dashboard-responses'), max_bytes)
+
+
+# Memoises callback outputs in a backend. A hit returns the stored JSON decoded to
+# plain lists and dicts, which Dash re-encodes far faster than it rebuilds a figure.
+class ResponseCache:
+
+    def __init__(self, backend, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cache_key(name, fingerprint, inputs):
+        raw = json.dumps([name, fingerprint, inputs], default=str, sort_keys=True)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    # Output of `build` for the callback `name` on `inputs`, from the cache when a
+    # matching entry built from the same data is still fresh. Nothing is stored when
+    # `build` raises.
+    def memoize(self, name, fingerprint, inputs, build):
+        key = self.cache_key(name, fingerprint, inputs)
+        payload = self.backend.get(key)
+
+        if payload is not None:
+            self.hits += 1
+            return json.loads(payload)
+
+        self.misses += 1
+        output = build()
+        self.backend.set(key, pio.json.to_json_plotly(output).encode(), self.ttl)
+
+        return output
+
+    # Drop the entries built from older data. Only an in-process backend is cleared:
+    # the entries of a shared one may include outputs another worker has just built
+    # from the new data, and stale entries are never served since keys carry the
+    # fingerprint, so they are left to expire or be evicted.
+    def invalidate(self):
+        if not self.backend.shared:
+            self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(self.backend.stats(), ttl=self.ttl, hits=self.hits, misses=self.misses,
+                    hit_rate=round(self.hits / lookups, 4) if lookups else 0.0)
+
+
+# Always builds; used when RESPONSE_CACHE is 'off'
+class NoResponseCache:
+
+    def memoize(self, name, fingerprint, inputs, build):
+        return build()
+
+    def invalidate(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'off'}
+
+# Response cache from the RESPONSE_CACHE* environment variables: RESPONSE_CACHE is
+# memory (default), file, shm or off; RESPONSE_CACHE_DIR the directory for file/shm,
+# RESPONSE_CACHE_TTL the seconds an entry stays fresh and RESPONSE_CACHE_MAX_MB the
+# size bound.
+def response_cache_from_env(environ=os.environ):
+    kind = environ.get('RESPONSE_CACHE', 'memory')
+    max_bytes = int(environ.get('RESPONSE_CACHE_MAX_MB', 256)) * 1024 * 1024
+    ttl = int(environ.get('RESPONSE_CACHE_TTL', 300))
+
+    if kind == 'off':
+        return NoResponseCache()
+    if kind == 'file':
+        return ResponseCache(FileBackend(environ.get('RESPONSE_CACHE_DIR', './.response_cache'), max_bytes), ttl)
+    if kind == 'shm':
+        return ResponseCache(SharedMemoryBackend(environ.get('RESPONSE_CACHE_DIR'), max_bytes), ttl)
+    if kind == 'memory':
+        return ResponseCache(MemoryBackend(max_bytes=max_bytes), ttl)
+
+    raise ValueError('Unknown RESPONSE_CACHE backend: {}'.format(kind))
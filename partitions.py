@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+from engagements import ENGAGEMENT_COLUMNS
+from engagements import load_engagements
+from engagements import save_engagements
+
+# Engagements stored as one directory per month (or day) of activity_date, each
+# holding immutable part files, plus a catalog listing every part with its row count
+# and date range:
+#   engagements/catalog.json
+#   engagements/activity_month=2020-03/part-00000.parquet
+#   engagements/activity_month=2020-03/part-00007.parquet   (appended later)
+#   engagements/activity_month=none/part-00001.parquet      (rows with no date)
+# Appending writes new parts and then swaps in the extended catalog, so history is
+# never rewritten and readers see either the old or the new set of parts. A date
+# range only opens the parts whose dates overlap it.
+
+CATALOG_NAME = 'catalog.json'
+
+# Partition key format per granularity
+GRANULARITIES = {'month': '%Y-%m', 'day': '%Y-%m-%d'}
+
+# Partition of the rows with no activity_date
+UNDATED_PARTITION = 'none'
+
+
+def catalog_path(root):
+    return os.path.join(root, CATALOG_NAME)
+
+def is_partitioned(path):
+    return os.path.isfile(catalog_path(path))
+
+
+# The parts of a partitioned engagements directory, in the order they were written
+class PartitionCatalog:
+
+    def __init__(self, root, granularity='month', parts=None):
+        self.root = root
+        self.granularity = granularity
+        self.parts = parts or []  # dicts with path, partition, rows, min_date, max_date
+
+    @classmethod
+    def read(cls, root):
+        with open(catalog_path(root)) as f:
+            catalog = json.load(f)
+
+        return cls(root, catalog['granularity'], catalog['parts'])
+
+    # Replace the catalog file atomically
+    def write(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'granularity': self.granularity, 'parts': self.parts}, f, indent=1)
+            os.replace(tmp_path, catalog_path(self.root))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def rows(self):
+        return sum(part['rows'] for part in self.parts)
+
+    def latest_date(self):
+        dates = [part['max_date'] for part in self.parts if part['max_date'] is not None]
+
+        return pd.Timestamp(max(dates)) if dates else None
+
+    # Parts that can hold rows in [start_date, end_date), with the filter semantics of
+    # engagements.filter_engagements: undated rows only match with no date bound
+    def select(self, start_date=None, end_date=None):
+        if start_date is None and end_date is None:
+            return list(self.parts)
+
+        selected = []
+        for part in self.parts:
+            if part['min_date'] is None:
+                continue
+            if start_date is not None and pd.Timestamp(part['max_date']) < pd.Timestamp(start_date):
+                continue
+            if end_date is not None and pd.Timestamp(part['min_date']) >= pd.Timestamp(end_date):
+                continue
+            selected.append(part)
+
+        return selected
+
+    # Parts that can hold rows on or after `earliest`, undated ones included, for
+    # loading just the retention window
+    def since(self, earliest):
+        return [part for part in self.parts
+                if part['max_date'] is None or pd.Timestamp(part['max_date']) >= earliest]
+
+    # File position of each part's first row, counting every part in catalog order
+    def offsets(self):
+        offsets, offset = {}, 0
+        for part in self.parts:
+            offsets[part['path']] = offset
+            offset += part['rows']
+
+        return offsets
+
+    def part_path(self, part):
+        return os.path.join(self.root, part['path'])
+
+    # Write `df` as new parts, one per partition, and add them to the catalog
+    def append(self, df, suffix='.parquet'):
+        dates = df['activity_date']
+        keys = dates.dt.strftime(GRANULARITIES[self.granularity]).fillna(UNDATED_PARTITION)
+
+        new_parts = []
+        for key, rows in df.groupby(keys.to_numpy(), sort=True):
+            directory = 'activity_{}={}'.format(self.granularity, key)
+            path = os.path.join(directory, 'part-{:05d}{}'.format(len(self.parts) + len(new_parts), suffix))
+            os.makedirs(os.path.join(self.root, directory), exist_ok=True)
+            save_engagements(rows.reset_index(drop=True), os.path.join(self.root, path))
+
+            row_dates = rows['activity_date'].dropna()
+            new_parts.append({'path': path,
+                                'partition': key,
+                                'rows': len(rows),
+                                'min_date': row_dates.min().isoformat() if len(row_dates) else None,
+                                'max_date': row_dates.max().isoformat() if len(row_dates) else None})
+
+        self.parts = self.parts + new_parts
+        self.write()
+
+        return new_parts
+
+# Write a frame as a new partitioned directory, or append it to an existing one
+def write_partitioned(df, root, granularity='month', suffix='.parquet'):
+    if is_partitioned(root):
+        catalog = PartitionCatalog.read(root)
+    else:
+        os.makedirs(root, exist_ok=True)
+        catalog = PartitionCatalog(root, granularity)
+
+    catalog.append(df, suffix)
+
+    return catalog
+
+# Concatenated rows of the given parts, in catalog order
+def load_parts(catalog, parts, columns=ENGAGEMENT_COLUMNS):
+    frames = [load_engagements(catalog.part_path(part), columns=columns).drop(columns=['lead_id'], errors='ignore')
+                for part in parts]
+    if not frames:
+        return pd.DataFrame(columns=[c for c in columns if c != 'lead_id'])
+
+    return pd.concat(frames, ignore_index=True)
+
+# Rows of a partitioned directory within [start_date, end_date), opening only the
+# overlapping parts
+def load_partitioned(root, start_date=None, end_date=None, columns=ENGAGEMENT_COLUMNS):
+    catalog = PartitionCatalog.read(root)
+
+    return load_parts(catalog, catalog.select(start_date, end_date), columns)
+
+
+# Append an engagements file (pickle, Parquet or Arrow) to a partitioned directory, e.g.
+#   python partitions.py ./df_engagements_leads_processed ./engagements
+#   python partitions.py ./new_day.parquet ./engagements
+def main():
+    parser = argparse.ArgumentParser(description='Append engagements to a date-partitioned directory')
+    parser.add_argument('source', help='engagements file to read')
+    parser.add_argument('root', help='partitioned directory, created if missing')
+    parser.add_argument('--granularity', choices=sorted(GRANULARITIES), default='month',
+                        help='partition size for a new directory')
+    parser.add_argument('--format', choices=['parquet', 'feather'], default='parquet')
+    args = parser.parse_args()
+
+    df = load_engagements(args.source).drop(columns=['lead_id'], errors='ignore')
+    catalog = write_partitioned(df, args.root, args.granularity, '.' + args.format)
+
+    print('Appended {} rows to {} ({} parts, {} rows)'.format(len(df), args.root, len(catalog.parts), catalog.rows()))
+
+if __name__ == '__main__':
+    main()
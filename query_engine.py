@@ -0,0 +1,229 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregates import add_app_rate
+from aggregates import add_group_dials
+from aggregates import apply_cutoff
+from aggregates import format_app_rate
+from aggregates import month_status_counts
+from aggregates import month_status_grid
+from aggregates import top_groups_with_other
+from distinct import APPROX_MIN_ROWS
+from distinct import count_distinct
+from distinct import count_distinct_per_group
+from engagements import latest_per_lead
+from frame_cache import FrameCache
+from instrumentation import stage
+
+# The dashboard's computations without Dash or Plotly: one function per metric, each
+# taking a DataSnapshot (datastore.build_snapshot makes one from a frame) and a filter
+# key from engagements.filter_key, and returning plain aggregates. Batch jobs and
+# benchmarks call these directly; views.py turns them into figures and tables.
+
+# Filtered views and aggregates shared by all metrics, computed once per snapshot and
+# distinct filter combination. Keys are made by cache_key.
+frame_cache = FrameCache(max_entries=int(os.environ.get('FRAME_CACHE_ENTRIES', 32)),
+                            max_bytes=int(os.environ.get('FRAME_CACHE_MAX_MB', 512)) * 1024 * 1024)
+
+# Dial outcome flags summed per class code for the class code table
+CLASS_CODE_OUTCOMES = ['call_connected', 'dm_reached', 'app_started', 'app_submitted']
+
+# Frame cache key: the snapshot's fingerprint, the filter_key tuple, then what is cached
+def cache_key(data, key, *parts):
+    return (data.fingerprint,) + tuple(key) + parts
+
+# The whole frame needs no filtering and is not cached
+def filtered_engagements(data, key):
+    if data.row_index.selects_all(key):
+        return data.engagements
+
+    with stage('filter'):
+        return frame_cache.get_or_compute(cache_key(data, key), lambda: data.row_index.filter(data.engagements, key))
+
+def _latest_per_lead(dff):
+    with stage('dedup'):
+        return latest_per_lead(dff)
+
+# Each lead's last engagement within the filtered view, shared like the view itself
+def latest_engagements(data, key):
+    return frame_cache.get_or_compute(cache_key(data, key, 'latest'), lambda: _latest_per_lead(filtered_engagements(data, key)))
+
+# Dials per (dimension, lead_status) for the filters, summed from the daily cube
+def cube_dial_counts(data, key, dimension):
+    with stage('groupby'):
+        return data.daily_cubes[dimension].counts(key)
+
+# Dials per (group_by, lead_status) with group totals, shared by every cutoff
+# slider position so that moving a slider only re-thresholds this table
+def filtered_dial_counts(data, key, group_by):
+    return frame_cache.get_or_compute(cache_key(data, key, 'dials', group_by),
+                                        lambda: add_group_dials(cube_dial_counts(data, key, group_by), group_by))
+
+# Fig 0: leads, active, lost and apps submitted per effective month, counting each
+# lead's last engagement
+def leads_by_month(data, key):
+    dff = latest_engagements(data, key)
+
+    with stage('groupby'):
+        return month_lead_totals(dff)
+
+# Fig 1: dials per (effective_month, lead_status), every month included
+def dials_by_month_status(data, key):
+    dff = cube_dial_counts(data, key, 'effective_month')
+
+    with stage('groupby'):
+        return month_status_dial_rates(dff)
+
+# Fig 2: leads per (effective_month, lead_status) by each lead's last engagement
+def leads_by_month_status(data, key):
+    dff = latest_engagements(data, key)
+
+    with stage('groupby'):
+        return month_status_lead_rates(dff)
+
+# Fig 3: dials per (call_number, lead_status) for call numbers with more than
+# `cutoff` dials
+def dials_by_call_number(data, key, cutoff=0):
+    return call_number_dials(filtered_dial_counts(data, key, 'call_number'), cutoff)
+
+# Fig 4: dials per (governing_class_code, lead_status) for class codes with more
+# than `cutoff` dials, optionally only the top_n class codes plus an 'Other' group
+def dials_by_class_code(data, key, cutoff=0, top_n=0):
+    return class_code_dials(filtered_dial_counts(data, key, 'governing_class_code'), cutoff, top_n)
+
+# Fig 5: dials per (insurer group, lead_status) for named groups with more than
+# `cutoff` dials, optionally only the top_n groups plus an 'Other' group
+def dials_by_insurer_group(data, key, cutoff=0, top_n=0):
+    return insurer_group_dials(filtered_dial_counts(data, key, 'current_coverage_insurers_group_name'), cutoff, top_n)
+
+# Class code table: lead counts by each lead's last engagement and dial outcomes
+# over all engagements, per class code, most leads first. Cached, since the table
+# pages, sorts and filters it server-side.
+def class_code_summary(data, key):
+    return frame_cache.get_or_compute(cache_key(data, key, 'class_code_summary'), lambda: _class_code_summary(data, key))
+
+def _class_code_summary(data, key):
+    dff = filtered_engagements(data, key)
+    dff_leads = latest_engagements(data, key)
+
+    with stage('groupby'):
+        return class_code_table(class_code_outcomes(dff), dff_leads)
+
+# Rep leaderboard: per sales rep, distinct leads, active leads dialed and leads with
+# an app submitted, dials and app rate, from one grouped pass over the filtered view
+# instead of one lead_totals query per rep. Most leads first.
+def rep_leaderboard(data, key):
+    dff = filtered_engagements(data, key)
+
+    with stage('groupby'):
+        return rep_totals(dff)
+
+# Total table: distinct leads, active leads dialed and leads with an app submitted,
+# total dials and the app rate in percent (0 with no leads).
+# Date ranges of at least APPROX_MIN_ROWS dials with no other filter are estimated
+# from the snapshot's lead sketches when it has them.
+def lead_totals(data, key):
+    start_date, end_date, class_code, sales_rep = key
+    sketches = data.lead_sketches
+
+    if (sketches is not None and class_code == 'ALL' and sales_rep == 'ALL'
+            and sketches.dials(start_date, end_date) >= APPROX_MIN_ROWS):
+        with stage('groupby'):
+            counts = sketches.estimate(start_date, end_date)
+
+        return totals_table(*counts, sketches.dials(start_date, end_date), relative_error=sketches.relative_error)
+
+    dff = filtered_engagements(data, key)
+
+    with stage('groupby'):
+        counts = count_distinct(dff['lead_id'].to_numpy(), [dff['is_active'].to_numpy() == 1,
+                                                            dff['app_submitted'].to_numpy() == 1])
+
+    return totals_table(*counts, len(dff))
+
+
+# The steps after filtering, shared with the streaming engine in chunked.py. `latest`
+# is each lead's last engagement within the filtered rows, `counts` the dials per
+# (dimension, lead_status) and `outcomes` the dial outcome sums per class code.
+
+def month_lead_totals(latest):
+    dff = latest.groupby('effective_month')[['is_lead', 'is_active', 'lost', 'app_submitted']].sum().reset_index()
+    dff['app_rate'] = format_app_rate(dff['app_submitted'], dff['is_lead'])
+
+    return dff
+
+def month_status_dial_rates(counts):
+    return add_app_rate(month_status_grid(counts, 'Dials'), 'effective_month', 'Dials')
+
+def month_status_lead_rates(latest):
+    return add_app_rate(month_status_counts(latest, 'Leads'), 'effective_month', 'Leads')
+
+# The dimension charts take counts with group totals, from add_group_dials
+def call_number_dials(counts, cutoff):
+    return apply_cutoff(counts, cutoff)
+
+def class_code_dials(counts, cutoff, top_n):
+    return top_groups_with_other(apply_cutoff(counts, cutoff), 'governing_class_code', top_n)
+
+def insurer_group_dials(counts, cutoff, top_n):
+    dff = apply_cutoff(counts, cutoff)
+    dff = dff[dff['current_coverage_insurers_group_name'].str.len() > 0]
+
+    return top_groups_with_other(dff, 'current_coverage_insurers_group_name', top_n)
+
+def class_code_outcomes(dff):
+    return dff.groupby('governing_class_code', observed=True)[CLASS_CODE_OUTCOMES].sum().reset_index()
+
+def class_code_table(outcomes, latest):
+    dff_leads = latest.groupby('governing_class_code', observed=True)[['is_lead', 'is_active', 'lost']].sum().reset_index()
+    dff_merged = dff_leads.merge(outcomes, how='left', on='governing_class_code')
+
+    return dff_merged.sort_values(by=['is_lead'], ascending=False, kind='mergesort')
+
+def rep_totals(dff):
+    reps = dff['updated_by']
+    codes = reps.cat.codes.to_numpy().astype(np.int64)
+    n_reps = len(reps.cat.categories)
+
+    leads, active_leads_dialed, leads_app_submitted = count_distinct_per_group(
+        codes, dff['lead_id'].to_numpy(), n_reps, [dff['is_active'].to_numpy() == 1, dff['app_submitted'].to_numpy() == 1])
+
+    return rep_table(reps.cat.categories, leads, active_leads_dialed, leads_app_submitted,
+                        np.bincount(codes[codes >= 0], minlength=n_reps))
+
+# Leaderboard rows from the distinct-lead counts and dials of each rep in `reps`,
+# most leads first (ties in the order of `reps`); reps without dials are left out
+def rep_table(reps, leads, active_leads_dialed, leads_app_submitted, dials):
+    table = pd.DataFrame({'updated_by': reps,
+                            'total_leads': leads,
+                            'active_leads_dialed': active_leads_dialed,
+                            'app_submitted': leads_app_submitted,
+                            'total_dials': dials})
+    table = table[table['total_dials'].to_numpy() > 0]
+    table['app_rate'] = [round(float(apps * 100)/float(leads), 2)
+                            for apps, leads in zip(table['app_submitted'], table['total_leads'])]
+
+    return table.sort_values(by=['total_leads'], ascending=False, kind='mergesort').reset_index(drop=True)
+
+# relative_error is the standard error of estimated lead counts, None when exact.
+# A selection with no leads has an app rate of 0.
+def totals_table(total_leads, active_leads_dialed, leads_app_submitted, total_dials, relative_error=None):
+    return {'total_leads': total_leads,
+            'active_leads_dialed': active_leads_dialed,
+            'app_submitted': leads_app_submitted,
+            'total_dials': total_dials,
+            'app_rate': round(float(leads_app_submitted * 100)/float(total_leads), 2) if total_leads else 0.0,
+            'relative_error': relative_error}
+
+# Every metric by name, for batch runs. The dials_by_* metrics also take a cutoff.
+METRICS = {'leads_by_month': leads_by_month,
+            'dials_by_month_status': dials_by_month_status,
+            'leads_by_month_status': leads_by_month_status,
+            'dials_by_call_number': dials_by_call_number,
+            'dials_by_class_code': dials_by_class_code,
+            'dials_by_insurer_group': dials_by_insurer_group,
+            'class_code_summary': class_code_summary,
+            'lead_totals': lead_totals,
+            'rep_leaderboard': rep_leaderboard}
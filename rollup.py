@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+from engagements import selected_values
+
+# Chart dimensions answered from a daily cube: Fig 1, Fig 3, Fig 4 and Fig 5
+CUBE_DIMENSIONS = ['effective_month', 'call_number', 'governing_class_code',
+                    'current_coverage_insurers_group_name']
+
+# Day number of rows with no activity_date; sorts before every real day
+NAT_DAY = np.iinfo(np.int32).min
+
+
+# Integer codes for a column (-1 for missing) and the values the codes stand for
+def encode_column(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.dtype
+
+    codes, uniques = pd.factorize(series, sort=True)
+    return codes, uniques
+
+# Index of the values behind the codes of encode_column
+def value_index(values):
+    return values.categories if isinstance(values, pd.CategoricalDtype) else values
+
+def decode_column(codes, values):
+    if isinstance(values, pd.CategoricalDtype):
+        return pd.Categorical.from_codes(codes, dtype=values)
+
+    return values.take(codes)
+
+# Boolean lookup by code of the values a filter selection matches, integer-coded
+# membership for single values and multi-selects alike. It has one extra False
+# slot at the end, so that the missing-value code -1 never matches.
+def code_membership(values, selection):
+    index = value_index(values)
+    codes = index.get_indexer(list(selected_values(selection)))
+
+    member = np.zeros(len(index) + 1, dtype=bool)
+    member[codes[codes >= 0]] = True
+    return member
+
+# Day numbers (days since 1970-01-01) of ISO date strings or datetimes
+def day_number(value):
+    return np.datetime64(value, 'D').astype(np.int64)
+
+# Day numbers of activity_date as int32, NAT_DAY for missing dates
+def activity_days(df):
+    days = df['activity_date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    days[df['activity_date'].isna().to_numpy()] = NAT_DAY
+
+    return days.astype(np.int32)
+
+# Range of a day-sorted array covering [start_date, end_date), relative to the array;
+# rows without an activity_date only match when no date bound is set
+def day_range(days, start_date, end_date):
+    lo, hi = 0, len(days)
+
+    if start_date is not None or end_date is not None:
+        lo = np.searchsorted(days, NAT_DAY, side='right')
+    if start_date is not None:
+        lo = np.searchsorted(days, day_number(start_date), side='left')
+    if end_date is not None:
+        hi = np.searchsorted(days, day_number(end_date), side='left')
+
+    return lo, max(lo, hi)
+
+
+# Dial counts pre-aggregated per activity day x sales rep x class code x chart
+# dimension x lead_status, sorted by day. A dashboard query binary-searches the
+# date range and sums the matching slice, so its cost scales with the number of
+# distinct days and categories rather than with the number of dials.
+class DailyCube:
+
+    def __init__(self, df, dimension):
+        self.dimension = dimension
+
+        days = activity_days(df)
+        rep_codes, self._reps = encode_column(df['updated_by'])
+        class_codes, self._class_codes = encode_column(df['governing_class_code'])
+        dim_codes, self._dim_values = encode_column(df[dimension])
+        status_codes, self._statuses = encode_column(df['lead_status'])
+
+        keys = pd.DataFrame({'day': days, 'rep': rep_codes, 'class_code': class_codes,
+                                'dim': dim_codes, 'status': status_codes})
+        table = keys.groupby(list(keys.columns), sort=True).size().reset_index(name='dials')
+
+        self.days = table['day'].to_numpy()
+        self.rep_codes = table['rep'].to_numpy()
+        self.class_codes = table['class_code'].to_numpy()
+        self.dim_codes = table['dim'].to_numpy()
+        self.status_codes = table['status'].to_numpy()
+        self.dials = table['dials'].to_numpy()
+        self.n_dims = len(value_index(self._dim_values))
+        self.n_statuses = len(value_index(self._statuses))
+
+    def __len__(self):
+        return len(self.days)
+
+    # Dials per (dimension, lead_status) for a filter key, equivalent to grouping the
+    # filtered raw rows by [dimension, 'lead_status'] with observed=True
+    def counts(self, key):
+        start_date, end_date, class_code, sales_rep = key
+        lo, hi = day_range(self.days, start_date, end_date)
+
+        mask = (self.dim_codes[lo:hi] >= 0) & (self.status_codes[lo:hi] >= 0)
+        if sales_rep != 'ALL':
+            mask &= code_membership(self._reps, sales_rep)[self.rep_codes[lo:hi]]
+        if class_code != 'ALL':
+            mask &= code_membership(self._class_codes, class_code)[self.class_codes[lo:hi]]
+
+        cells = self.dim_codes[lo:hi][mask] * self.n_statuses + self.status_codes[lo:hi][mask]
+        totals = np.bincount(cells, weights=self.dials[lo:hi][mask],
+                                minlength=self.n_dims * self.n_statuses).astype(np.int64)
+        observed = np.flatnonzero(totals)
+
+        return pd.DataFrame({self.dimension: decode_column(observed // self.n_statuses, self._dim_values),
+                                'lead_status': decode_column(observed % self.n_statuses, self._statuses),
+                                'Dials': totals[observed]})
@@ -0,0 +1,104 @@
+import numpy as np
+
+from engagements import selected_values
+from rollup import activity_days
+from rollup import code_membership
+from rollup import day_range
+from rollup import encode_column
+from rollup import value_index
+
+# Row positions of a categorical column grouped by value and date-sorted within each
+# value: the rows equal to a value are one contiguous slice of `positions`, and the
+# rows of a date range within it are found by binary search on `days`.
+class ColumnIndex:
+
+    def __init__(self, series, days, position_dtype):
+        self.codes, self._values = encode_column(series)
+        self.positions = np.lexsort((days, self.codes)).astype(position_dtype)
+        self.days = days[self.positions]
+        self.bounds = np.searchsorted(self.codes[self.positions], np.arange(len(value_index(self._values)) + 1))
+
+    # Code of a value, or -1 if it never occurs
+    def code(self, value):
+        return value_index(self._values).get_indexer([value])[0]
+
+    # Slice of positions/days holding the rows equal to value
+    def group(self, value):
+        code = self.code(value)
+        if code < 0:
+            return 0, 0
+
+        return self.bounds[code], self.bounds[code + 1]
+
+    # Slices of positions/days for each value of a filter selection
+    def groups(self, selection):
+        return [self.group(value) for value in selected_values(selection)]
+
+    # Boolean lookup by code of the rows a filter selection matches
+    def membership(self, selection):
+        return code_membership(self._values, selection)
+
+
+# Row-position indexes for the dashboard filters: all rows by activity_date, and
+# per sales rep and per class code. A filtered view is gathered from the positions
+# of the smallest matching date slice instead of scanning every column.
+class RowIndex:
+
+    def __init__(self, df):
+        position_dtype = np.int32 if len(df) < np.iinfo(np.int32).max else np.int64
+        days = activity_days(df)
+
+        self.positions = np.argsort(days, kind='stable').astype(position_dtype)
+        self.days = days[self.positions]
+        self.columns = {'updated_by': ColumnIndex(df['updated_by'], days, position_dtype),
+                        'governing_class_code': ColumnIndex(df['governing_class_code'], days, position_dtype)}
+
+    @property
+    def nbytes(self):
+        return self.positions.nbytes + self.days.nbytes + sum(
+            index.codes.nbytes + index.positions.nbytes + index.days.nbytes for index in self.columns.values())
+
+    # Whether a filter key selects every row
+    @staticmethod
+    def selects_all(key):
+        start_date, end_date, class_code, sales_rep = key
+
+        return start_date is None and end_date is None and class_code == 'ALL' and sales_rep == 'ALL'
+
+    # Sorted row positions matching a filter key, or None when the key selects every row
+    def select(self, key):
+        if self.selects_all(key):
+            return None
+
+        start_date, end_date, class_code, sales_rep = key
+        equal = [(column, value) for column, value in [('updated_by', sales_rep), ('governing_class_code', class_code)]
+                    if value != 'ALL']
+
+        # Date slices of the smallest equality match (one per selected value), or of all rows
+        source, slices, size = None, [(self.positions, self.days)], len(self.positions)
+        for column, value in equal:
+            index = self.columns[column]
+            groups = index.groups(value)
+            if source is None or sum(hi - lo for lo, hi in groups) < size:
+                source, size = column, sum(hi - lo for lo, hi in groups)
+                slices = [(index.positions[lo:hi], index.days[lo:hi]) for lo, hi in groups]
+
+        parts = []
+        for positions, days in slices:
+            lo, hi = day_range(days, start_date, end_date)
+            parts.append(positions[lo:hi])
+        positions = parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+        # Any other equality filter is checked on the gathered codes only
+        for column, value in equal:
+            if column != source:
+                index = self.columns[column]
+                positions = positions[index.membership(value)[index.codes[positions]]]
+
+        return np.sort(positions)
+
+    # Filtered view in frame order, equivalent to engagements.filter_engagements
+    def filter(self, df, key):
+        positions = self.select(key)
+
+        return df if positions is None else df.take(positions)
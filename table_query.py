@@ -0,0 +1,145 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Server-side versions of the DataTable's native filtering, sorting and paging, for
+# tables with filter_action, sort_action and page_action set to 'custom'
+
+# One clause of a filter_query, e.g. {is_lead} >= 10 or {governing_class_code} scontains 88.
+# Operators may carry the table's s (case-sensitive) or i (case-insensitive) prefix.
+FILTER_CLAUSE = re.compile(r'^\s*\{(?P<column>[^}]+)\}\s*(?P<case>[si]?)'
+                            r'(?P<operator>>=|<=|!=|=|<|>|eq|ne|lt|le|gt|ge|contains|datestartswith)'
+                            r'(?:\s+|(?<=[=<>])\s*)(?P<value>.*?)\s*$')
+
+OPERATOR_ALIASES = {'eq': '=', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>='}
+
+# A unary clause, e.g. {governing_class_code} is blank or {is_lead} is even
+UNARY_CLAUSE = re.compile(r'^\s*\{(?P<column>[^}]+)\}\s+is\s+'
+                            r'(?P<check>blank|nil|bool|num|str|object|even|odd|prime)\s*$')
+
+def unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'`':
+        return value[1:-1]
+    return value
+
+# (column, operator, case, value) for each clause of a filter_query joined with &&.
+# A unary clause has the operator 'is <check>' and no value; a clause the parser does
+# not understand comes back as (None, None, '', clause).
+def parse_filter_query(filter_query):
+    clauses = []
+
+    for part in (filter_query or '').split(' && '):
+        if not part.strip():
+            continue
+        match = UNARY_CLAUSE.match(part)
+        if match is not None:
+            clauses.append((match.group('column'), 'is ' + match.group('check'), '', None))
+            continue
+        match = FILTER_CLAUSE.match(part)
+        if match is None:
+            clauses.append((None, None, '', part))
+            continue
+        operator = OPERATOR_ALIASES.get(match.group('operator'), match.group('operator'))
+        clauses.append((match.group('column'), operator, match.group('case'), unquote(match.group('value'))))
+
+    return clauses
+
+def is_prime(number):
+    if number < 2 or number != int(number):
+        return False
+    return all(number % divisor for divisor in range(2, int(number ** 0.5) + 1))
+
+# Rows of a column passing a unary check, with the meaning the DataTable gives it:
+# nil is a missing value, blank also an empty string, num/str/bool the value's type
+# and even/odd/prime only hold for numbers. Table cells are never objects.
+def unary_matches(series, check):
+    values = series.astype(object)
+    if check == 'nil':
+        return series.isna()
+    if check == 'blank':
+        return series.isna() | (values == '')
+    if check == 'bool':
+        return values.map(lambda v: isinstance(v, (bool, np.bool_)))
+    if check == 'str':
+        return values.map(lambda v: isinstance(v, str))
+    if check == 'object':
+        return pd.Series(False, index=series.index)
+
+    numbers = values.map(lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, (bool, np.bool_))
+                            and not pd.isna(v))
+    if check == 'num':
+        return numbers
+
+    number = values.where(numbers, 0).astype(float)
+    if check == 'even':
+        return numbers & (number % 2 == 0)
+    if check == 'odd':
+        return numbers & (number % 2 == 1)
+    return numbers & number.map(is_prime)
+
+# Rows of df matching a DataTable filter_query, compared numerically on numeric
+# columns and as strings otherwise. A clause the parser does not understand matches
+# no rows, so an active filter never shows unfiltered rows.
+def apply_filter_query(df, filter_query):
+    mask = np.ones(len(df), dtype=bool)
+
+    for column, operator, case, value in parse_filter_query(filter_query):
+        if operator is None:
+            mask[:] = False
+            continue
+        if column not in df.columns:
+            continue
+
+        series = df[column]
+        if operator.startswith('is '):
+            mask &= unary_matches(series, operator[3:]).to_numpy(dtype=bool)
+            continue
+        if pd.api.types.is_numeric_dtype(series) and operator not in ('contains', 'datestartswith'):
+            value = pd.to_numeric(value, errors='coerce')
+            if np.isnan(value):
+                mask[:] = False
+                continue
+        else:
+            series = series.astype(str)
+            if case == 'i':
+                series, value = series.str.lower(), value.lower()
+
+        if operator == 'contains':
+            matched = series.str.contains(value, regex=False)
+        elif operator == 'datestartswith':
+            matched = series.str.startswith(value)
+        elif operator == '=':
+            matched = series == value
+        elif operator == '!=':
+            matched = series != value
+        elif operator == '<':
+            matched = series < value
+        elif operator == '<=':
+            matched = series <= value
+        elif operator == '>':
+            matched = series > value
+        else:
+            matched = series >= value
+
+        mask &= matched.fillna(False).to_numpy(dtype=bool)
+
+    return df[mask]
+
+# Rows of df ordered by a DataTable sort_by list, keeping the current order on ties
+def apply_sort_by(df, sort_by):
+    sort_by = [column for column in (sort_by or []) if column['column_id'] in df.columns]
+    if not sort_by:
+        return df
+
+    return df.sort_values(by=[column['column_id'] for column in sort_by],
+                            ascending=[column['direction'] == 'asc' for column in sort_by],
+                            kind='mergesort')
+
+# The page_current page of df and the number of pages, clamping page_current to
+# the last page
+def page_rows(df, page_current, page_size):
+    page_count = max(-(-len(df) // page_size), 1)
+    page_current = min(max(page_current or 0, 0), page_count - 1)
+
+    return df.iloc[page_current * page_size:(page_current + 1) * page_size], page_count
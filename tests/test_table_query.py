@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from table_query import apply_filter_query
+from table_query import page_rows
+from table_query import parse_filter_query
+
+
+@pytest.fixture
+def table():
+    return pd.DataFrame({'governing_class_code': pd.Categorical(['0042', '1024', '1048', '', '8810']),
+                            'is_lead': [10, 3, 7, 0, 2],
+                            'rate': [1.5, np.nan, 2.0, 0.0, 4.0]})
+
+
+def test_parse_binary_clauses():
+    assert parse_filter_query('{is_lead} >= 10 && {governing_class_code} icontains "10"') == [
+        ('is_lead', '>=', '', '10'), ('governing_class_code', 'contains', 'i', '10')]
+
+def test_parse_operator_aliases_and_quotes():
+    assert parse_filter_query("{is_lead} ge 3 && {governing_class_code} eq '1024'") == [
+        ('is_lead', '>=', '', '3'), ('governing_class_code', '=', '', '1024')]
+
+def test_parse_unary_clauses():
+    assert parse_filter_query('{rate} is nil && {is_lead} is even') == [
+        ('rate', 'is nil', '', None), ('is_lead', 'is even', '', None)]
+
+def test_parse_empty_query():
+    assert parse_filter_query('') == []
+    assert parse_filter_query(None) == []
+
+def test_parse_unknown_clause():
+    assert parse_filter_query('{is_lead} is positive') == [(None, None, '', '{is_lead} is positive')]
+
+
+def test_numeric_comparison(table):
+    assert apply_filter_query(table, '{is_lead} > 2')['is_lead'].tolist() == [10, 3, 7]
+    assert apply_filter_query(table, '{is_lead} = 7')['is_lead'].tolist() == [7]
+
+def test_non_numeric_value_on_numeric_column(table):
+    assert apply_filter_query(table, '{is_lead} > abc').empty
+
+def test_string_contains_is_case_sensitive_by_default():
+    df = pd.DataFrame({'name': ['Alpha', 'alpha', 'Beta']})
+    assert apply_filter_query(df, '{name} contains al')['name'].tolist() == ['alpha']
+    assert apply_filter_query(df, '{name} icontains al')['name'].tolist() == ['Alpha', 'alpha']
+
+def test_clauses_are_combined(table):
+    result = apply_filter_query(table, '{is_lead} >= 3 && {governing_class_code} contains 10')
+    assert result['governing_class_code'].tolist() == ['1024', '1048']
+
+def test_unary_checks(table):
+    assert apply_filter_query(table, '{rate} is nil')['is_lead'].tolist() == [3]
+    assert apply_filter_query(table, '{governing_class_code} is blank')['is_lead'].tolist() == [0]
+    assert apply_filter_query(table, '{rate} is blank')['is_lead'].tolist() == [3]
+    assert apply_filter_query(table, '{rate} is num')['is_lead'].tolist() == [10, 7, 0, 2]
+    assert apply_filter_query(table, '{is_lead} is even')['is_lead'].tolist() == [10, 0, 2]
+    assert apply_filter_query(table, '{is_lead} is odd')['is_lead'].tolist() == [3, 7]
+    assert apply_filter_query(table, '{is_lead} is prime')['is_lead'].tolist() == [3, 7, 2]
+    assert apply_filter_query(table, '{governing_class_code} is str')['is_lead'].tolist() == [10, 3, 7, 0, 2]
+    assert apply_filter_query(table, '{governing_class_code} is num').empty
+    assert apply_filter_query(table, '{is_lead} is object').empty
+
+def test_unknown_clause_matches_nothing(table):
+    assert apply_filter_query(table, '{is_lead} > 2 && {is_lead} is positive').empty
+
+def test_empty_query_keeps_every_row(table):
+    assert apply_filter_query(table, '').equals(table)
+
+
+def test_page_rows():
+    df = pd.DataFrame({'x': range(25)})
+    page, page_count = page_rows(df, 1, 10)
+    assert page['x'].tolist() == list(range(10, 20))
+    assert page_count == 3
+
+def test_page_rows_clamps_the_page():
+    df = pd.DataFrame({'x': range(25)})
+    assert page_rows(df, 7, 10)[0]['x'].tolist() == list(range(20, 25))
+    assert page_rows(df, -1, 10)[0]['x'].tolist() == list(range(10))
+    assert page_rows(df, None, 10)[0]['x'].tolist() == list(range(10))
+
+def test_page_rows_of_an_empty_frame():
+    page, page_count = page_rows(pd.DataFrame({'x': []}), 3, 10)
+    assert page.empty
+    assert page_count == 1
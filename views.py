@@ -0,0 +1,297 @@
+import logging
+import os
+
+import pandas as pd
+
+from aggregates import OTHER_GROUP
+from executor import QueryCancelled
+from executor import run_metric
+from figures import column_bar_figure
+from figures import status_bar_figure
+from instrumentation import stage
+from table_query import apply_filter_query
+from table_query import apply_sort_by
+from table_query import page_rows
+
+logger = logging.getLogger(__name__)
+
+# Figures and tables for the Dash callbacks, built from the query_engine aggregates
+
+CLASS_CODE_TABLE_COLUMNS = [{'name': 'Class Code', 'id': 'governing_class_code'},
+                            {'name': 'Total', 'id': 'is_lead'},
+                            {'name': 'Active', 'id': 'is_active'},
+                            {'name': 'Lost', 'id': 'lost'},
+                            {'name': 'Connected', 'id': 'call_connected'},
+                            {'name': 'DM Reached', 'id': 'dm_reached'},
+                            {'name': 'App Started', 'id': 'app_started'},
+                            {'name': 'App Submitted', 'id': 'app_submitted'}]
+
+REP_LEADERBOARD_COLUMNS = [{'name': 'Sales Rep', 'id': 'sales_rep'},
+                            {'name': 'Leads', 'id': 'total_leads'},
+                            {'name': 'Active Leads Dialed', 'id': 'active_leads_dialed'},
+                            {'name': 'Dials', 'id': 'total_dials'},
+                            {'name': 'App Submitted', 'id': 'app_submitted'},
+                            {'name': 'App Rate (%)', 'id': 'app_rate'}]
+
+# Largest groups kept in Fig 4 and Fig 5, the rest summed into an 'Other' bar;
+# 0 keeps every group
+FIGURE_TOP_N = int(os.environ.get('FIGURE_TOP_N', 0))
+
+# Raised by a builder that failed, with the empty output to show in its place. The
+# output is not memoised, so the next request for the same view builds it again.
+class BuildFailed(Exception):
+
+    def __init__(self, output):
+        super().__init__()
+        self.output = output
+
+# Horizontal bar axis ordered by total; forced to a category axis once an 'Other' bar
+# is mixed in with numeric-looking class codes
+def category_axis(counts, group_by):
+    axis = {'categoryorder': 'total ascending'}
+    if (counts[group_by] == OTHER_GROUP).any():
+        axis['type'] = 'category'
+    return axis
+
+def build_fig0(data, key):
+    try:
+        dff = run_metric('leads_by_month', data, key)
+
+        with stage('figure'):
+            fig0 = column_bar_figure(dff, "effective_month", ["is_lead", "is_active", "app_submitted", "lost"],
+                                        {'is_lead': 'Leads',
+                                        'is_active': 'Active',
+                                        'app_submitted': 'App Submitted',
+                                        'lost': 'Lost'},
+                                        title='Fig 0 - Number Leads by Effective Month', template="plotly")
+
+            fig0.update_layout(
+                yaxis_title="Leads",
+                xaxis_title="Effective Month",
+                xaxis = dict(
+                    tickmode = 'linear'
+                ),
+                legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+                )
+            )
+    except QueryCancelled:
+        raise
+    except Exception:
+        logger.exception('Fig 0 failed')
+        raise BuildFailed({})
+
+    return fig0
+
+def build_fig1(data, key):
+    try:
+        dff_fig1 = run_metric('dials_by_month_status', data, key)
+
+        with stage('figure'):
+            fig1 = status_bar_figure(dff_fig1, "effective_month", "Dials",
+                                        title='Fig 1 - Number Dials by Effective Month', template="seaborn")
+
+            fig1.update_layout(
+                xaxis_title="Effective Month",
+                xaxis = dict(
+                    tickmode = 'linear'
+                ),
+            )
+    except QueryCancelled:
+        raise
+    except Exception:
+        logger.exception('Fig 1 failed')
+        raise BuildFailed({})
+
+    return fig1
+
+def build_fig2(data, key):
+    try:
+        dff_fig2 = run_metric('leads_by_month_status', data, key)
+
+        with stage('figure'):
+            fig2 = status_bar_figure(dff_fig2, "effective_month", "Leads",
+                                        title='Fig 2 - Number Leads by Effective Month', template="plotly")
+
+            fig2.update_layout(
+                xaxis_title="Effective Month",
+                xaxis = dict(
+                    tickmode = 'linear'
+                ),
+                legend=dict(
+                    orientation="h",
+                    yanchor="bottom",
+                    y=-0.35,
+                    xanchor="right",
+                    x=1.0
+                )
+            )
+    except QueryCancelled:
+        raise
+    except Exception:
+        logger.exception('Fig 2 failed')
+        raise BuildFailed({})
+
+    return fig2
+
+def build_fig3(data, key, cutoff):
+    try:
+        dff_fig3 = run_metric('dials_by_call_number', data, key, cutoff)
+
+        with stage('figure'):
+            fig3 = status_bar_figure(dff_fig3, "call_number", "Dials",
+                                        title='Fig 3 - Number Dials by Call Number', template="simple_white")
+            fig3.update_layout(xaxis={"tickmode":"linear", 'categoryorder':'category ascending'},
+                                xaxis_title="Call Number")
+    except QueryCancelled:
+        raise
+    except Exception:
+        logger.exception('Fig 3 failed')
+        raise BuildFailed({})
+
+    return fig3
+
+def build_fig4(data, key, cutoff):
+    try:
+        dff_fig4 = run_metric('dials_by_class_code', data, key, cutoff, FIGURE_TOP_N)
+        with stage('figure'):
+            fig4 = status_bar_figure(dff_fig4, "governing_class_code", "Dials", orientation='h',
+                                        title='Fig 4 - Number Dials by Governing Class Code', template="ggplot2")
+            fig4.update_layout(yaxis=category_axis(dff_fig4, "governing_class_code"),
+                                xaxis_title="Dials",
+                                yaxis_title="Class Code")
+    except QueryCancelled:
+        raise
+    except Exception:
+        logger.exception('Fig 4 failed')
+        raise BuildFailed({})
+
+    return fig4
+
+def build_fig5(data, key, cutoff):
+    try:
+        dff_fig5 = run_metric('dials_by_insurer_group', data, key, cutoff, FIGURE_TOP_N)
+
+        #dff_fig5['test'] = dff_fig5.apply(lambda x: x.Dials + 1, axis=1)
+
+        with stage('figure'):
+            fig5 = status_bar_figure(dff_fig5, "current_coverage_insurers_group_name", "Dials", orientation='h',
+                                        title='Fig 5 - Number Dials by Insurer\'s Group Name', template="plotly_white")
+            #fig5.update_traces(texttemplate='%{text:.2s}', textposition='outside')
+            fig5.update_layout(yaxis=dict(category_axis(dff_fig5, "current_coverage_insurers_group_name"), tickmode="linear"),
+                                        uniformtext_minsize=8, uniformtext_mode='hide',
+                                        xaxis_title="Dials",
+                                        yaxis_title="Insurance Group Name")
+    except QueryCancelled:
+        raise
+    except Exception:
+        logger.exception('Fig 5 failed')
+        raise BuildFailed({})
+
+    return fig5
+
+# Charts whose cutoff slider is applied in the browser (assets/cutoff.js): figure
+# builder, metric, and the category column of their bars
+CUTOFF_FIGURES = {'fig3': (build_fig3, 'dials_by_call_number', 'call_number'),
+                    'fig4': (build_fig4, 'dials_by_class_code', 'governing_class_code'),
+                    'fig5': (build_fig5, 'dials_by_insurer_group', 'current_coverage_insurers_group_name')}
+
+# A cutoff chart at cutoff 0 with what the browser needs to apply any other cutoff:
+# the group total of each bar, trace by trace, and when FIGURE_TOP_N sums groups into
+# an 'Other' bar, the per-status dials and group totals of the groups summed into it
+def build_cutoff_store(data, key, name):
+    build, metric, category = CUTOFF_FIGURES[name]
+    try:
+        store = {'figure': build(data, key, 0), 'group_dials': [], 'other': None}
+    except BuildFailed:
+        raise BuildFailed({'figure': {}, 'group_dials': [], 'other': None})
+
+    try:
+        top_n = [] if metric == 'dials_by_call_number' else [FIGURE_TOP_N]
+        shown = run_metric(metric, data, key, 0, *top_n)
+        statuses = shown['lead_status'].to_numpy()
+        store['group_dials'] = [shown['group_dials'].to_numpy()[statuses == status].tolist()
+                                for status in pd.unique(statuses)]
+
+        if top_n and (shown[category] == OTHER_GROUP).any():
+            counts = run_metric(metric, data, key, 0, 0)
+            rest = counts[~counts[category].isin(shown[category])]
+            store['other'] = {'label': OTHER_GROUP,
+                                'lead_status': rest['lead_status'].astype(str).tolist(),
+                                'dials': rest['Dials'].tolist(),
+                                'group_dials': rest['group_dials'].tolist()}
+    except QueryCancelled:
+        raise
+    except Exception:
+        logger.exception('Cutoff store for %s failed', name)
+        raise BuildFailed({'figure': {}, 'group_dials': [], 'other': None})
+
+    return store
+
+# One page of the governing class code table after its filter_query and sort_by,
+# with the columns and the page count
+def build_class_code_table(data, key, page_current=0, page_size=10, filter_query='', sort_by=None):
+    try:
+        dff = apply_sort_by(apply_filter_query(run_metric('class_code_summary', data, key), filter_query), sort_by)
+        dff, page_count = page_rows(dff, page_current, page_size)
+        records = dff.to_dict(orient='records')
+    except QueryCancelled:
+        raise
+    except Exception:
+        logger.exception('Class code table failed')
+        raise BuildFailed(([], CLASS_CODE_TABLE_COLUMNS, 1))
+
+    return records, CLASS_CODE_TABLE_COLUMNS, page_count
+
+def build_total_table(data, key):
+    try:
+        totals = run_metric('lead_totals', data, key)
+
+        # Estimated counts are marked with their relative standard error
+        estimated = lambda value: value
+        if totals['relative_error'] is not None:
+            bound = ' (±{:.1%})'.format(totals['relative_error'])
+            estimated = lambda value: '≈' + value + bound
+
+        data_dict = [{'total_leads':estimated(str(totals['total_leads'])),
+                    'active_leads_dialed':estimated(str(totals['active_leads_dialed'])),
+                    'app_submitted':estimated(str(totals['app_submitted'])),
+                    'total_dials':str(totals['total_dials']),
+                    'app_rate':estimated(str(totals['app_rate']) + '%')}]
+    except QueryCancelled:
+        raise
+    except Exception:
+        logger.exception('Total table failed')
+        raise BuildFailed([{'total_leads':str(0),
+                            'active_leads_dialed':str(0),
+                            'active_leads_not_dialed':str(0),
+                            'app_submitted':str(0)}])
+
+    return data_dict
+
+# One row per sales rep with dials under the filters, named from the SDR sheet
+# (reps missing from it keep their hash), most leads first. Values stay numeric so
+# the table can sort them in the browser.
+def build_rep_leaderboard(data, key):
+    try:
+        dff = run_metric('rep_leaderboard', data, key)
+        names = {option['value']: option['label'] for option in data.sdr_options}
+
+        records = [{'sales_rep': names.get(row['updated_by'], row['updated_by']),
+                    'total_leads': row['total_leads'],
+                    'active_leads_dialed': row['active_leads_dialed'],
+                    'total_dials': row['total_dials'],
+                    'app_submitted': row['app_submitted'],
+                    'app_rate': row['app_rate']}
+                    for row in dff.to_dict(orient='records')]
+    except QueryCancelled:
+        raise
+    except Exception:
+        logger.exception('Rep leaderboard failed')
+        raise BuildFailed([])
+
+    return records